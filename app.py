@@ -1,19 +1,41 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
+import os
 import sys
 import json
 import dateutil.parser
-import babel
-import datetime
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import itertools
+import hashlib
+import click
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate 
+from flask.cli import AppGroup
+from flask.json import JSONEncoder
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, TSRANGE, ExcludeConstraint, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from pagination import paginate
+from search import PostgresSearch, SQLiteSearch, search_document
+from cache import ResponseCache, LRUBackend, RedisBackend, FragmentCache, FragmentCacheExtension, backend_from_config
+from formatting import DateTimeFormatter
+from export import csv_chunks, ndjson_chunks
+from routing import RoutingSQLAlchemy, ReplicaPool, ReadRouting, READ_PRIMARY
+from instrumentation import RequestStats
+from metrics import Metrics
+from partitions import create_partitions, archive_partitions, add_months, month_start
+from geo import geohash, covering_cells, in_cells, distance_sql, read_geocodes, GEOCODES_FILE
+from facets import GenreFacets, filter_genres, MATCHES
+from suggest import SuggestIndex
+from assets import Assets, BUNDLES, ENCODINGS
+from compression import CompressionMiddleware
+from jobs import PostgresQueue, SQLiteQueue, ImmediateQueue, run_workers
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,8 +43,28 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
+replicas = ReplicaPool.from_uris(app.config['SQLALCHEMY_REPLICA_URIS'], app.config['REPLICA_CHECK_INTERVAL'])
+read_routing = ReadRouting(app, replicas, app.config['READ_YOUR_WRITES_WINDOW'])
+if not app.secret_key:
+  # only flashed messages in the session then, which one process alone can do with
+  app.secret_key = os.urandom(32)
+metrics = Metrics(app, dict({'primary': db.engine}, **{f'replica{i}': engine for i, engine in enumerate(replicas.engines)}))
 migrate = Migrate(app,db)
+page_cache = ResponseCache(backend_from_config(app.config), read_routing.read_primary)
+request_stats = RequestStats(app, app.config['SQL_STATS_REQUESTS'], app.config['SQL_REPEAT_THRESHOLD'],
+                             app.config['SQL_REPEAT_RAISE'])
+app.wsgi_app = CompressionMiddleware(app.wsgi_app, app.config['COMPRESSION_LEVEL'],
+                                     app.config['COMPRESSION_BROTLI_QUALITY'], app.config['COMPRESSION_MIN_SIZE'])
+
+class APIJSONEncoder(JSONEncoder):
+    # ISO 8601 datetimes in JSON responses, instead of Flask's HTTP dates
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return JSONEncoder.default(self, o)
+
+app.json_encoder = APIJSONEncoder
 
 
 # TODO: connect to a local postgresql database
@@ -45,8 +87,30 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # name, city/state and genres, maintained by a trigger (see search.py)
+    search_vector = db.deferred(db.Column(TSVECTOR))
+    # last change to the row in UTC, the API's Last-Modified / ETag source
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() AT TIME ZONE 'utc')"))
+    # set together by locate(), the geohash indexing the point (see geo.py)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12, collation='C'))
     shows = db.relationship('Show',backref='Venue',lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_venue_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # the /venues sort key (AREA_KEY)
+        db.Index('ix_venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+        # the cells searched by /venues/nearby
+        db.Index('ix_venue_geohash', 'geohash'),
+        # the ?genre= filters, @> and && (see facets.py)
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+    )
+
     def __repr__(self):
         return f'<Venue {self.id} {self.name} {self.city} {self.state} {self.address}{self.phone}{self.image_link}{self.facebook_link}{self.shows}{self.seeking_talent}{self.seeking_description}>'
 
@@ -66,51 +130,699 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # name, city/state and genres, maintained by a trigger (see search.py)
+    search_vector = db.deferred(db.Column(TSVECTOR))
+    # last change to the row in UTC, the API's Last-Modified / ETag source
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() AT TIME ZONE 'utc')"))
     shows = db.relationship('Show',backref='Artist',lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_artist_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # the /artists sort key
+        db.Index('ix_artist_name_id', 'name', 'id'),
+        # the ?genre= filters, @> and && (see facets.py)
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    )
+
     def __repr__(self):
         return f'<Artist {self.id} {self.name} {self.city} {self.state} {self.phone}{self.genres}{self.shows}{self.facebook_link}{self.image_link} {self.seeking_venue}{self.seeking_description}>'
 
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
+def default_end_time(context):
+  # a show listed without an end time runs SHOW_DEFAULT_DURATION minutes
+  return context.get_current_parameters()['start_time'] + timedelta(minutes=app.config['SHOW_DEFAULT_DURATION'])
+
 class Show(db.Model):
+  # range-partitioned by month on start_time, so the table's primary key has
+  # to include it; rows are still identified by id alone (see partitions.py)
   __tablename__ = 'shows'
-  id = db.Column(db.Integer, primary_key=True)
+  id = db.Column(db.Integer, primary_key=True, autoincrement=True)
   venue_id = db.Column(db.Integer , db.ForeignKey(Venue.id), nullable=False)
   artist_id = db.Column(db.Integer , db.ForeignKey(Artist.id) , nullable=False)
-  start_time = db.Column(db.DateTime, nullable=False)
-  def upcoming_shows_query():
-    upcoming_shows_query = Show.query.filter(Show.venue_id ==   Venue.id).filter(Show.start_time > datetime.now()).all()
-    return upcoming_shows_query
-    
-  def past_shows_query():
-    past_shows_query = Show.query.filter(Show.venue_id == Venue.id).filter(Show.start_time < datetime.now()).all()
-    return past_shows_query
-
+  start_time = db.Column(db.DateTime, nullable=False, primary_key=True)
+  end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+  # which of the venue/artist counters this show is currently counted in,
+  # flipped to False by `flask fyyur roll-shows` once start_time has passed
+  counted_as_upcoming = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                         server_default=db.text("(now() AT TIME ZONE 'utc')"))
+
+  __table_args__ = (
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    # the /shows sort key (SHOW_KEY)
+    db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    # what roll_show_counts scans
+    db.Index('ix_shows_upcoming_start_time', 'start_time', postgresql_where=db.text('counted_as_upcoming')),
+    db.CheckConstraint('end_time > start_time', name='ck_show_end_after_start'),
+    {'postgresql_partition_by': 'RANGE (start_time)'},
+  )
+  __mapper_args__ = {'primary_key': [id]}
 
   def __repr__(self):
         return f'<Show {self.id} {self.venue_id} {self.artist_id} {self.start_time} >'
 
+# the catch-all partition, for databases made by create_all rather than the migrations
+db.event.listen(Show.__table__, 'after_create', db.DDL('CREATE TABLE shows_default PARTITION OF shows DEFAULT'))
+
+# the partitions of long past months, moved out of shows by `flask fyyur archive-shows`
+shows_archive = db.Table('shows_archive', db.Model.metadata,
+  *[column.copy() for column in Show.__table__.columns],
+  db.Index('ix_shows_archive_venue_id_start_time', 'venue_id', 'start_time'),
+  db.Index('ix_shows_archive_artist_id_start_time', 'artist_id', 'start_time'),
+  db.Index('ix_shows_archive_start_time_id', 'start_time', 'id'),
+  db.CheckConstraint('end_time > start_time', name='ck_show_end_after_start'),
+  postgresql_partition_by='RANGE (start_time)')
+
+class Booking(db.Model):
+  # the time slot of every show, live or archived, which the exclusion
+  # constraints keep from overlapping another at the same venue or with the
+  # same artist; their GiST indexes also answer booking_conflict and
+  # free_slots. Postgres can't put these constraints on the partitioned
+  # shows, so a trigger there keeps this table in step (see the migration).
+  __tablename__ = 'bookings'
+  show_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey(Venue.id), nullable=False)
+  artist_id = db.Column(db.Integer, db.ForeignKey(Artist.id), nullable=False)
+  during = db.Column(TSRANGE, nullable=False)
+
+  __table_args__ = (
+    ExcludeConstraint(('venue_id', '='), ('during', '&&'), using='gist', name='bookings_venue_overlap'),
+    ExcludeConstraint(('artist_id', '='), ('during', '&&'), using='gist', name='bookings_artist_overlap'),
+  )
+
+  def __repr__(self):
+        return f'<Booking {self.show_id} {self.venue_id} {self.artist_id} {self.during} >'
+
+class Geocode(db.Model):
+  # the centre of a city, where venues without coordinates of their own are
+  # placed; loaded from a local file by `flask fyyur load-geocodes`
+  __tablename__ = 'geocodes'
+  city = db.Column(db.String(120), primary_key=True)
+  state = db.Column(db.String(120), primary_key=True)
+  latitude = db.Column(db.Float, nullable=False)
+  longitude = db.Column(db.Float, nullable=False)
+
+  def __repr__(self):
+        return f'<Geocode {self.city} {self.state} {self.latitude} {self.longitude} >'
+
+class Job(db.Model):
+  # work left by the write handlers for `flask fyyur worker` (see jobs.py);
+  # run_at is when a queued job is due, or when a running one's lease ends
+  __tablename__ = 'jobs'
+  id = db.Column(db.BigInteger, primary_key=True)
+  kind = db.Column(db.String(64), nullable=False)
+  payload = db.Column(JSONB, nullable=False)
+  status = db.Column(db.String(10), nullable=False, default='queued')
+  attempts = db.Column(db.Integer, nullable=False, default=0)
+  run_at = db.Column(db.DateTime, nullable=False)
+  created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  last_error = db.Column(db.Text)
+
+  __table_args__ = (
+    # what workers claim from; finished jobs are deleted, dead ones left out
+    db.Index('ix_jobs_due', 'run_at', 'id', postgresql_where=db.text("status IN ('queued', 'running')")),
+  )
+
+  def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status} {self.attempts} >'
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+if app.config['SEARCH_BACKEND'] == 'sqlite':
+  search_engine = SQLiteSearch(app.config['SEARCH_SQLITE_PATH'])
+else:
+  search_engine = PostgresSearch(db.session, {'venue': Venue, 'artist': Artist})
+
+genre_facets = GenreFacets(db.session, app.config['GENRE_FACETS_TTL'])
+
+def search_results(model, kind, search_term, cursor=None, limit=30, genres=(), match='all'):
+  # one page of ranked search hits, returned as (rows, page, total) where rows
+  # carry id, name and upcoming_shows_count in rank order
+  page, total = search_engine.search(kind, search_term, cursor, limit, genres, match)
+  ids = [hit.id for hit in page]
+  rows = search_rows_query(model, ids).all() if ids else []
+  return in_rank_order(rows, ids), page, total
+
+def search_rows_query(model, ids):
+  return db.session.query(model.id, model.name, model.upcoming_shows_count).filter(model.id.in_(ids))
+
+def in_rank_order(rows, ids):
+  rows = {row.id: row for row in rows}
+  return [rows[id] for id in ids if id in rows]
+
+def search_data(rows, total):
+  return {
+    "count": total,
+    "data": [{
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.upcoming_shows_count
+    } for row in rows]
+  }
+
+#  Suggestions
+#  ----------------------------------------------------------------
+#  The show form's artist and venue pickers look names up in memory (see
+#  suggest.py). Each worker reads every name when it starts and every
+#  SUGGEST_REFRESH_INTERVAL seconds; its write handlers update it in between.
+
+def suggestion_names(kind):
+  # (id, name) of every venue or artist, for a build of the index on its own thread
+  model = {'venue': Venue, 'artist': Artist}[kind]
+  with app.app_context():
+    yield from db.session.query(model.id, model.name).yield_per(app.config['EXPORT_BATCH_SIZE'])
+
+suggestions = SuggestIndex(suggestion_names, app.config['SUGGEST_REFRESH_INTERVAL'])
+
+#  The listing and detail data below is built in two halves, a query and
+#  the shaping of its rows, so the async read path (asgi.py) runs the very
+#  same queries on its own driver.
+
+AREA_KEY = (Venue.state, Venue.city, Venue.name, Venue.id)
+SHOW_KEY = (Show.start_time, Show.id)
+
+def venue_areas(cursor=None, limit=30, genres=(), match='all'):
+  # builds one page of the city/state -> venues tree for /venues in a single
+  # query, reading the denormalized upcoming show counter of each venue
+  page = paginate(venue_areas_query(genres, match), AREA_KEY, cursor, limit)
+  return group_areas(page), page
+
+def venue_areas_query(genres=(), match='all'):
+  query = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count, Venue.updated_at)
+  return filter_genres(query, Venue.genres, genres, match)
+
+def group_areas(page):
+  areas = []
+  for (city, state), venues in itertools.groupby(page, key=lambda row: (row.city, row.state)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.upcoming_shows_count,
+        "updated_at": venue.updated_at
+      } for venue in venues]
+    })
+  return areas
+
+def all_shows():
+  # shows plus the archived ones, for reads that cover past shows
+  return db.union_all(db.select([Show.__table__]), db.select([shows_archive])).alias('all_shows')
+
+def partitioned_shows_query(owner_key, owner_id, counterpart, now=None, past_limit=None):
+  # the shows of one venue or artist (owner_key 'venue_id' or 'artist_id'),
+  # archived ones included, joined to the other side (counterpart) in a
+  # single query, split into upcoming and past in SQL against one captured
+  # now; past shows are capped at the newest past_limit rows, while the
+  # counts always cover every show
+  now = now or datetime.now()
+  shows = all_shows()
+  counterpart_key = 'artist_id' if owner_key == 'venue_id' else 'venue_id'
+  upcoming = shows.c.start_time > now
+  rows = db.session.query(
+      shows.c.start_time,
+      shows.c[counterpart_key].label('counterpart_id'),
+      upcoming.label('upcoming'),
+      db.func.row_number().over(partition_by=upcoming, order_by=shows.c.start_time.desc()).label('position'),
+      db.func.count(shows.c.id).over(partition_by=upcoming).label('total')
+    ).filter(shows.c[owner_key] == owner_id
+    ).subquery()
+
+  # the counterpart is joined to the listed rows only
+  query = db.session.query(
+      rows.c.start_time, counterpart.id, counterpart.name, counterpart.image_link,
+      rows.c.upcoming, rows.c.position, rows.c.total
+    ).select_from(rows).join(counterpart, counterpart.id == rows.c.counterpart_id)
+  if past_limit is not None:
+    query = query.filter(db.or_(rows.c.upcoming, rows.c.position <= past_limit))
+  return query.order_by(rows.c.start_time)
+
+def page_shows_query(model, entity_id, now=None):
+  # the shows listed on a venue's or artist's page
+  if model is Venue:
+    return partitioned_shows_query('venue_id', entity_id, Artist, now, app.config['PAST_SHOWS_LIMIT'])
+  return partitioned_shows_query('artist_id', entity_id, Venue, now, app.config['PAST_SHOWS_LIMIT'])
+
+def split_shows(rows):
+  # (upcoming, past newest first, upcoming count, past count)
+  upcoming_shows, past_shows = [], []
+  counts = {True: 0, False: 0}
+  for row in rows:
+    counts[row.upcoming] = row.total
+    (upcoming_shows if row.upcoming else past_shows).append(row)
+  past_shows.reverse()
+  return upcoming_shows, past_shows, counts[True], counts[False]
+
+def venue_detail(venue, shows=None):
+  # the venue page's data, shared by the HTML view and the API; shows are
+  # the rows of page_shows_query(Venue, venue.id), fetched here unless given
+  upcoming_shows, past_shows, upcoming_count, past_count = split_shows(
+    page_shows_query(Venue, venue.id).all() if shows is None else shows)
+
+  def show_data(show):
+    return {
+      "artist_id": show.id,
+      "artist_name": show.name,
+      "artist_image_link": show.image_link,
+      "start_time": show.start_time
+    }
+
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": [show_data(show) for show in past_shows],
+    "upcoming_shows": [show_data(show) for show in upcoming_shows],
+    "past_shows_count": past_count,
+    "upcoming_shows_count": upcoming_count,
+  }
+
+def artist_detail(artist, shows=None):
+  # the artist page's data, shared by the HTML view and the API; shows are
+  # the rows of page_shows_query(Artist, artist.id), fetched here unless given
+  upcoming_shows, past_shows, upcoming_count, past_count = split_shows(
+    page_shows_query(Artist, artist.id).all() if shows is None else shows)
+
+  def show_data(show):
+    return {
+      "venue_id": show.id,
+      "venue_name": show.name,
+      "venue_image_link": show.image_link,
+      "start_time": show.start_time
+    }
+
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": [show_data(show) for show in past_shows],
+    "upcoming_shows": [show_data(show) for show in upcoming_shows],
+    "past_shows_count": past_count,
+    "upcoming_shows_count": upcoming_count,
+  }
+
+def show_listing(cursor=None, limit=30, now=None):
+  # one page of upcoming shows in start_time order with their venue and artist names
+  page = paginate(show_listing_query(now), SHOW_KEY, cursor, limit)
+  return show_listing_data(page), page
+
+def show_listing_query(now=None):
+  # shows from now on only, so the planner prunes the partitions of past
+  # months and the first page starts at the next show
+  now = now or datetime.now()
+  return db.session.query(
+      Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+      Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'),
+      # a listed show changes with its venue's or artist's name too
+      db.func.greatest(Show.updated_at, Venue.updated_at, Artist.updated_at).label('updated_at')
+    ).join(Venue, Show.venue_id == Venue.id
+    ).join(Artist, Show.artist_id == Artist.id
+    ).filter(Show.start_time >= now)
+
+def show_listing_data(page):
+  data = []
+  for show in page: 
+    data.append({
+      "id": show.id,
+      "venue_id": show.venue_id,
+      "venue_name": show.venue_name,
+      "artist_id": show.artist_id,
+      "artist_name": show.artist_name, 
+      "artist_image_link": show.artist_image_link,
+      "start_time": show.start_time,
+      "updated_at": show.updated_at
+    })
+  return data
+
+#  API versions
+#  ----------------------------------------------------------------
+#  What each /api/v1 response is built from, read in one aggregate query:
+#  the newest updated_at, which is its Last-Modified, and a fingerprint that
+#  also moves when rows are deleted or shows pass from upcoming to past. The
+#  ETag is a hash of the fingerprint, so a current If-None-Match is answered
+#  without building the response.
+
+def listing_version(*models):
+  # (last_modified, fingerprint) of listings over whole tables
+  return listing_fingerprint(listing_version_query(*models).one())
+
+def listing_version_query(*models):
+  return db.session.query(*[column for model in models for column in (
+    db.session.query(db.func.max(model.updated_at)).as_scalar(),
+    db.session.query(db.func.count(model.id)).as_scalar())])
+
+def listing_fingerprint(row):
+  return max(filter(None, row[::2]), default=None), tuple(row)
+
+def show_listing_version(now=None):
+  return show_listing_fingerprint(show_listing_version_query(now).one())
+
+def show_listing_version_query(now=None):
+  # the show listing also changes, without any write, when its first show starts
+  now = now or datetime.now()
+  first_upcoming = db.session.query(db.func.min(Show.start_time)).filter(Show.start_time >= now).as_scalar()
+  return listing_version_query(Show, Venue, Artist).add_columns(first_upcoming)
+
+def show_listing_fingerprint(row):
+  last_modified, fingerprint = listing_fingerprint(row[:-1])
+  return last_modified, fingerprint + (row[-1],)
+
+def detail_version(model, entity_id, now=None):
+  # (last_modified, fingerprint) of a venue or artist page, None if it doesn't exist
+  return detail_fingerprint(detail_version_query(model, entity_id, now).first())
+
+def detail_version_query(model, entity_id, now=None):
+  now = now or datetime.now()
+  shows = all_shows()
+  if model is Venue:
+    owner_key, counterpart, counterpart_key = 'venue_id', Artist, 'artist_id'
+  else:
+    owner_key, counterpart, counterpart_key = 'artist_id', Venue, 'venue_id'
+  return db.session.query(
+      model.updated_at,
+      db.func.max(shows.c.updated_at),
+      db.func.max(counterpart.updated_at),
+      db.func.count(shows.c.id),
+      db.func.count(shows.c.id).filter(shows.c.start_time > now)
+    ).outerjoin(shows, shows.c[owner_key] == model.id
+    ).outerjoin(counterpart, counterpart.id == shows.c[counterpart_key]
+    ).filter(model.id == entity_id
+    ).group_by(model.id)
+
+def detail_fingerprint(row):
+  if row is None:
+    return None
+  return max(filter(None, row[:3])), tuple(row)
+
+#  Page cache keys
+#  ----------------------------------------------------------------
+#  The cached routes that render a given venue or artist, for the write
+#  handlers to invalidate once their change is committed.
+
+def venue_pages(venue_id):
+  routes = [('venues', {}), ('shows', {}), ('show_venue', {'venue_id': venue_id})]
+  shows = all_shows()
+  artist_ids = db.session.query(shows.c.artist_id).filter(shows.c.venue_id == venue_id).distinct()
+  return routes + [('show_artist', {'artist_id': artist_id}) for (artist_id,) in artist_ids]
+
+def artist_pages(artist_id):
+  routes = [('artists', {}), ('shows', {}), ('show_artist', {'artist_id': artist_id})]
+  shows = all_shows()
+  venue_ids = db.session.query(shows.c.venue_id).filter(shows.c.artist_id == artist_id).distinct()
+  return routes + [('show_venue', {'venue_id': venue_id}) for (venue_id,) in venue_ids]
+
+#  Jobs
+#  ----------------------------------------------------------------
+#  Work a write handler leaves to `flask fyyur worker` once its change is
+#  committed (see jobs.py). Only work the worker processes can do for the
+#  web workers is queued: the sqlite search index, which is one file, and
+#  the pages of a shared (redis) page cache. The in-memory suggestions and
+#  LRU page cache belong to each web worker and stay in the handlers.
+
+JOB_OPTIONS = dict(max_attempts=app.config['JOB_MAX_ATTEMPTS'], backoff=app.config['JOB_BACKOFF'],
+                   max_backoff=app.config['JOB_MAX_BACKOFF'], lease=app.config['JOB_LEASE'])
+
+if app.config['JOB_QUEUE_BACKEND'] == 'postgres':
+  job_queue = PostgresQueue(db.engine, Job.__table__, **JOB_OPTIONS)
+elif app.config['JOB_QUEUE_BACKEND'] == 'sqlite':
+  job_queue = SQLiteQueue(app.config['JOB_QUEUE_SQLITE_PATH'], **JOB_OPTIONS)
+else:
+  job_queue = ImmediateQueue(**JOB_OPTIONS)
+
+@job_queue.handler('index_search')
+def index_search_job(entity_type, entity_id):
+  # the search entry of a venue or artist as it now is, or none once it is deleted
+  entity = {'venue': Venue, 'artist': Artist}[entity_type].query.get(entity_id)
+  if entity is None:
+    search_engine.remove(entity_type, entity_id)
+  else:
+    search_engine.index(entity_type, search_document(entity))
+
+@job_queue.handler('warm_pages')
+def warm_pages_job(urls):
+  # renders pages a write invalidated, so the next visitor finds them cached;
+  # from the primary, as a lagging replica would put the old page back
+  client = app.test_client()
+  for url in urls:
+    client.get(url, environ_base={READ_PRIMARY: True})
+
+def index_later(entity_type, entity_id):
+  # postgres' search_vector is kept current by a trigger
+  if isinstance(search_engine, SQLiteSearch):
+    job_queue.enqueue('index_search', entity_type=entity_type, entity_id=entity_id)
+
+def warm_later(*urls):
+  # an LRU page cache is the web worker's own; a worker can't fill it
+  if isinstance(page_cache.backend, RedisBackend):
+    job_queue.enqueue('warm_pages', urls=list(urls))
+
+def after_write(*follow_ups):
+  # the indexing, cache and suggestion updates that follow a commit; one that
+  # fails is logged, and the others still run: the write itself stands
+  for follow_up in follow_ups:
+    try:
+      follow_up()
+    except Exception:
+      app.logger.exception('a follow-up of a committed write failed')
+
+#  Show counters
+#  ----------------------------------------------------------------
+#  Venue and Artist keep upcoming_shows_count / past_shows_count in step with
+#  the shows table. Every change goes through the helpers below, inside the
+#  same transaction as the write that causes it.
+
+COUNTED_MODELS = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+def count_show(show):
+  # adds a freshly created show to its venue's and artist's counters
+  show.counted_as_upcoming = show.start_time > datetime.now()
+  counter = 'upcoming_shows_count' if show.counted_as_upcoming else 'past_shows_count'
+  for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    column = getattr(model, counter)
+    model.query.filter(model.id == entity_id).update({column: column + 1}, synchronize_session=False)
+
+def _show_counts(shows, foreign_key, criterion):
+  return db.session.query(
+      shows.c[foreign_key].label('entity_id'),
+      db.func.sum(db.case([(shows.c.counted_as_upcoming, 1)], else_=0)).label('upcoming'),
+      db.func.sum(db.case([(shows.c.counted_as_upcoming, 0)], else_=1)).label('past')
+    ).filter(criterion).group_by(shows.c[foreign_key]).subquery()
+
+def release_show_counts(key, entity_id):
+  # takes every show of one venue or artist (key 'venue_id' or 'artist_id'),
+  # archived ones included, out of the counters, one UPDATE .. FROM per
+  # table; call before deleting those shows
+  shows = all_shows()
+  for model, foreign_key in COUNTED_MODELS:
+    counts = _show_counts(shows, foreign_key, shows.c[key] == entity_id)
+    table = model.__table__
+    db.session.execute(table.update().where(table.c.id == counts.c.entity_id).values(
+      upcoming_shows_count=table.c.upcoming_shows_count - counts.c.upcoming,
+      past_shows_count=table.c.past_shows_count - counts.c.past
+    ))
+
+def roll_show_counts(now=None):
+  # moves shows whose start_time has passed from the upcoming to the past counters
+  now = now or datetime.now()
+  crossed = db.and_(Show.counted_as_upcoming, Show.start_time <= now)
+  for model, foreign_key in COUNTED_MODELS:
+    counts = _show_counts(Show.__table__, foreign_key, crossed)
+    table = model.__table__
+    db.session.execute(table.update().where(table.c.id == counts.c.entity_id).values(
+      upcoming_shows_count=table.c.upcoming_shows_count - counts.c.upcoming,
+      past_shows_count=table.c.past_shows_count + counts.c.upcoming
+    ))
+  return Show.query.filter(crossed).update({Show.counted_as_upcoming: False}, synchronize_session=False)
+
+#  Bookings
+#  ----------------------------------------------------------------
+#  Double bookings are refused by the exclusion constraints of the bookings
+#  table. The queries below read the same GiST indexes, so their cost grows
+#  with the log of the history, not its size.
+
+# the SQLSTATE of a row refused by an exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+
+def booking_conflict(venue_id, artist_id, start_time, end_time):
+  # the earliest show at the venue or with the artist overlapping
+  # [start_time, end_time), or None
+  return booking_conflict_query(venue_id, artist_id, start_time, end_time).first()
+
+def booking_conflict_query(venue_id, artist_id, start_time, end_time):
+  return db.session.query(
+      Booking.show_id, Venue.name.label('venue_name'), Artist.name.label('artist_name'),
+      (Booking.venue_id == venue_id).label('same_venue'),
+      db.func.lower(Booking.during).label('start_time'), db.func.upper(Booking.during).label('end_time')
+    ).join(Venue, Venue.id == Booking.venue_id).join(Artist, Artist.id == Booking.artist_id
+    ).filter(db.or_(Booking.venue_id == venue_id, Booking.artist_id == artist_id),
+             Booking.during.overlaps(db.func.tsrange(start_time, end_time))
+    ).order_by(db.func.lower(Booking.during))
+
+def free_slots(venue_ids, start, end, min_length=timedelta(0)):
+  # {venue_id: [(start, end), ...]}, the gaps of at least min_length between
+  # each venue's shows within [start, end), read in one query
+  booked = free_slots_query(venue_ids, start, end)
+  free_from = dict.fromkeys(venue_ids, start)
+  slots = {venue_id: [] for venue_id in venue_ids}
+  for venue_id, booked_from, booked_until in itertools.chain(booked, ((venue_id, end, end) for venue_id in venue_ids)):
+    if booked_from > free_from[venue_id] and booked_from - free_from[venue_id] >= min_length:
+      slots[venue_id].append((free_from[venue_id], booked_from))
+    free_from[venue_id] = max(free_from[venue_id], booked_until)
+  return slots
+
+def free_slots_query(venue_ids, start, end):
+  # the bookings of the venues overlapping [start, end), in time order
+  return db.session.query(
+      Booking.venue_id, db.func.lower(Booking.during), db.func.upper(Booking.during)
+    ).filter(Booking.venue_id.in_(venue_ids), Booking.during.overlaps(db.func.tsrange(start, end))
+    ).order_by(Booking.venue_id, db.func.lower(Booking.during))
+
+def conflict_message(conflict):
+  clash = 'The venue' if conflict.same_venue else 'The artist'
+  return (f'{clash} is already booked from {conflict.start_time:%Y-%m-%d %H:%M} to {conflict.end_time:%Y-%m-%d %H:%M}: '
+          f'show {conflict.show_id}, {conflict.artist_name} at {conflict.venue_name}.')
+
+#  Nearby venues
+#  ----------------------------------------------------------------
+#  The geohash cells covering the search circle narrow the venues down
+#  through ix_venue_geohash; the exact distance sorts and filters the rest.
+
+def locate(city, state, latitude=None, longitude=None):
+  # (latitude, longitude, geohash) of a venue: its own coordinates, else the
+  # centre of its city from geocodes, else all None
+  if latitude is None or longitude is None:
+    place = Geocode.query.filter(db.func.lower(Geocode.city) == (city or '').strip().lower(),
+                                 Geocode.state == (state or '').strip().upper()).first()
+    if place is None:
+      return None, None, None
+    latitude, longitude = place.latitude, place.longitude
+  return latitude, longitude, geohash(latitude, longitude)
+
+def city_centres():
+  # {(lowercased city, state): (latitude, longitude)} of the whole geocodes table
+  return {(city.lower(), state): (latitude, longitude)
+          for city, state, latitude, longitude in db.session.query(Geocode.city, Geocode.state, Geocode.latitude, Geocode.longitude)}
+
+def place_venues():
+  # puts the venues without coordinates at the centre of their city, if
+  # geocodes has it; returns how many were placed
+  centres = city_centres()
+  placed = []
+  for venue_id, city, state in db.session.query(Venue.id, Venue.city, Venue.state).filter(Venue.latitude.is_(None)):
+    centre = centres.get(((city or '').strip().lower(), (state or '').strip().upper()))
+    if centre:
+      placed.append({'venue_id': venue_id, 'latitude': centre[0], 'longitude': centre[1], 'cell': geohash(*centre)})
+  if placed:
+    table = Venue.__table__
+    db.session.execute(table.update().where(table.c.id == db.bindparam('venue_id')).values(
+      latitude=db.bindparam('latitude'), longitude=db.bindparam('longitude'), geohash=db.bindparam('cell')), placed)
+  return len(placed)
+
+def nearby_venues(latitude, longitude, radius_km, limit=30):
+  return nearby_data(nearby_venues_query(latitude, longitude, radius_km, limit))
+
+def nearby_venues_query(latitude, longitude, radius_km, limit=30):
+  # the venues within radius_km, nearest first, with their upcoming show counter
+  distance = distance_sql(Venue.latitude, Venue.longitude, latitude, longitude)
+  candidates = db.session.query(
+      Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count, distance.label('distance')
+    ).filter(db.or_(*in_cells(Venue.geohash, covering_cells(latitude, longitude, radius_km)))
+    ).subquery()
+  return db.session.query(candidates).filter(candidates.c.distance <= radius_km
+    ).order_by(candidates.c.distance, candidates.c.id).limit(limit)
+
+def nearby_data(rows):
+  return [{
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+    "distance_km": round(row.distance, 2),
+    "num_upcoming_shows": row.upcoming_shows_count
+  } for row in rows]
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+format_datetime = DateTimeFormatter(app.config['DATETIME_LOCALE'], app.config['DATETIME_CACHE_SIZE'])
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+# static URLs, fingerprinted once `flask fyyur assets build` has run
+assets = Assets(app.static_folder)
+app.jinja_env.globals.update(asset_url=assets.asset_url, asset_urls=assets.asset_urls)
+
+# {% cache %} pieces of the listings, keyed on what they show and its updated_at
+fragment_cache = FragmentCache(LRUBackend(app.config['FRAGMENT_CACHE_MAX_ENTRIES'], app.config['FRAGMENT_CACHE_TTL'])
+                               if app.config['FRAGMENT_CACHE'] else None)
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache = fragment_cache
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def nearby_args():
+  # lat, lng and radius (km) of a nearby search; 400 when out of range
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  radius = request.args.get('radius', app.config['NEARBY_RADIUS_KM'], type=float)
+  if not 0 < radius <= app.config['NEARBY_MAX_RADIUS_KM']:
+    abort(400)
+  if (latitude is not None and not -90 <= latitude <= 90) or (longitude is not None and not -180 <= longitude <= 180):
+    abort(400)
+  return latitude, longitude, radius
+
+def genre_args(args=None):
+  # the ?genre= filter of a listing or search (repeatable), and whether rows
+  # need ?genre_match=all of the genres (the default) or any
+  args = request.args if args is None else args
+  match = args.get('genre_match')
+  return tuple(genre for genre in args.getlist('genre') if genre), match if match in MATCHES else 'all'
+
+def facets_data(counts):
+  return [{"genre": genre, "count": count} for genre, count in counts]
+
+def page_args(args=None):
+  # cursor and page size of a paginated listing, the size capped at MAX_PAGE_SIZE
+  args = request.args if args is None else args
+  limit = args.get('limit', app.config['PAGE_SIZE'], type=int)
+  return args.get('cursor'), max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+@app.before_first_request
+def build_suggestions():
+  # on a thread; only the first lookups wait for it
+  suggestions.start()
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -120,90 +832,36 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached()
 def venues():
+  genres, match = genre_args()
+  areas, page = venue_areas(*page_args(), genres, match)
+  return render_template('pages/venues.html', areas=areas, page=page, genres=genres, match=match,
+                         facets=genre_facets.counts(Venue, genres, match))
 
-  cities = Venue.query.group_by(Venue.city,Venue.state,Venue.id).all() 
-  data=[]
-  for venue_city in cities:
-    venue_info = []
-    # appending info about city , state ,  and venues at each city to the end point 
-    data.append({
-      "city": venue_city.city,
-      "state": venue_city.state, 
-      "venues": venue_info
-    })
-    venues = Venue.query.filter_by(state=venue_city.state,city=venue_city.city).all()
-    for venue in venues:  # appending data about each venue in the city 
-      venue_info.append({
-        "id": venue.id,
-        "name": venue.name, 
-        "num_upcoming_shows": len(Show.upcoming_shows_query())
-      })
-    
-  
-  
-  return render_template('pages/venues.html',areas=data)
-
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-  search_term = request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike('%{}%'.format(search_term))).all()
-
-  result={
-    "count": len(venues),
-    "data": []
-  }
-
-  for venue in venues:
-    result['data'].append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": len(Show.upcoming_shows_query())
-    })
-  
-  
-  return render_template('pages/search_venues.html', results=result, search_term=request.form.get('search_term', ''))
+  search_term = request.values.get('search_term', '')
+  genres, match = genre_args(request.values)
+  venues, page, total = search_results(Venue, 'venue', search_term, *page_args(), genres, match)
+  result = search_data(venues, total)
+  return render_template('pages/search_venues.html', results=result, search_term=search_term, page=page,
+                         genres=genres, match=match)
+
+@app.route('/venues/nearby')
+def nearby():
+  # venues around a point, nearest first; the form alone until lat/lng are given
+  latitude, longitude, radius = nearby_args()
+  venues = None
+  if latitude is not None and longitude is not None:
+    venues = nearby_venues(latitude, longitude, radius, page_args()[1])
+  return render_template('pages/nearby_venues.html', venues=venues, lat=latitude, lng=longitude, radius=radius)
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached()
 def show_venue(venue_id):
   
-  venue = db.session.query(Venue).get(venue_id)
-  venue_shows = venue.shows
-  upcomingShowsList = []
-  pastShowsList = []
-
-  for show in venue_shows:
-    show_data = { 
-      "artist_id": show.artist_id,
-      "artist_name": show.Artist.name,
-      "artist_image_link": show.Artist.image_link,
-      "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-    }
-    # using the upcoming_show_query method in Show model to filter shows and appending show_info to the upcomigShowsList
-    if (show.upcoming_shows_query):
-      upcomingShowsList.append(show_data)
-    #if it's not an upcoming show append show_data to the pastShowsList  
-    else:
-      pastShowsList.append(show_data)
-
-  data = {
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": pastShowsList,
-    "upcoming_shows": upcomingShowsList,
-    "past_shows_count": len(pastShowsList),
-    "upcoming_shows_count": len(upcomingShowsList),
-  }
+  data = venue_detail(Venue.query.get_or_404(venue_id))
   return render_template('pages/show_venue.html', venue=data)
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -227,8 +885,14 @@ def create_venue_submission():
     image_link = request.form.get('image_link','')
     facebook_link = request.form.get('facebook_link','')
     venue = Venue(name=name, city=city, state=state, address=address, phone=phone, genres=genres, facebook_link=facebook_link, image_link=image_link)
+    venue.latitude, venue.longitude, venue.geohash = locate(city, state, request.form.get('latitude', type=float),
+                                                            request.form.get('longitude', type=float))
     db.session.add(venue)
     db.session.commit()
+    after_write(lambda: index_later('venue', venue.id),
+                lambda: suggestions.add('venue', venue.id, venue.name),
+                lambda: page_cache.invalidate(('venues', {})),
+                lambda: warm_later(url_for('venues')))
   except:
     error = True
     db.session.rollback()
@@ -247,11 +911,19 @@ def create_venue_submission():
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-  error:False
+  error = False
   try:
     venue = Venue.query.get(venue_id)
+    pages = venue_pages(venue.id)
+    release_show_counts('venue_id', venue.id)
+    for shows in (Show.__table__, shows_archive):
+      db.session.execute(shows.delete().where(shows.c.venue_id == venue.id))
     db.session.delete(venue)
     db.session.commit()
+    after_write(lambda: index_later('venue', int(venue_id)),
+                lambda: suggestions.remove('venue', int(venue_id)),
+                lambda: page_cache.invalidate(*pages),
+                lambda: warm_later(url_for('venues'), url_for('shows')))
   except:
     error = True
     db.session.rollback()
@@ -271,74 +943,30 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached()
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data= Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  genres, match = genre_args()
+  query = filter_genres(db.session.query(Artist.id, Artist.name), Artist.genres, genres, match)
+  page = paginate(query, (Artist.name, Artist.id), *page_args())
+  return render_template('pages/artists.html', artists=page.items, page=page, genres=genres, match=match,
+                         facets=genre_facets.counts(Artist, genres, match))
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  search_term = request.form.get('search_term', '')
-  results = Artist.query.filter(Artist.name.ilike('%{}%'.format(search_term))).all()
-  data = []
-  response={
-    "count": len(results),
-    "data": data
-  }
-
-  for result in results:
-    data.append({
-      "id": result.id,
-      "name": result.name,
-      "num_upcoming_shows": len(Show.upcoming_shows_query()),
-    })
- 
- 
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  # ranked match on name, city, state and genres, one page at a time
+  search_term = request.values.get('search_term', '')
+  genres, match = genre_args(request.values)
+  artists, page, total = search_results(Artist, 'artist', search_term, *page_args(), genres, match)
+  response = search_data(artists, total)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term, page=page,
+                         genres=genres, match=match)
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached()
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
-  artist = Artist.query.get(artist_id)
-  artist_shows = artist.shows
-  pastShowsList = []
-  upcomingShowsList = []
-
-  for show in artist_shows:
-    show_data ={
-      "venue_id": show.venue_id,
-      "venue_name": show.Venue.name,
-      "artist_image_link": show.Venue.image_link,
-      "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-    }
-    # if the artist show is yet to come ,append the show data to the upcomingShowsList
-    if (show.upcoming_shows_query):
-      upcomingShowsList.append(show_data)
-      # if the artist show is done , append the show data to the upcomingShowsList
-    else:
-      pastShowsList.append(show_data)
-
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": pastShowsList,
-    "upcoming_shows": upcomingShowsList,
-    "past_shows_count": len(pastShowsList),
-    "upcoming_shows_count": len(upcomingShowsList),
-  }
+  data = artist_detail(Artist.query.get_or_404(artist_id))
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
@@ -383,6 +1011,10 @@ def edit_artist_submission(artist_id):
     artist.seeking_description = request.form.get('seeking_description','')
 
     db.session.commit()
+    after_write(lambda: index_later('artist', artist.id),
+                lambda: suggestions.add('artist', artist.id, artist.name),
+                lambda: page_cache.invalidate(*artist_pages(artist_id)),
+                lambda: warm_later(url_for('show_artist', artist_id=artist.id)))
   except: 
     error = True
     db.session.rollback()
@@ -433,7 +1065,13 @@ def edit_venue_submission(venue_id):
     venue.website = request.form.get('website','')
     venue.seeking_talent = True if 'seeking_talent' in request.form else False 
     venue.seeking_description = request.form.get('seeking_description','')
+    venue.latitude, venue.longitude, venue.geohash = locate(venue.city, venue.state, request.form.get('latitude', type=float),
+                                                            request.form.get('longitude', type=float))
     db.session.commit()
+    after_write(lambda: index_later('venue', venue.id),
+                lambda: suggestions.add('venue', venue.id, venue.name),
+                lambda: page_cache.invalidate(*venue_pages(venue_id)),
+                lambda: warm_later(url_for('show_venue', venue_id=venue.id)))
   except: 
     error = True
     db.session.rollback()
@@ -476,6 +1114,10 @@ def create_artist_submission():
     artist = Artist(name=name, city=city, state=state, phone=phone, genres=genres, facebook_link=facebook_link, image_link=image_link, website=website, seeking_venue=seeking_venue, seeking_description=seeking_description)
     db.session.add(artist)
     db.session.commit()
+    after_write(lambda: index_later('artist', artist.id),
+                lambda: suggestions.add('artist', artist.id, artist.name),
+                lambda: page_cache.invalidate(('artists', {})),
+                lambda: warm_later(url_for('artists')))
   except: 
     error = True
     db.session.rollback()
@@ -496,25 +1138,11 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached()
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  shows=Show.query.all()
-  data = []
-  for show in shows: 
-    if(show.upcoming_shows_query):
-      data.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.Venue.name,
-        "artist_id": show.artist_id,
-        "artist_name": show.Artist.name, 
-        "artist_image_link": show.Artist.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
-
-  
-  return render_template('pages/shows.html', shows=data)
+  # displays list of upcoming shows at /shows, one page at a time in start_time order
+  data, page = show_listing(*page_args())
+  return render_template('pages/shows.html', shows=data, page=page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -526,20 +1154,45 @@ def create_shows():
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
+  # the form carries no CSRF token, like the other forms of the site
+  form = ShowForm(request.form, meta={'csrf': False})
+  if not form.validate():
+    return render_template('forms/new_show.html', form=form)
   error = False
   try: 
-    artist_id = request.form.get('artist_id','')
-    venue_id = request.form.get('venue_id','')
-    start_time = request.form.get('start_time','')
-    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-    db.session.add(show)
-    db.session.commit()
+    artist_id = int(form.artist_id.data)
+    venue_id = int(form.venue_id.data)
+    start_time = form.start_time.data
+    end_time = form.end_time.data or start_time + timedelta(minutes=app.config['SHOW_DEFAULT_DURATION'])
+    # named here for the form; the exclusion constraints still catch a
+    # booking made in between, as an IntegrityError
+    conflict = booking_conflict(venue_id, artist_id, start_time, end_time)
+    if conflict is None:
+      show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time)
+      db.session.add(show)
+      count_show(show)
+      db.session.commit()
+      after_write(lambda: page_cache.invalidate(('shows', {}), ('show_venue', {'venue_id': venue_id}),
+                                                ('show_artist', {'artist_id': artist_id})),
+                  lambda: warm_later(url_for('shows'), url_for('show_venue', venue_id=venue_id),
+                                     url_for('show_artist', artist_id=artist_id)))
+  except IntegrityError as integrity_error:
+    db.session.rollback()
+    if getattr(integrity_error.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+      error = True
+      print(sys.exc_info())
+    else:
+      conflict = booking_conflict(venue_id, artist_id, start_time, end_time)
+      error = conflict is None
   except: 
     error = True
     db.session.rollback()
     print(sys.exc_info())
   finally: 
     db.session.close()
+  if not error and conflict is not None:
+    form.start_time.errors.append(conflict_message(conflict))
+    return render_template('forms/new_show.html', form=form)
   if error: 
     # TODO: on unsuccessful db insert, flash an error instead.
     flash('An error occurred. Show could not be listed.')
@@ -552,6 +1205,202 @@ def create_show_submission():
   
  
 
+#  Export
+#  ----------------------------------------------------------------
+#  Whole tables as CSV or NDJSON, in id order, in the format `flask fyyur
+#  import` reads. Rows come off a server-side cursor EXPORT_BATCH_SIZE at a
+#  time and the body is streamed, so memory stays flat at any table size.
+#  ?since=<id> exports only the rows after that id (incremental pulls);
+#  shows also take ?start= / ?end= bounds on start_time.
+
+EXPORTS = {
+  'venues': (Venue, ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'website',
+                     'facebook_link', 'seeking_talent', 'seeking_description', 'latitude', 'longitude')),
+  'artists': (Artist, ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link', 'website',
+                       'facebook_link', 'seeking_venue', 'seeking_description')),
+  'shows': (Show, ('id', 'venue_id', 'artist_id', 'start_time', 'end_time')),
+}
+
+def time_arg(name):
+  # show times are naive, in the server's local time like datetime.now();
+  # a value with an offset (2026-01-01T00:00Z) is converted to that
+  value = request.args.get(name)
+  if not value:
+    return None
+  try:
+    value = dateutil.parser.parse(value)
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo is not None else value
+  except (ValueError, OverflowError):
+    abort(400)
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, ndjson):format>')
+def export(kind, format):
+  model, columns = EXPORTS[kind]
+  query = db.session.query(*[getattr(model, column) for column in columns]).order_by(model.id)
+  since = request.args.get('since', type=int)
+  if since is not None:
+    query = query.filter(model.id > since)
+  if kind == 'shows':
+    start, end = time_arg('start'), time_arg('end')
+    if start is not None:
+      query = query.filter(Show.start_time >= start)
+    if end is not None:
+      query = query.filter(Show.start_time < end)
+  # yield_per makes psycopg2 read through a named (server-side) cursor
+  rows = query.yield_per(app.config['EXPORT_BATCH_SIZE'])
+  if format == 'csv':
+    body, mimetype = csv_chunks(rows, columns), 'text/csv'
+  else:
+    body, mimetype = ndjson_chunks(rows, columns), 'application/x-ndjson'
+  return Response(stream_with_context(body), mimetype=mimetype,
+                  headers={'Content-Disposition': f'attachment; filename={kind}.{format}'})
+
+#  API
+#  ----------------------------------------------------------------
+#  JSON versions of the listing and detail pages, built by the same code.
+
+def api_etag(path, args, fingerprint):
+  return hashlib.sha1(repr((path, sorted(args.items(multi=True)), fingerprint)).encode()).hexdigest()
+
+def api_response(version, build):
+  # 304 when the client's ETag is still current, otherwise build() as JSON
+  last_modified, fingerprint = version
+  etag = api_etag(request.path, request.args, fingerprint)
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = jsonify(build())
+  response.set_etag(etag)
+  response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  return response
+
+def page_data(items, page):
+  return {"data": items, "next_cursor": page.next_cursor, "prev_cursor": page.prev_cursor}
+
+@app.route('/api/v1/venues')
+def api_venues():
+  return api_response(listing_version(Venue), lambda: page_data(*venue_areas(*page_args(), *genre_args())))
+
+@app.route('/api/v1/venues/genres')
+def api_venue_genres():
+  # facet counts of the venues matching ?genre=, most common genre first
+  return api_response(listing_version(Venue),
+                      lambda: {"data": facets_data(genre_facets.counts(Venue, *genre_args()))})
+
+@app.route('/api/v1/venues/search')
+def api_search_venues():
+  search_term = request.args.get('search_term', '')
+  def build():
+    venues, page, total = search_results(Venue, 'venue', search_term, *page_args(), *genre_args())
+    return dict(search_data(venues, total), next_cursor=page.next_cursor, prev_cursor=page.prev_cursor)
+  return api_response(listing_version(Venue), build)
+
+@app.route('/api/v1/venues/nearby')
+def api_nearby_venues():
+  latitude, longitude, radius = nearby_args()
+  if latitude is None or longitude is None:
+    abort(400)
+  return api_response(listing_version(Venue),
+                      lambda: {"data": nearby_venues(latitude, longitude, radius, page_args()[1])})
+
+@app.route('/api/v1/venues/<int:venue_id>')
+def api_venue(venue_id):
+  version = detail_version(Venue, venue_id) or abort(404)
+  return api_response(version, lambda: venue_detail(Venue.query.get(venue_id)))
+
+@app.route('/api/v1/venues/<int:venue_id>/free-slots')
+def api_venue_free_slots(venue_id):
+  # the gaps between the venue's shows within ?start= .. ?end=, at least
+  # ?min_minutes= long
+  start, end = time_arg('start'), time_arg('end')
+  if start is None or end is None or end <= start:
+    abort(400)
+  min_length = timedelta(minutes=request.args.get('min_minutes', 0, type=int))
+  version = detail_version(Venue, venue_id) or abort(404)
+  def build():
+    slots = free_slots([venue_id], start, end, min_length)[venue_id]
+    return {"data": [{"start_time": slot_start, "end_time": slot_end} for slot_start, slot_end in slots]}
+  return api_response(version, build)
+
+@app.route('/api/v1/artists/search')
+def api_search_artists():
+  search_term = request.args.get('search_term', '')
+  def build():
+    artists, page, total = search_results(Artist, 'artist', search_term, *page_args(), *genre_args())
+    return dict(search_data(artists, total), next_cursor=page.next_cursor, prev_cursor=page.prev_cursor)
+  return api_response(listing_version(Artist), build)
+
+@app.route('/api/v1/artists/genres')
+def api_artist_genres():
+  return api_response(listing_version(Artist),
+                      lambda: {"data": facets_data(genre_facets.counts(Artist, *genre_args()))})
+
+@app.route('/api/v1/artists/<int:artist_id>')
+def api_artist(artist_id):
+  version = detail_version(Artist, artist_id) or abort(404)
+  return api_response(version, lambda: artist_detail(Artist.query.get(artist_id)))
+
+@app.route('/api/v1/suggest')
+def api_suggest():
+  # ?type=artist|venue names with a word starting with ?q=, for the new show
+  # form; answered from memory, so it has no ETag to check against the database
+  kind = request.args.get('type')
+  if kind not in ('artist', 'venue'):
+    abort(400)
+  limit = request.args.get('limit', app.config['SUGGEST_LIMIT'], type=int)
+  matches = suggestions.suggest(kind, request.args.get('q', ''), max(1, min(limit, app.config['MAX_PAGE_SIZE'])))
+  return jsonify({"data": [{"id": entity_id, "name": name} for entity_id, name in matches]})
+
+@app.route('/api/v1/shows')
+def api_shows():
+  now = datetime.now()
+  return api_response(show_listing_version(now), lambda: page_data(*show_listing(*page_args(), now)))
+
+@app.route('/metrics')
+def metrics_endpoint():
+  # Prometheus scrape target, aggregated over every worker process
+  return metrics.response()
+
+@app.route('/static/dist/<path:filename>')
+def built_asset(filename):
+  # hashed names never change content, so clients may keep them for a year
+  return assets.send(filename)
+
+def debug_endpoint(view):
+  # the /_debug pages show SQL, request paths with their search terms and
+  # tracebacks: not found unless DEBUG_ENDPOINTS is on
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    if not app.config['DEBUG_ENDPOINTS']:
+      abort(404)
+    return view(*args, **kwargs)
+  return wrapper
+
+@app.route('/_debug/cache')
+@debug_endpoint
+def cache_stats():
+  # hit / miss / eviction counters of the page cache
+  return jsonify(page_cache.stats())
+
+@app.route('/_debug/jobs')
+@debug_endpoint
+def job_stats():
+  # queued / running / dead jobs, and the newest dead ones with their errors
+  return jsonify({"counts": job_queue.counts(), "dead": job_queue.dead(20)})
+
+@app.route('/_debug/fragments')
+@debug_endpoint
+def fragment_stats():
+  # hits, misses and hit rate of each {% cache %} fragment
+  return jsonify(fragment_cache.stats())
+
+@app.route('/_debug/requests')
+@debug_endpoint
+def request_log():
+  # query count, database time and slowest statements of the latest requests
+  return jsonify(request_stats.requests())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -561,15 +1410,151 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+file_handler = FileHandler('error.log')
+file_handler.setFormatter(
+    Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+)
+file_handler.setLevel(logging.INFO)
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
     app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
+else:
+    # the likely N+1 loops request_stats reports go to error.log in debug mode too
+    request_stats.logger.addHandler(file_handler)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+app.cli.add_command(fyyur_cli)
+
+@fyyur_cli.command('roll-shows')
+def roll_shows_command():
+  """Move shows that have started from the upcoming to the past counters.
+
+  Meant to run periodically (e.g. every few minutes from cron).
+  """
+  moved = roll_show_counts()
+  db.session.commit()
+  print(f'{moved} shows moved from upcoming to past.')
+
+@fyyur_cli.command('create-partitions')
+@click.option('--months-ahead', default=app.config['SHOW_PARTITIONS_AHEAD'], show_default=True,
+              help='Months past the current one to have partitions for.')
+@click.option('--since', type=click.DateTime(['%Y-%m']), help='Also fill in the months from this one (YYYY-MM).')
+def create_partitions_command(months_ahead, since):
+  """Create the monthly partitions of the shows table ahead of time.
+
+  Meant to run regularly (e.g. daily from cron).
+  """
+  created = create_partitions(db.session, add_months(month_start(datetime.now()), months_ahead), since)
+  db.session.commit()
+  print(f"{len(created)} partitions created{': ' + ', '.join(created) if created else '.'}")
+
+@fyyur_cli.command('archive-shows')
+@click.option('--after-months', default=app.config['SHOW_ARCHIVE_AFTER_MONTHS'], show_default=True,
+              help='Archive the months that ended at least this many months ago.')
+def archive_shows_command(after_months):
+  """Move the partitions of long past shows to shows_archive."""
+  # archived shows are never rolled, so they must all count as past already
+  roll_show_counts()
+  archived = archive_partitions(db.session, add_months(month_start(datetime.now()), -after_months))
+  db.session.commit()
+  print(f"{len(archived)} partitions archived{': ' + ', '.join(archived) if archived else '.'}")
+
+@fyyur_cli.command('load-geocodes')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False), default=GEOCODES_FILE)
+def load_geocodes_command(path):
+  """Load city centres from a CSV file (city, state, latitude, longitude).
+
+  Defaults to the bundled data/geocodes.csv. Venues without coordinates
+  are then placed at the centre of their city.
+  """
+  rows = list(read_geocodes(path))
+  statement = pg_insert(Geocode.__table__)
+  db.session.execute(statement.on_conflict_do_update(
+    index_elements=['state', 'city'],
+    set_={'latitude': statement.excluded.latitude, 'longitude': statement.excluded.longitude}), rows)
+  placed = place_venues()
+  db.session.commit()
+  page_cache.invalidate(('venues', {}))
+  print(f'{len(rows)} cities loaded, {placed} venues placed.')
+
+@fyyur_cli.command('reindex')
+def reindex_command():
+  """Rebuild the search index of venues and artists from the database."""
+  for kind, model in (('venue', Venue), ('artist', Artist)):
+    search_engine.rebuild(kind, (search_document(entity) for entity in model.query.yield_per(1000)))
+    print(f'{kind} search index rebuilt.')
+
+@fyyur_cli.command('import')
+@click.option('--venues', type=click.Path(exists=True, dir_okay=False), help='CSV or NDJSON file of venues.')
+@click.option('--artists', type=click.Path(exists=True, dir_okay=False), help='CSV or NDJSON file of artists.')
+@click.option('--shows', type=click.Path(exists=True, dir_okay=False), help='CSV or NDJSON file of shows.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per COPY and transaction.')
+def import_command(venues, artists, shows, batch_size):
+  """Bulk load venues, artists and shows, validated like the web forms."""
+  from importer import import_file
+  for kind, path in (('venue', venues), ('artist', artists), ('show', shows)):
+    if path:
+      import_file(kind, path, batch_size)
+
+@fyyur_cli.command('worker')
+@click.option('--threads', default=app.config['JOB_WORKER_THREADS'], show_default=True,
+              help='Jobs run at once in each process.')
+@click.option('--processes', default=1, show_default=True, help='Worker processes, forked from this one.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due, instead of polling.')
+def worker_command(threads, processes, burst):
+  """Run the jobs the write handlers queue, until interrupted.
+
+  Several workers, on one machine or more, may run against the same queue.
+  """
+  if isinstance(job_queue, ImmediateQueue):
+    raise click.ClickException('JOB_QUEUE_BACKEND is None: jobs run in the requests, there is no queue to work.')
+  print(f'working {app.config["JOB_QUEUE_BACKEND"]} jobs on {processes} x {threads} threads')
+  run_workers(job_queue, app.app_context, threads, processes, app.config['JOB_POLL_INTERVAL'], burst)
+
+@fyyur_cli.command('jobs')
+@click.option('--requeue-dead', is_flag=True, help='Queue the dead-lettered jobs again.')
+def jobs_command(requeue_dead):
+  """Show how many jobs are queued, running and dead, and the last errors."""
+  if requeue_dead:
+    print(f'{job_queue.requeue_dead()} dead jobs queued again.')
+  print(', '.join(f'{count} {status}' for status, count in job_queue.counts().items()))
+  for job in job_queue.dead(10):
+    print(f"\n#{job['id']} {job['kind']} {json.dumps(job['payload'])}, {job['attempts']} attempts:")
+    print('  ' + (job['last_error'] or '').strip().rsplit('\n', 1)[-1])
+
+assets_cli = AppGroup('assets', help='Static asset bundles.')
+fyyur_cli.add_command(assets_cli)
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Remove the previous builds first.')
+def build_assets_command(clean):
+  """Bundle, minify, fingerprint and precompress the static files into static/dist.
+
+  Run on each deploy. The previous builds are kept, so pages still cached
+  with their URLs keep working, unless --clean.
+  """
+  manifest = assets.build(clean)
+  for bundle in BUNDLES:
+    print(f'{bundle}: static/dist/{manifest[bundle]}')
+  print(f"{len(manifest)} files built, precompressed with {', '.join(ENCODINGS)}.")
+  if 'br' not in ENCODINGS:
+    print('Brotli is not installed: no .br variants.')
+
+@fyyur_cli.command('seed')
+@click.option('--venues', default=100, show_default=True, help='Venues to create.')
+@click.option('--artists', default=200, show_default=True, help='Artists to create.')
+@click.option('--shows', default=2000, show_default=True, help='Shows to create.')
+@click.option('--seed', 'random_seed', type=int, help='Random seed, for a reproducible dataset.')
+@click.option('--reset', is_flag=True, help='Empty the venue, artist and show tables first.')
+def seed_command(venues, artists, shows, random_seed, reset):
+  """Fill the database with synthetic, realistically skewed data."""
+  from seed import seed
+  seed(venues, artists, shows, random_seed, reset)
 
 #----------------------------------------------------------------------------#
 # Launch.
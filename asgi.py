@@ -0,0 +1,399 @@
+"""ASGI entry point: ``uvicorn asgi:application``.
+
+The read-only JSON API (the ``/api/v1`` listing, detail and search routes)
+runs on asyncio here. The API's queries go to Postgres through an asyncpg
+pool, so a worker blocked on the database holds a coroutine, not a thread.
+Pinned at SQLAlchemy 1.3, the app has no async engine. Instead, the very
+query builders the Flask views use (``venue_areas_query``,
+``page_shows_query``, ``detail_version_query``, ...) are compiled here for
+asyncpg and their rows are shaped by the same functions, so both entry
+points answer with the same JSON and the same ETags. Independent queries
+of one response (an entity and its shows, a search page and its count) run
+concurrently on separate connections.
+
+Every other route, and the conditional and error handling that only Flask
+knows, is passed to the Flask app through a small WSGI adapter that runs it
+on a thread pool and streams its response back, so the HTML pages and the
+exports work unchanged. Those requests go through Flask's hooks as usual;
+the async routes skip them, so they are missing from the Server-Timing
+header, /_debug/requests and the Prometheus request metrics, and always
+read from the primary.
+
+The HTML listing, detail and search pages deliberately stay on that thread
+pool, although they read the same data as the API. They are what the page
+cache holds (shared between processes under redis), so most of them are
+answered without a query at all. A miss renders from the primary, and any
+other read on those pages goes to a replica unless the client's session
+pins it to the primary after a write. Their flashed messages also live in
+the session. Here they would lose the replicas and the pin, and every page
+would read the primary. Moving them over needs the session, the page cache
+and the replica pool in the async path first; until then, a thread blocked
+on psycopg2 per page cache miss is the cheaper trade.
+"""
+import asyncio
+import json
+import re
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql.base import PGCompiler, PGDialect
+from werkzeug.exceptions import NotFound
+from werkzeug.wrappers import Request, Response
+
+from app import (app, Venue, Artist, APIJSONEncoder, AREA_KEY, SHOW_KEY, api_etag, page_args, page_data,
+                 genre_args, search_engine, search_rows_query, in_rank_order, search_data, venue_areas_query,
+                 group_areas, show_listing_query, show_listing_data, page_shows_query, venue_detail, artist_detail,
+                 listing_version_query, listing_fingerprint, show_listing_version_query, show_listing_fingerprint,
+                 detail_version_query, detail_fingerprint)
+from pagination import keyset, page_of
+from search import PostgresSearch
+
+QUEUED_CHUNKS = 8  # response chunks buffered between a WSGI thread and the event loop
+
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+class AsyncpgCompiler(PGCompiler):
+
+    def bindparam_string(self, name, **kw):
+        # the numeric paramstyle renders ':[_POSITION]', asyncpg wants '$1'
+        return PGCompiler.bindparam_string(self, name, **kw).replace(':[_POSITION]', '$[_POSITION]')
+
+
+class AsyncpgDialect(PGDialect):
+    statement_compiler = AsyncpgCompiler
+
+    def __init__(self, **kwargs):
+        PGDialect.__init__(self, paramstyle='numeric', **kwargs)
+
+
+DIALECT = AsyncpgDialect()
+
+
+def compile_query(query):
+    """The SQL and positional parameters of a Query or Core statement, for asyncpg."""
+    compiled = getattr(query, 'statement', query).compile(dialect=DIALECT)
+    return compiled.string, [compiled.params[name] for name in compiled.positiontup]
+
+
+def count_query(query):
+    return select([func.count()]).select_from(query.subquery())
+
+
+@lru_cache(maxsize=256)
+def row_class(keys):
+    return namedtuple('Row', keys, rename=True)
+
+
+def postgres_dsn(uri):
+    # SQLAlchemy URIs may name a driver (postgresql+psycopg2://); asyncpg doesn't take one
+    return re.sub(r'^postgres(?:ql)?(?:\+\w+)?://', 'postgresql://', uri)
+
+
+class Database(object):
+    """An asyncpg pool answering SQLAlchemy queries with attribute-style rows."""
+
+    def __init__(self, dsn, max_size=10):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.pool = None
+        self._lock = None
+
+    async def start(self):
+        # the lock belongs to the server's event loop, so it can't be made at import
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.max_size)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def all(self, query):
+        if self.pool is None:
+            await self.start()
+        sql, params = compile_query(query)
+        async with self.pool.acquire() as connection:
+            records = await connection.fetch(sql, *params)
+        if not records:
+            return []
+        cls = row_class(tuple(records[0].keys()))
+        return [cls(*record.values()) for record in records]
+
+    async def first(self, query):
+        rows = await self.all(query.limit(1))
+        return rows[0] if rows else None
+
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+#  Each takes the werkzeug Request and the URL's arguments and returns a
+#  Response, or None to leave the request to Flask (e.g. for its 404 page).
+
+async def api_response(request, version, build):
+    # api_response in app.py, with an async build()
+    last_modified, fingerprint = version
+    etag = api_etag(request.path, request.args, fingerprint)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = json.dumps(await build(), cls=APIJSONEncoder, sort_keys=app.config['JSON_SORT_KEYS'])
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+async def listing(request, version_query, fingerprint, query, key, shape):
+    async def build():
+        paged, position = keyset(query, key, *page_args(request.args))
+        page = page_of(await database.all(paged), key, position)
+        return page_data(shape(page), page)
+    version = fingerprint(await database.first(version_query))
+    return await api_response(request, version, build)
+
+
+async def api_venues(request):
+    return await listing(request, listing_version_query(Venue), listing_fingerprint,
+                         venue_areas_query(*genre_args(request.args)), AREA_KEY, group_areas)
+
+
+async def api_shows(request):
+    now = datetime.now()
+    return await listing(request, show_listing_version_query(now), show_listing_fingerprint,
+                         show_listing_query(now), SHOW_KEY, show_listing_data)
+
+
+async def detail(request, model, entity_id, shape):
+    version = detail_fingerprint(await database.first(detail_version_query(model, entity_id)))
+    if version is None:
+        return None
+
+    async def build():
+        entity, shows = await asyncio.gather(database.first(model.query.filter(model.id == entity_id)),
+                                             database.all(page_shows_query(model, entity_id)))
+        return shape(entity, shows)
+    return await api_response(request, version, build)
+
+
+async def api_venue(request, venue_id):
+    return await detail(request, Venue, venue_id, venue_detail)
+
+
+async def api_artist(request, artist_id):
+    return await detail(request, Artist, artist_id, artist_detail)
+
+
+async def search(request, model, kind):
+    async def build():
+        search_term = request.args.get('search_term', '')
+        cursor, limit = page_args(request.args)
+        genres, match = genre_args(request.args)
+        if isinstance(search_engine, PostgresSearch):
+            hits, sort_key = search_engine.hits_query(kind, search_term, genres, match)
+            paged, position = keyset(hits, sort_key, cursor, limit)
+            rows, (total,) = await asyncio.gather(database.all(paged), database.first(count_query(hits)))
+            page = page_of(rows, sort_key, position)
+        else:
+            page, total = await asyncio.get_running_loop().run_in_executor(
+                executor, search_engine.search, kind, search_term, cursor, limit, genres, match)
+        ids = [hit.id for hit in page]
+        rows = in_rank_order(await database.all(search_rows_query(model, ids)), ids) if ids else []
+        return dict(search_data(rows, total), next_cursor=page.next_cursor, prev_cursor=page.prev_cursor)
+    version = listing_fingerprint(await database.first(listing_version_query(model)))
+    return await api_response(request, version, build)
+
+
+async def api_search_venues(request):
+    return await search(request, Venue, 'venue')
+
+
+async def api_search_artists(request):
+    return await search(request, Artist, 'artist')
+
+
+# Flask endpoint -> its async version; the URL rules stay in app.py
+ASYNC_VIEWS = {view.__name__: view for view in (
+    api_venues, api_shows, api_venue, api_artist, api_search_venues, api_search_artists)}
+
+
+#----------------------------------------------------------------------------#
+# WSGI fallback.
+#----------------------------------------------------------------------------#
+
+def wsgi_environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': 'HTTP/' + scope['http_version'],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1] or 80)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class ClientGone(Exception):
+    pass
+
+
+async def call_wsgi(wsgi_app, environ, send):
+    # wsgi_app runs on the thread pool and hands its chunks to the event loop
+    # through a bounded queue, so a large export streams rather than buffers
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(QUEUED_CHUNKS)
+    abandoned = threading.Event()
+
+    def put(message):
+        if abandoned.is_set():
+            raise ClientGone()
+        asyncio.run_coroutine_threadsafe(chunks.put(message), loop).result()
+
+    def run():
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        try:
+            result = wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        put(('body', chunk, started))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            put(('end', b'', started))
+        except ClientGone:
+            pass
+        except BaseException as error:
+            put(('error', error, started))
+
+    worker = loop.run_in_executor(executor, run)
+    try:
+        response_started = False
+        while True:
+            kind, payload, started = await chunks.get()
+            if kind == 'error':
+                raise payload
+            if not response_started:
+                status, headers = started
+                await send({
+                    'type': 'http.response.start',
+                    'status': int(status.split(' ', 1)[0]),
+                    'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+                })
+                response_started = True
+            await send({'type': 'http.response.body', 'body': payload, 'more_body': kind == 'body'})
+            if kind == 'end':
+                break
+    finally:
+        # unblock the thread if the client went away mid-response
+        abandoned.set()
+        while not worker.done():
+            while not chunks.empty():
+                chunks.get_nowait()
+            await asyncio.sleep(0.01)
+
+
+#----------------------------------------------------------------------------#
+# Application.
+#----------------------------------------------------------------------------#
+
+database = Database(postgres_dsn(app.config['SQLALCHEMY_DATABASE_URI']), app.config['ASYNC_POOL_SIZE'])
+executor = ThreadPoolExecutor(app.config['ASGI_WSGI_THREADS'], thread_name_prefix='wsgi')
+urls = app.url_map.bind('localhost')
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_response(response, environ, send):
+    status, headers = response.get_wsgi_response(environ)[1:]
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+    })
+    body = b'' if environ['REQUEST_METHOD'] == 'HEAD' else response.get_data()
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await database.start()
+            except Exception as error:
+                await send({'type': 'lifespan.startup.failed', 'message': str(error)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await database.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise ValueError(f"unsupported ASGI scope {scope['type']!r}")
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    try:
+        endpoint, view_args = urls.match(scope['path'], scope['method'])
+    except Exception:  # unknown URL, wrong method, redirect: Flask answers
+        endpoint, view_args = None, {}
+    view = ASYNC_VIEWS.get(endpoint)
+    if view is not None:
+        try:
+            response = await view(Request(environ), **view_args)
+        except NotFound:
+            response = None
+        except Exception:
+            app.logger.exception(f"{scope['method']} {scope['path']} failed")
+            response = Response('Internal Server Error', status=500, mimetype='text/plain')
+        if response is not None:
+            return await send_response(response, environ, send)
+    await call_wsgi(app, environ, send)
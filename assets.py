@@ -0,0 +1,194 @@
+"""Fingerprinted, precompressed static assets (``flask fyyur assets build``).
+
+`Assets.build` writes everything under ``static/`` to ``static/dist/``:
+
+* the bundles in `BUNDLES`, their sources concatenated in order and
+  minified (sources already ending in ``.min.css`` / ``.min.js`` are taken
+  as they are);
+* a copy of every other static file.
+
+Each output is named after a hash of its content (``main.3f9c0e12ab.css``),
+so a changed file gets a new URL and an unchanged one keeps its old URL.
+The ``url()`` references of the bundled CSS point at the hashed copies.
+Text files also get ``.gz`` and ``.br`` variants, compressed once at the
+highest levels. ``manifest.json`` maps each bundle and each static path to
+its output.
+
+Templates link to them through `asset_urls` (bundles) and `asset_url`
+(single files). Without a build both fall back to the plain static files,
+so a checkout works as it is. `send` serves ``static/dist`` with a
+year-long, immutable Cache-Control and the best precompressed variant the
+client accepts.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # without it, builds have no .br variants
+    brotli = None
+
+# name -> sources under static/, in order
+BUNDLES = {
+    'main.css': ('css/bootstrap.min.css', 'css/font-awesome.css', 'css/layout.main.css', 'css/main.css',
+                 'css/main.responsive.css', 'css/main.quickfix.css'),
+    # modernizr has to run before the page renders
+    'head.js': ('js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'),
+    'main.js': ('js/libs/jquery-1.11.1.min.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js', 'js/script.js'),
+}
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 10
+COMPRESSIBLE = ('.css', '.js', '.json', '.map', '.svg', '.eot', '.ttf', '.otf', '.txt')
+# the precompressed variants built and served, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def minify_css(text):
+    text = re.sub(r'/\*(?!!).*?\*/', '', text, flags=re.S)  # comments, except /*! licences
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r' ?([{};,>]) ?', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    # whitespace only: indentation, blank lines and whole-line // comments go,
+    # nothing inside a line is touched, so it is safe without a JS parser
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def hashed_name(path, content):
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{extension}'
+
+
+class Assets(object):
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.dist_folder = os.path.join(static_folder, DIST)
+        self._manifest, self._manifest_mtime = {}, None
+
+    def manifest(self):
+        """The manifest of the last build, reread when a build replaces it."""
+        try:
+            mtime = os.stat(os.path.join(self.dist_folder, MANIFEST)).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            if mtime is None:
+                self._manifest = {}
+            else:
+                with open(os.path.join(self.dist_folder, MANIFEST), encoding='utf-8') as source:
+                    self._manifest = json.load(source)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def asset_url(self, path):
+        """The URL of a static file: its hashed copy once built."""
+        built = self.manifest().get(path)
+        if built is None:
+            return url_for('static', filename=path)
+        return url_for('static', filename=f'{DIST}/{built}')
+
+    def asset_urls(self, bundle):
+        """The URLs to load for a bundle: the bundle once built, else its sources."""
+        built = self.manifest().get(bundle)
+        if built is None:
+            return [url_for('static', filename=path) for path in BUNDLES[bundle]]
+        return [url_for('static', filename=f'{DIST}/{built}')]
+
+    def send(self, filename):
+        """A response for a file of static/dist, precompressed if the client accepts it."""
+        encodings = request.accept_encodings
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding in ENCODINGS:
+            if encodings[encoding] and os.path.isfile(os.path.join(self.dist_folder, filename + SUFFIXES[encoding])):
+                response = send_from_directory(self.dist_folder, filename + SUFFIXES[encoding], mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist_folder, filename, mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    def build(self, clean=False):
+        """Writes static/dist and its manifest; returns the manifest."""
+        if clean and os.path.isdir(self.dist_folder):
+            shutil.rmtree(self.dist_folder)
+        manifest = {}
+        for path in self.static_files():
+            with open(os.path.join(self.static_folder, path), 'rb') as source:
+                manifest[path] = self.write(path, source.read())
+        for bundle, sources in BUNDLES.items():
+            if bundle.endswith('.css'):
+                parts = [self.bundle_css(path, manifest) for path in sources]
+                content = '\n'.join(parts)
+            else:
+                # ; so that a source without a final semicolon can't run into the next
+                content = ';\n'.join(self.read_source(path, minify_js) for path in sources)
+            manifest[bundle] = self.write(bundle, content.encode('utf-8'))
+        # the manifest goes last: until it is replaced, pages keep linking to the previous build
+        temporary = os.path.join(self.dist_folder, MANIFEST + '.tmp')
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump(manifest, target, indent=2, sort_keys=True)
+        os.replace(temporary, os.path.join(self.dist_folder, MANIFEST))
+        return manifest
+
+    def static_files(self):
+        for directory, subdirectories, files in os.walk(self.static_folder):
+            if directory == self.static_folder and DIST in subdirectories:
+                subdirectories.remove(DIST)
+            for name in files:
+                if not name.startswith('.'):
+                    yield os.path.relpath(os.path.join(directory, name), self.static_folder).replace(os.sep, '/')
+
+    def read_source(self, path, minify):
+        with open(os.path.join(self.static_folder, path), encoding='utf-8') as source:
+            text = source.read()
+        return text if '.min.' in os.path.basename(path) else minify(text)
+
+    def bundle_css(self, path, manifest):
+        # url()s are relative to the source; they are rewritten relative to
+        # static/dist, to the hashed copy when the file exists
+        def rewrite(match):
+            quote, url = match.groups()
+            if re.match(r'[a-z]+:|/|#', url):
+                return match.group(0)
+            target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+            resolved = os.path.normpath(os.path.join(os.path.dirname(path), target)).replace(os.sep, '/')
+            built = manifest.get(resolved)
+            return f'url({quote}{built + suffix if built else "../" + resolved + suffix}{quote})'
+        return CSS_URL.sub(rewrite, self.read_source(path, minify_css))
+
+    def write(self, path, content):
+        name = hashed_name(path, content)
+        target = os.path.join(self.dist_folder, name)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as output:
+                output.write(content)
+            if path.endswith(COMPRESSIBLE):
+                # mtime=0 so the same content always compresses to the same bytes
+                self.write_variant(target + '.gz', content, gzip.compress(content, 9, mtime=0))
+                if brotli is not None:
+                    self.write_variant(target + '.br', content, brotli.compress(content, quality=11))
+        return name
+
+    @staticmethod
+    def write_variant(target, content, compressed):
+        if len(compressed) < len(content) * 0.9:
+            with open(target, 'wb') as output:
+                output.write(compressed)
@@ -0,0 +1,137 @@
+"""The /api/v1 read routes under gunicorn (WSGI, app:app) and uvicorn (ASGI, asgi:application).
+
+Both servers are started on the configured database with the same number
+of worker processes. Each is then sent the same mix of API requests (venue
+and artist pages, listings, searches) at several concurrency levels.
+Reported per server and level: requests per second and p50/p99 latency.
+The database is only read, so run ``flask fyyur seed`` first for a
+realistic dataset:
+
+    python benchmarks/asgi_vs_wsgi.py --workers 2 --concurrency 1,16,64
+
+gunicorn runs sync workers with --threads, the way app.py is deployed.
+Requests go out over fresh connections with ``Connection: close``, as sync
+workers don't keep connections alive.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+warnings.simplefilter('ignore')
+from app import app, db, Venue, Artist
+
+WORDS = ('blue', 'hall', 'the gold', 'velvt', 'jazz', 'new york', 'foxes', 'ray')
+
+
+def request_paths(count, seed=1):
+    with app.app_context():
+        venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id)]
+        artist_ids = [artist_id for (artist_id,) in db.session.query(Artist.id)]
+    if not venue_ids or not artist_ids:
+        sys.exit('no venues or artists to request; run `flask fyyur seed` first')
+    rng = random.Random(seed)
+    drivers = (
+        lambda: f'/api/v1/venues/{rng.choice(venue_ids)}',
+        lambda: f'/api/v1/artists/{rng.choice(artist_ids)}',
+        lambda: '/api/v1/venues',
+        lambda: '/api/v1/shows',
+        lambda: f'/api/v1/artists/search?search_term={rng.choice(WORDS).replace(" ", "+")}',
+    )
+    return [rng.choice(drivers)() for _ in range(count)]
+
+
+def start_server(kind, port, workers, threads):
+    if kind == 'wsgi':
+        command = ['gunicorn', '--workers', str(workers), '--threads', str(threads),
+                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app']
+    else:
+        command = ['uvicorn', '--workers', str(workers), '--port', str(port),
+                   '--log-level', 'warning', 'asgi:application']
+    return subprocess.Popen(command, cwd=ROOT)
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def wait_until_up(server, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await fetch(port, '/api/v1/venues?limit=1')
+        except OSError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def drive(port, paths, concurrency):
+    latencies, statuses = [], set()
+    remaining = iter(paths)
+
+    async def client():
+        for path in remaining:
+            started = time.perf_counter()
+            statuses.add(await fetch(port, path))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'concurrency': concurrency,
+        'requests_per_second': round(len(paths) / elapsed, 1),
+        'p50_ms': round(quantiles[49] * 1000, 2),
+        'p99_ms': round(quantiles[98] * 1000, 2),
+        'statuses': sorted(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=2, help='processes per server (default %(default)s)')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker (default %(default)s)')
+    parser.add_argument('--concurrency', default='1,8,32,128', help='comma separated client counts')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per level (default %(default)s)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='where to write the JSON results')
+    args = parser.parse_args()
+
+    paths = request_paths(args.requests)
+    results = {'workers': args.workers, 'threads': args.threads, 'requests': args.requests, 'servers': {}}
+    for kind in ('wsgi', 'asgi'):
+        server = start_server(kind, args.port, args.workers, args.threads)
+        try:
+            asyncio.run(wait_until_up(server, args.port))
+            results['servers'][kind] = levels = []
+            for concurrency in (int(level) for level in args.concurrency.split(',')):
+                levels.append(asyncio.run(drive(args.port, paths, concurrency)))
+                level = levels[-1]
+                print(f"{kind}  {concurrency:4} clients  {level['requests_per_second']:8.1f} req/s"
+                      f"  p50 {level['p50_ms']:8.2f} ms  p99 {level['p99_ms']:8.2f} ms  {level['statuses']}")
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, 'w') as target:
+            json.dump(results, target, indent=2)
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Bytes saved against CPU spent by response compression (compression.py), per route.
+
+The database is emptied and seeded (``seed.seed`` with a fixed random seed),
+then each GET route of benchmarks/routes.py is requested uncompressed
+through the Flask test client. The bodies are compressed the way the
+middleware does it at each gzip level and brotli quality given (a whole
+body at once, or chunk by chunk with a flush after each for a streamed
+response like the exports):
+
+    python benchmarks/compression.py --yes --settings gzip:1,gzip:6,gzip:9,br:4,br:11
+
+Reported per route and setting: the mean response size before and after,
+the share saved, and the CPU time to compress one response. Bodies under
+COMPRESSION_MIN_SIZE are counted as sent uncompressed, as they would be. Brotli
+settings are skipped unless Brotli is installed.
+
+This TRUNCATES the venue, artist and show tables of the configured
+database (config.SQLALCHEMY_DATABASE_URI), hence ``--yes``.
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.simplefilter('ignore')
+from app import app, db, Venue, Artist, page_cache
+from compression import ENCODINGS, BrotliStream, GzipStream
+from routes import Drivers
+from seed import seed
+
+SETTINGS = 'gzip:1,gzip:6,gzip:9,br:4,br:11'
+
+
+def fetch(client, drive, requests):
+    """The bodies of a route's responses, as lists of the chunks sent, and whether they were streamed."""
+    bodies, streamed = [], False
+    for _ in range(requests):
+        method, url, data = drive()
+        response = client.get(url, buffered=False)
+        bodies.append([chunk for chunk in response.response if chunk])
+        streamed = response.headers.get('Content-Length') is None
+        response.close()
+    return bodies, streamed
+
+
+def compress(bodies, streamed, encoding, level, min_size):
+    """Mean size sent and CPU milliseconds per body; those under min_size are sent as they are."""
+    sizes, times = [], []
+    for chunks in bodies:
+        if not streamed and sum(len(chunk) for chunk in chunks) < min_size:
+            sizes.append(sum(len(chunk) for chunk in chunks))
+            times.append(0)
+            continue
+        started = time.process_time()
+        stream = BrotliStream(level) if encoding == 'br' else GzipStream(level)
+        size = sum(len(stream.compress(chunk, flush=streamed)) for chunk in chunks) + len(stream.finish())
+        times.append((time.process_time() - started) * 1000)
+        sizes.append(size)
+    return statistics.mean(sizes), statistics.mean(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', default='1000:2000:20000', help='venues:artists:shows (default %(default)s)')
+    parser.add_argument('--requests', type=int, default=20, help='responses per route (default %(default)s)')
+    parser.add_argument('--settings', default=SETTINGS,
+                        help='comma separated encoding:level to compare (default %(default)s)')
+    parser.add_argument('--yes', action='store_true', help='confirm that the configured database may be emptied')
+    args = parser.parse_args()
+    if not args.yes:
+        parser.error(f"this empties the venue, artist and show tables of {app.config['SQLALCHEMY_DATABASE_URI']}; "
+                     f"pass --yes to go ahead")
+    settings = [(encoding, int(level)) for encoding, level in
+                (setting.split(':') for setting in args.settings.split(','))]
+    if any(encoding not in ENCODINGS for encoding, _ in settings):
+        print(f"not installed, skipped: {', '.join(sorted({e for e, _ in settings} - set(ENCODINGS)))}")
+        settings = [(encoding, level) for encoding, level in settings if encoding in ENCODINGS]
+
+    app.logger.setLevel(logging.ERROR)
+    page_cache.backend = None
+    venues, artists, shows = (int(count) for count in args.size.split(':'))
+    with app.app_context():
+        seed(venues, artists, shows, random_seed=1, reset=True, out=open(os.devnull, 'w'))
+        venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id)]
+        artist_ids = [artist_id for (artist_id,) in db.session.query(Artist.id)]
+        last_show_id = db.session.execute('SELECT coalesce(max(id), 0) FROM shows').scalar()
+    drivers = Drivers(random.Random(2), venue_ids, artist_ids, last_show_id)
+    client = app.test_client()
+
+    print(f"{venues}:{artists}:{shows}, {args.requests} responses per route")
+    print(f"  {'route':22} {'setting':8} {'bytes':>9} {'sent':>9} {'saved':>6} {'cpu ms':>8}")
+    totals = {setting: [0, 0, 0] for setting in settings}  # plain bytes, sent bytes, cpu ms
+    for endpoint in sorted({rule.endpoint for rule in app.url_map.iter_rules() if 'GET' in rule.methods}):
+        drive = getattr(drivers, endpoint, None)
+        if drive is None:
+            continue
+        bodies, streamed = fetch(client, drive, args.requests)
+        plain = statistics.mean(sum(len(chunk) for chunk in chunks) for chunks in bodies)
+        for encoding, level in settings:
+            sent, cpu_ms = compress(bodies, streamed, encoding, level, app.config['COMPRESSION_MIN_SIZE'])
+            print(f"  {endpoint:22} {encoding}:{level:<{6 - len(encoding)}} {plain:9.0f} {sent:9.0f}"
+                  f" {1 - sent / plain if plain else 0:6.1%} {cpu_ms:8.3f}")
+            totals[(encoding, level)] = [total + value for total, value in
+                                         zip(totals[(encoding, level)], (plain, sent, cpu_ms))]
+    print('\nall routes, one response each:')
+    for (encoding, level), (plain, sent, cpu_ms) in totals.items():
+        print(f"  {encoding}:{level:<{6 - len(encoding)}} {plain / 1024:8.0f} KiB -> {sent / 1024:6.0f} KiB"
+              f" ({1 - sent / plain:.1%} saved) for {cpu_ms:7.2f} ms CPU,"
+              f" {(plain - sent) / 1024 / cpu_ms if cpu_ms else 0:6.1f} KiB saved per CPU ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Microbenchmark of the templates' datetime filter.
+
+Compares the previous filter (a string from strftime, re-parsed with
+dateutil, then babel.dates.format_datetime) with formatting.DateTimeFormatter
+on the 2,000 tiles of a large /shows page, rendered cold and then again.
+
+    python benchmarks/datetime_filter.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from formatting import DateTimeFormatter
+
+SHOWS = 2000
+PATTERN = "EEEE MMMM, d, y 'at' h:mma"
+
+
+def previous_filter(value, format='full'):
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, PATTERN, locale='en_US')
+
+
+def main():
+    start = datetime(2026, 1, 1, 20, 0)
+    times = [start + timedelta(hours=7 * i) for i in range(SHOWS)]
+    strings = [time.strftime('%Y-%m-%d %H:%M:%S') for time in times]
+
+    formatter = DateTimeFormatter('en_US')
+    assert [formatter(time, 'full') for time in times] == [previous_filter(string) for string in strings]
+
+    def previous():
+        for string in strings:
+            previous_filter(string)
+
+    def cold():
+        formatter.format.cache_clear()
+        for time in times:
+            formatter(time, 'full')
+
+    def warm():
+        for time in times:
+            formatter(time, 'full')
+
+    runs = 5
+    baseline = min(timeit.repeat(previous, number=1, repeat=runs))
+    print(f'{SHOWS} values per render, best of {runs}')
+    print(f'  strftime + dateutil + babel  {baseline * 1000:8.2f} ms')
+    for name, run in (('formatter, cold cache', cold), ('formatter, warm cache', warm)):
+        best = min(timeit.repeat(run, number=1, repeat=runs))
+        print(f'  {name:27}  {best * 1000:8.2f} ms  ({baseline / best:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
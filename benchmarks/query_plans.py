@@ -0,0 +1,164 @@
+"""Checks that the hot queries of app.py use indexes, at a seeded scale.
+
+The database is emptied and seeded (``seed.seed``, fixed random seed), the
+tables are ANALYZEd, and each query below is EXPLAINed as the app builds
+it: a venue's and an artist's page, their API versions, the /venues,
+/artists and /shows listings (first and deep pages), roll-shows, the
+booking conflict check and free slots of a new show, /venues/nearby, and
+the ?genre= filters of the listings, search and facet counts (the unfiltered
+facet counts read every row by design, and are cached). A query whose plan
+reads venue, artist, bookings or a non-empty partition of shows with a
+sequential scan fails the check, as does a /shows page that reads the
+partition of a past month; the script then exits non-zero:
+
+    python benchmarks/query_plans.py --yes --size 2000:4000:100000
+
+tests/test_query_plans.py runs the same check at a smaller scale.
+
+Like benchmarks/routes.py this TRUNCATES the venue, artist and show tables
+of the configured database, hence ``--yes``. ``--verbose`` prints every
+plan.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import warnings
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.simplefilter('ignore')
+from app import (app, db, Venue, Artist, Show, AREA_KEY, SHOW_KEY, venue_areas_query, show_listing_query,
+                 page_shows_query, detail_version_query, booking_conflict_query, free_slots_query,
+                 nearby_venues_query, search_engine, genre_facets)
+from facets import filter_genres
+from pagination import encode_cursor, keyset
+from seed import seed
+
+# the tables checked, shows including its partitions and the archive's
+TABLES = re.compile(r'^(venue|artist|bookings|shows(_\w+)?)$')
+MONTH_PARTITION = re.compile(r'^shows_p(\d{4})_(\d{2})$')
+# the listings of upcoming shows, which must leave past months' partitions alone
+UPCOMING = ('/shows', '/shows deep page')
+
+
+def middle(query, columns):
+    # a cursor halfway through a listing, to plan a deep page
+    count = query.order_by(None).count()
+    row = query.order_by(*columns).offset(count // 2).first()
+    return encode_cursor('next', [getattr(row, column.key) for column in columns])
+
+
+def past_partition(relation, now):
+    match = MONTH_PARTITION.match(relation or '')
+    return match is not None and (int(match.group(1)), int(match.group(2))) < (now.year, now.month)
+
+
+def typical(foreign_key):
+    # the venue or artist with the median number of shows
+    counts = db.session.query(foreign_key.label('id'), db.func.count().label('shows')).group_by(foreign_key).subquery()
+    total = db.session.query(counts).count()
+    return db.session.query(counts.c.id).order_by(counts.c.shows, counts.c.id).offset(total // 2).limit(1).scalar()
+
+
+def plans():
+    """(name, query) of every query to check."""
+    venue_id, artist_id = typical(Show.venue_id), typical(Show.artist_id)
+    artists_key = (Artist.name, Artist.id)
+    artists_query = db.session.query(Artist.id, Artist.name)
+    crossed = db.and_(Show.counted_as_upcoming, Show.start_time <= datetime.now())
+    here = Venue.query.get(venue_id)
+    # the least common genre, the case where the GIN index beats reading in sort order
+    rare = (genre_facets.query(Venue).all()[-1].genre,)
+    evening = datetime.now().replace(hour=20, minute=0, second=0, microsecond=0) + timedelta(days=7)
+    return [
+        ('venue page shows', page_shows_query(Venue, venue_id)),
+        ('artist page shows', page_shows_query(Artist, artist_id)),
+        ('venue version', detail_version_query(Venue, venue_id)),
+        ('artist version', detail_version_query(Artist, artist_id)),
+        ('/venues', keyset(venue_areas_query(), AREA_KEY)[0]),
+        ('/venues deep page', keyset(venue_areas_query(), AREA_KEY, middle(venue_areas_query(), AREA_KEY))[0]),
+        ('/artists', keyset(artists_query, artists_key)[0]),
+        ('/artists deep page', keyset(artists_query, artists_key, middle(artists_query, artists_key))[0]),
+        ('/shows', keyset(show_listing_query(), SHOW_KEY)[0]),
+        ('/shows deep page', keyset(show_listing_query(), SHOW_KEY, middle(show_listing_query(), SHOW_KEY))[0]),
+        ('roll-shows', Show.query.filter(crossed).with_entities(Show.id)),
+        ('booking conflict', booking_conflict_query(venue_id, artist_id, evening, evening + timedelta(hours=2))),
+        ('free slots', free_slots_query([venue_id], evening, evening + timedelta(days=30))),
+        ('/venues/nearby', nearby_venues_query(here.latitude, here.longitude, app.config['NEARBY_RADIUS_KM'])),
+        ('/venues?genre=', keyset(venue_areas_query(rare), AREA_KEY)[0]),
+        ('/artists?genre=', keyset(filter_genres(artists_query, Artist.genres, rare), artists_key)[0]),
+        ('search ?genre=', search_engine.hits_query('artist', '', rare)[0]),
+        ('genre facets', genre_facets.query(Artist, rare)),
+    ]
+
+
+def explain(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    cursor = db.session.connection().connection.cursor()
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + compiled.string, compiled.params)
+    return cursor.fetchone()[0][0]['Plan']
+
+
+def scans(plan):
+    """(node type, relation, index) of every node of the plan that reads a table or index."""
+    if 'Relation Name' in plan or 'Index Name' in plan:
+        yield plan['Node Type'], plan.get('Relation Name'), plan.get('Index Name')
+    for child in plan.get('Plans', ()):
+        yield from scans(child)
+
+
+def analyze():
+    """ANALYZE the checked tables; returns the relations left empty."""
+    db.session.execute('ANALYZE venue, artist, shows, shows_archive, bookings')
+    return {relation for (relation,) in db.session.execute("SELECT relname FROM pg_class WHERE reltuples = 0")}
+
+
+def check(name, read, empty, now):
+    """The tables read with a sequential scan, and the past months read by an upcoming listing.
+
+    A sequential scan is the right plan for an empty partition (e.g. a future
+    month), so those in ``empty`` are let through.
+    """
+    sequential = sorted({relation for node, relation, index in read
+                         if node == 'Seq Scan' and TABLES.match(relation) and relation not in empty})
+    past = sorted({relation for node, relation, index in read if name in UPCOMING and past_partition(relation, now)})
+    return sequential, past
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', default='2000:4000:100000', help='venues:artists:shows (default %(default)s)')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    parser.add_argument('--yes', action='store_true', help='confirm that the configured database may be emptied')
+    args = parser.parse_args()
+    if not args.yes:
+        parser.error(f"this empties the venue, artist and show tables of {app.config['SQLALCHEMY_DATABASE_URI']}; "
+                     f"pass --yes to go ahead")
+
+    venues, artists, shows = (int(count) for count in args.size.split(':'))
+    failed = []
+    with app.app_context():
+        seed(venues, artists, shows, random_seed=1, reset=True)
+        empty = analyze()
+        for name, query in plans():
+            plan = explain(query)
+            read = list(scans(plan))
+            sequential, past = check(name, read, empty, datetime.now())
+            print(f"{'FAIL' if sequential or past else 'ok':4}  {name:20} "
+                  + ', '.join(node + (f' on {relation}' if relation else '') + (f' using {index}' if index else '')
+                              for node, relation, index in read))
+            if past:
+                print(f"      reads past months: {', '.join(past)}")
+            if args.verbose:
+                print(json.dumps(plan, indent=2))
+            if sequential or past:
+                failed.append(name)
+        db.session.rollback()
+    if failed:
+        sys.exit(f"sequential scans in: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
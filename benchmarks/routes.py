@@ -0,0 +1,330 @@
+"""Route-level benchmark: every route of app.py at several dataset sizes.
+
+For each size the database is emptied and re-seeded (``seed.seed`` with a
+fixed random seed), then every route is requested through the Flask test
+client. Reported per route: p50/p95/p99 latency and the statements per
+request (read from the Server-Timing header); per size: the process's
+peak RSS. Results are written as JSON, and ``--compare`` prints the change
+against an earlier run, e.g. of the previous commit:
+
+    python benchmarks/routes.py --yes --output after.json --compare before.json
+
+This TRUNCATES the venue, artist and show tables of the configured
+database (config.SQLALCHEMY_DATABASE_URI), hence ``--yes``. The page cache
+is turned off unless ``--cache`` is given, so the numbers measure the work
+a route does rather than a cache hit. Every route needs a method of
+`Drivers` named after its endpoint; the run stops before seeding when one
+is missing. Static files are left out, except the built bundles (the
+assets are built first if they aren't).
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.simplefilter('ignore')
+from app import app, db, Venue, Artist, page_cache, assets
+from geo import read_geocodes
+from seed import seed, GENRES
+
+SIZES = '100:200:2000,1000:2000:20000,5000:10000:200000'
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def venue_form(rng):
+    return {'name': f'Bench Venue {rng.random():.6f}', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+            'phone': '512-555-0100', 'genres': rng.sample(GENRES, 2), 'facebook_link': 'https://www.facebook.com/x',
+            'image_link': 'https://example.com/v.png', 'website': 'https://example.com', 'seeking_description': ''}
+
+
+def artist_form(rng):
+    return {'name': f'Bench Artist {rng.random():.6f}', 'city': 'Austin', 'state': 'TX', 'phone': '512-555-0101',
+            'genres': rng.sample(GENRES, 2), 'facebook_link': 'https://www.facebook.com/y',
+            'image_link': 'https://example.com/a.png', 'website': 'https://example.com', 'seeking_description': ''}
+
+
+class Drivers(object):
+    """One request per call for each endpoint: ``(method, url, form data)``."""
+
+    def __init__(self, rng, venue_ids, artist_ids, last_show_id):
+        self.rng = rng
+        self.venue_ids = venue_ids
+        self.artist_ids = artist_ids
+        self.last_show_id = last_show_id
+        # the city centres the seeded venues are scattered around
+        self.centres = [(row['latitude'], row['longitude']) for row in read_geocodes()]
+
+    def _venue(self):
+        return self.rng.choice(self.venue_ids)
+
+    def _artist(self):
+        return self.rng.choice(self.artist_ids)
+
+    def _word(self):
+        return self.rng.choice(('blue', 'hall', 'the gold', 'velvt', 'jazz', 'new york', 'foxes', 'ray'))
+
+    def _near(self):
+        latitude, longitude = self.rng.choice(self.centres)
+        return f'lat={latitude:.4f}&lng={longitude:.4f}&radius={self.rng.choice((2, 10, 50))}'
+
+    def _genre(self):
+        return self.rng.choice(GENRES)
+
+    def index(self):
+        return 'GET', '/', None
+
+    def venues(self):
+        return 'GET', '/venues', None
+
+    def search_venues(self):
+        return 'POST', '/venues/search', {'search_term': self._word()}
+
+    def show_venue(self):
+        return 'GET', f'/venues/{self._venue()}', None
+
+    def create_venue_form(self):
+        return 'GET', '/venues/create', None
+
+    def create_venue_submission(self):
+        return 'POST', '/venues/create', venue_form(self.rng)
+
+    def delete_venue(self):
+        # a fresh venue each time, so the seeded data stays put
+        with app.app_context():
+            venue = Venue(name='Bench Throwaway', city='Austin', state='TX', genres=['Jazz'])
+            db.session.add(venue)
+            db.session.commit()
+            venue_id = venue.id
+        return 'DELETE', f'/venues/{venue_id}', None
+
+    def artists(self):
+        return 'GET', '/artists', None
+
+    def search_artists(self):
+        return 'POST', '/artists/search', {'search_term': self._word()}
+
+    def show_artist(self):
+        return 'GET', f'/artists/{self._artist()}', None
+
+    def edit_artist(self):
+        return 'GET', f'/artists/{self._artist()}/edit', None
+
+    def edit_artist_submission(self):
+        return 'POST', f'/artists/{self._artist()}/edit', artist_form(self.rng)
+
+    def edit_venue(self):
+        return 'GET', f'/venues/{self._venue()}/edit', None
+
+    def edit_venue_submission(self):
+        return 'POST', f'/venues/{self._venue()}/edit', venue_form(self.rng)
+
+    def create_artist_form(self):
+        return 'GET', '/artists/create', None
+
+    def create_artist_submission(self):
+        return 'POST', '/artists/create', artist_form(self.rng)
+
+    def shows(self):
+        return 'GET', '/shows', None
+
+    def create_shows(self):
+        return 'GET', '/shows/create', None
+
+    def create_show_submission(self):
+        start_time = datetime.now() + timedelta(days=self.rng.randint(-30, 90))
+        return 'POST', '/shows/create', {'venue_id': self._venue(), 'artist_id': self._artist(),
+                                         'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def export(self):
+        # the newest thousand shows; a full export is measured by its size alone
+        return 'GET', f'/export/shows.csv?since={max(0, self.last_show_id - 1000)}', None
+
+    def api_venues(self):
+        return 'GET', '/api/v1/venues', None
+
+    def api_search_venues(self):
+        return 'GET', f'/api/v1/venues/search?search_term={self._word()}', None
+
+    def api_venue(self):
+        return 'GET', f'/api/v1/venues/{self._venue()}', None
+
+    def api_search_artists(self):
+        return 'GET', f'/api/v1/artists/search?search_term={self._word()}', None
+
+    def api_artist(self):
+        return 'GET', f'/api/v1/artists/{self._artist()}', None
+
+    def api_shows(self):
+        return 'GET', '/api/v1/shows', None
+
+    def api_venue_free_slots(self):
+        start = datetime.now().date() + timedelta(days=self.rng.randint(0, 60))
+        return 'GET', f'/api/v1/venues/{self._venue()}/free-slots?start={start}&end={start + timedelta(days=7)}' \
+                      f'&min_minutes=120', None
+
+    def nearby(self):
+        return 'GET', f'/venues/nearby?{self._near()}', None
+
+    def api_nearby_venues(self):
+        return 'GET', f'/api/v1/venues/nearby?{self._near()}', None
+
+    def api_venue_genres(self):
+        return 'GET', f'/api/v1/venues/genres?genre={self._genre()}', None
+
+    def api_artist_genres(self):
+        return 'GET', f'/api/v1/artists/genres?genre={self._genre()}', None
+
+    def api_suggest(self):
+        return 'GET', f"/api/v1/suggest?type={self.rng.choice(('artist', 'venue'))}&q={self._word()[:3]}", None
+
+    def built_asset(self):
+        if not assets.manifest():
+            assets.build()
+        return 'GET', f"/static/dist/{assets.manifest()[self.rng.choice(('main.css', 'main.js'))]}", None
+
+    def metrics_endpoint(self):
+        return 'GET', '/metrics', None
+
+    def cache_stats(self):
+        return 'GET', '/_debug/cache', None
+
+    def fragment_stats(self):
+        return 'GET', '/_debug/fragments', None
+
+    def job_stats(self):
+        return 'GET', '/_debug/jobs', None
+
+    def request_log(self):
+        return 'GET', '/_debug/requests', None
+
+
+def percentile(quantiles, p):
+    return round(quantiles[p - 1] * 1000, 3)
+
+
+def run_route(client, drive, requests):
+    latencies, queries, statuses = [], [], set()
+    for _ in range(requests):
+        method, url, data = drive()
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        response.get_data()
+        latencies.append(time.perf_counter() - started)
+        statuses.add(response.status_code)
+        timing = QUERIES.search(', '.join(response.headers.getlist('Server-Timing')))
+        if timing:
+            queries.append(int(timing.group(1)))
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': requests,
+        'p50_ms': percentile(quantiles, 50),
+        'p95_ms': percentile(quantiles, 95),
+        'p99_ms': percentile(quantiles, 99),
+        'queries': round(statistics.mean(queries), 1) if queries else None,
+        'statuses': sorted(statuses),
+    }
+
+
+def run_size(venues, artists, shows, requests):
+    with app.app_context():
+        seed(venues, artists, shows, random_seed=1, reset=True, out=open(os.devnull, 'w'))
+        venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id)]
+        artist_ids = [artist_id for (artist_id,) in db.session.query(Artist.id)]
+        last_show_id = db.session.execute('SELECT coalesce(max(id), 0) FROM shows').scalar()
+    drivers = Drivers(random.Random(2), venue_ids, artist_ids, last_show_id)
+    client = app.test_client()
+    routes = {}
+    for endpoint in endpoints():
+        routes[endpoint] = run_route(client, getattr(drivers, endpoint), requests)
+        print(f"  {endpoint:26} p50 {routes[endpoint]['p50_ms']:8.2f} ms  p95 {routes[endpoint]['p95_ms']:8.2f} ms"
+              f"  p99 {routes[endpoint]['p99_ms']:8.2f} ms  {routes[endpoint]['queries']} queries")
+    return {
+        'venues': venues, 'artists': artists, 'shows': shows,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'routes': routes,
+    }
+
+
+def endpoints():
+    return sorted({rule.endpoint for rule in app.url_map.iter_rules()} - {'static'})
+
+
+def compare(results, baseline):
+    print(f"\nagainst {baseline.get('commit', '?')} (p95, queries):")
+    old_sizes = {(size['venues'], size['artists'], size['shows']): size for size in baseline['sizes']}
+    for size in results['sizes']:
+        old = old_sizes.get((size['venues'], size['artists'], size['shows']))
+        if old is None:
+            continue
+        print(f"  {size['venues']}:{size['artists']}:{size['shows']}")
+        for endpoint, route in size['routes'].items():
+            before = old['routes'].get(endpoint)
+            if before is None:
+                continue
+            change = route['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+            print(f"    {endpoint:26} {before['p95_ms']:8.2f} -> {route['p95_ms']:8.2f} ms ({change:+.0%})"
+                  f"  {before['queries']} -> {route['queries']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=SIZES, help='comma separated venues:artists:shows (default %(default)s)')
+    parser.add_argument('--requests', type=int, default=50, help='requests per route (default %(default)s)')
+    parser.add_argument('--cache', action='store_true', help='keep the page cache on')
+    parser.add_argument('--output', help='where to write the JSON results (default routes-<commit>.json)')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--yes', action='store_true', help='confirm that the configured database may be emptied')
+    args = parser.parse_args()
+    if not args.yes:
+        parser.error(f"this empties the venue, artist and show tables of {app.config['SQLALCHEMY_DATABASE_URI']}; "
+                     f"pass --yes to go ahead")
+
+    missing = [endpoint for endpoint in endpoints() if not hasattr(Drivers, endpoint)]
+    if missing:
+        parser.error(f"no driver for: {', '.join(missing)}; add a method to Drivers for each")
+
+    app.logger.setLevel(logging.ERROR)
+    app.config['DEBUG_ENDPOINTS'] = True
+    if not args.cache:
+        page_cache.backend = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+
+    results = {
+        'commit': commit or None,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'requests_per_route': args.requests,
+        'page_cache': args.cache,
+        'sizes': [],
+    }
+    for size in args.sizes.split(','):
+        venues, artists, shows = (int(count) for count in size.split(':'))
+        print(f'{venues} venues, {artists} artists, {shows} shows')
+        results['sizes'].append(run_size(venues, artists, shows, args.requests))
+
+    output = args.output or f"routes-{commit or 'results'}.json"
+    with open(output, 'w') as target:
+        json.dump(results, target, indent=2)
+    print(f'results written to {output}')
+    if args.compare:
+        with open(args.compare) as source:
+            compare(results, json.load(source))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Build time, memory and lookup latency of the typeahead index (suggest.py).
+
+Artist names are generated the way ``flask fyyur seed`` makes them, no
+database needed. The index is built from them, then it is timed on
+random prefixes of one to six characters of those names, and on adding
+and removing names:
+
+    python benchmarks/suggest.py --names 1000000
+
+Memory is what the built index holds, names included, traced with
+tracemalloc in a second build; the first build, untraced, gives the build
+time.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.simplefilter('ignore')
+from seed import artist_rows, popularity, GENRES
+from suggest import SuggestIndex
+
+
+def build(names):
+    def load(kind):
+        # fresh copies of the names, as rows read from the database would be
+        return ((entity_id, name.encode().decode()) for entity_id, name in names) if kind == 'artist' else ()
+    index = SuggestIndex(load, refresh_interval=None)
+    started = time.perf_counter()
+    index.start()
+    index._ready.wait()
+    return index, time.perf_counter() - started
+
+
+def timed(calls):
+    """p50 and p99 in microseconds of each call."""
+    times = []
+    for call, args in calls:
+        started = time.perf_counter()
+        call(*args)
+        times.append((time.perf_counter() - started) * 1e6)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--names', type=int, default=1000000, help='artist names indexed (default %(default)s)')
+    parser.add_argument('--lookups', type=int, default=10000, help='lookups timed (default %(default)s)')
+    parser.add_argument('--writes', type=int, default=1000, help='names added and removed (default %(default)s)')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    names = [(i, row['name']) for i, row in
+             enumerate(artist_rows(rng, args.names, popularity(rng, len(GENRES), 1.0)), start=1)]
+
+    index, seconds = build(names)
+    entries = index.stats()['artist']['entries']
+    print(f"{len(names)} names, {entries} entries: built in {seconds:.2f}s")
+    del index
+    tracemalloc.start()
+    index, _ = build(names)
+    print(f"memory: {tracemalloc.get_traced_memory()[0] / 2 ** 20:.0f} MiB")
+    tracemalloc.stop()
+
+    prefixes = [name[:rng.randint(1, 6)] for _, name in rng.choices(names, k=args.lookups)]
+    print('lookup (10 suggestions): p50 %.1fus  p99 %.1fus'
+          % timed((index.suggest, ('artist', prefix)) for prefix in prefixes))
+    new = [(len(names) + i, name + ' Reunion') for i, (_, name) in enumerate(rng.choices(names, k=args.writes))]
+    print('add: p50 %.1fus  p99 %.1fus' % timed((index.add, ('artist', i, name)) for i, name in new))
+    print('remove: p50 %.1fus  p99 %.1fus' % timed((index.remove, ('artist', i)) for i, _ in new))
+
+
+if __name__ == '__main__':
+    main()
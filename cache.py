@@ -0,0 +1,253 @@
+"""Rendered-page cache.
+
+`ResponseCache.cached` stores the body of a successful GET under its route
+(endpoint plus view arguments) and query string, and serves it until it
+expires or a write handler invalidates the route. ``before_fill`` is called
+before a miss renders the page to store; the app sends the reads to the
+primary there, so a lagging replica can't store a stale page for everyone. Invalidation is explicit
+and exact: each backend remembers which query-string variants it holds for
+a route, so ``invalidate(('show_venue', {'venue_id': 3}))`` drops every page
+of that venue and nothing else.
+
+Backends:
+
+* `LRUBackend`, in-process: TTL per entry, evicts the least recently used
+  entry once ``max_entries`` is reached. Each process has its own, so an
+  invalidation only reaches the process that made the write; with several
+  worker processes the others serve their copy until it expires, which
+  ``max_ttl`` bounds.
+* `RedisBackend`, shared between processes: TTL per entry, size bounded by
+  the server's ``maxmemory`` with an LRU ``maxmemory-policy``. It only needs
+  a client with the redis-py interface, so a stand-in (e.g. fakeredis)
+  can replace the server locally.
+
+`FragmentCache` keeps pieces of pages instead, rendered by the
+``{% cache key[, ttl] %}...{% endcache %}`` tag of `FragmentCacheExtension`.
+A fragment is named after its template and line (``pages/shows.html:7``).
+A piece is stored under that name and the key, which should hold the id and
+``updated_at`` of what the piece shows. A changed entity is then rendered
+afresh, without any invalidation, and the old piece ages out of the LRU.
+Hits and misses are counted per fragment.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request, session
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+try:
+    import redis
+except ImportError:  # only needed for CACHE_BACKEND = 'redis'
+    redis = None
+
+
+def route_key(endpoint, view_args=None):
+    args = ','.join(f'{name}={value}' for name, value in sorted((view_args or {}).items()))
+    return f'{endpoint}:{args}'
+
+
+class LRUBackend(object):
+
+    def __init__(self, max_entries=1024, default_ttl=300, max_ttl=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, group, value)
+        self._groups = {}  # group -> set of keys
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, group, ttl=None):
+        ttl = ttl or self.default_ttl
+        expires_at = time.monotonic() + (min(ttl, self.max_ttl) if self.max_ttl else ttl)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (expires_at, group, value)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete_group(self, group):
+        with self._lock:
+            for key in self._groups.pop(group, ()):
+                self._entries.pop(key, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self._entries)}
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._groups.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[entry[1]]
+
+
+class RedisBackend(object):
+
+    def __init__(self, client, default_ttl=300, prefix='fyyur:page:'):
+        self.client = client
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND = 'redis' needs the redis package installed")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, group, ttl=None):
+        ttl = ttl or self.default_ttl
+        group_key = self.prefix + 'group:' + group
+        pipe = self.client.pipeline()
+        pipe.setex(self.prefix + key, ttl, value)
+        pipe.sadd(group_key, self.prefix + key)
+        pipe.expire(group_key, ttl)
+        pipe.execute()
+
+    def delete_group(self, group):
+        group_key = self.prefix + 'group:' + group
+        keys = self.client.smembers(group_key)
+        self.client.delete(group_key, *keys)
+
+    def stats(self):
+        # evictions are counted by the server, across every client
+        evictions = self.client.info('stats').get('evicted_keys', 0)
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': evictions}
+
+
+def backend_from_config(config):
+    """Builds the backend named by CACHE_BACKEND, or None when caching is off."""
+    kind = config.get('CACHE_BACKEND')
+    if kind == 'lru':
+        return LRUBackend(config['CACHE_MAX_ENTRIES'], config['CACHE_DEFAULT_TTL'], config['CACHE_LRU_MAX_TTL'])
+    if kind == 'redis':
+        return RedisBackend.from_url(config['CACHE_REDIS_URL'], default_ttl=config['CACHE_DEFAULT_TTL'])
+    return None
+
+
+class ResponseCache(object):
+
+    def __init__(self, backend=None, before_fill=None):
+        self.backend = backend
+        self.before_fill = before_fill
+
+    def cached(self, ttl=None):
+        """Caches a GET view's 200 responses under its route and query string."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # a page carrying someone's flashed messages must not be shared
+                if self.backend is None or '_flashes' in session:
+                    return view(*args, **kwargs)
+                group = route_key(request.endpoint, request.view_args)
+                key = group + '?' + request.query_string.decode('latin-1')
+                stored = self.backend.get(key)
+                if stored is not None:
+                    head, body = stored.split(b'\n', 1)
+                    response = Response(body, mimetype=head.decode())
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                if self.before_fill is not None:
+                    self.before_fill()
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    self.backend.set(key, response.mimetype.encode() + b'\n' + response.get_data(), group, ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *routes):
+        """Drops every cached variant of the given ``(endpoint, view_args)`` routes."""
+        if self.backend is None:
+            return
+        for endpoint, view_args in routes:
+            self.backend.delete_group(route_key(endpoint, view_args))
+
+    def stats(self):
+        return self.backend.stats() if self.backend is not None else {}
+
+
+class FragmentCache(object):
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._counts = {}  # fragment -> [hits, misses]
+        self._lock = threading.Lock()
+
+    def render(self, fragment, key, ttl, render):
+        """The piece of fragment under key, from the backend or else render()."""
+        if self.backend is None:
+            return render()
+        if isinstance(key, (tuple, list)):
+            key = ':'.join(str(part) for part in key)
+        stored = self.backend.get(f'{fragment}|{key}')
+        with self._lock:
+            self._counts.setdefault(fragment, [0, 0])[stored is None] += 1
+        if stored is not None:
+            return Markup(stored)
+        rendered = render()
+        self.backend.set(f'{fragment}|{key}', str(rendered), fragment, ttl)
+        return rendered
+
+    def invalidate(self, fragment):
+        """Drops every piece of one fragment (``'pages/shows.html:7'``)."""
+        if self.backend is not None:
+            self.backend.delete_group(fragment)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return {fragment: {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 4)}
+                for fragment, (hits, misses) in sorted(counts.items())}
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache key[, ttl] %}``, through the environment's ``fragment_cache``.
+
+    key is any expression, a tuple included: ``{% cache (show.id, show.updated_at) %}``.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(f'{parser.name}:{lineno}'), parser.parse_expression()]
+        args.append(parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', args), [], [], body).set_lineno(lineno)
+
+    def _cache(self, fragment, key, ttl, caller):
+        return self.environment.fragment_cache.render(fragment, key, ttl, caller)
@@ -0,0 +1,167 @@
+"""Response compression: gzip or brotli, negotiated from ``Accept-Encoding``.
+
+`CompressionMiddleware` wraps the WSGI app (``app.wsgi_app``). It
+compresses responses of the text types in `COMPRESSIBLE`: the HTML pages,
+the JSON API, the CSV / NDJSON exports and static CSS and JS. It leaves
+alone responses that:
+
+* already have a Content-Encoding (the precompressed static/dist files);
+* are shorter than ``min_size`` bytes, where the gzip header and the CPU
+  cost more than they save;
+* are HEAD requests, 204 / 206 / 304, or marked ``no-transform``.
+
+A response with a Content-Length is compressed whole and sent with its new
+length. A streamed one (the exports) is compressed chunk by chunk, each
+flushed as it comes, so the client gets the rows as fast as before.
+
+An ETag gets the encoding appended (``"abc-gzip"``): the compressed body is
+a different representation. The suffix is stripped from If-None-Match on
+the way in, so the app's conditional handling still matches its own ETags.
+
+The routes asgi.py answers itself, without Flask, are not compressed.
+"""
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_cache_control_header
+
+try:
+    import brotli
+except ImportError:  # gzip only, then
+    brotli = None
+
+COMPRESSIBLE = ('text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'text/xml',
+                'application/javascript', 'application/json', 'application/x-ndjson', 'application/xml',
+                'image/svg+xml')
+# in order of preference, when the client accepts several equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class GzipStream(object):
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, flush=False):
+        data = self._compressor.compress(data)
+        return data + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else data
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliStream(object):
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data, flush=False):
+        data = self._compressor.process(data)
+        return data + self._compressor.flush() if flush else data
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware(object):
+
+    def __init__(self, app, level=6, brotli_quality=4, min_size=1024):
+        self.app = app
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+
+    def __call__(self, environ, start_response):
+        encoding = None if environ.get('REQUEST_METHOD') == 'HEAD' else self.negotiate(environ)
+        response = CompressedResponse(self, encoding, start_response)
+        if encoding and f'-{encoding}"' in environ.get('HTTP_IF_NONE_MATCH', ''):
+            environ['HTTP_IF_NONE_MATCH'] = environ['HTTP_IF_NONE_MATCH'].replace(f'-{encoding}"', '"')
+            response.revalidating = True
+        return response.body(self.app(environ, response.start_response))
+
+    @staticmethod
+    def negotiate(environ):
+        """The encoding to send: the one the client prefers, ours breaking ties."""
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        encoding = max(ENCODINGS, key=lambda encoding: accepted[encoding])
+        return encoding if accepted[encoding] > 0 else None
+
+    def stream(self, encoding):
+        return BrotliStream(self.brotli_quality) if encoding == 'br' else GzipStream(self.level)
+
+    def compressible(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        length = headers.get('Content-Length', type=int)
+        return (200 <= code and code not in (204, 206, 304)
+                and headers.get('Content-Type', '').split(';')[0].strip() in COMPRESSIBLE
+                and 'Content-Encoding' not in headers
+                and (length is None or length >= self.min_size)
+                and not parse_cache_control_header(headers.get('Cache-Control')).no_transform)
+
+
+class CompressedResponse(object):
+    """One response through the middleware: its headers rewritten, its body compressed."""
+
+    def __init__(self, middleware, encoding, start_response):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._start_response = start_response
+        self.started = False
+        self.stream = None
+        self.pending = None  # (status, headers, written) of a fixed length response, started once compressed
+        self.revalidating = False  # If-None-Match had ETags of compressed responses
+
+    def start_response(self, status, headers, exc_info=None):
+        self.started = True
+        headers = Headers(headers)
+        if self.revalidating and status.startswith('304'):
+            # the client holds the compressed response, so its ETag is the one still current
+            self.tag(headers)
+            headers.add('Vary', 'Accept-Encoding')
+        if not self.middleware.compressible(status, headers):
+            return self._start_response(status, headers.to_wsgi_list(), exc_info)
+        headers.add('Vary', 'Accept-Encoding')
+        if self.encoding is None:
+            return self._start_response(status, headers.to_wsgi_list(), exc_info)
+        self.stream = self.middleware.stream(self.encoding)
+        headers['Content-Encoding'] = self.encoding
+        self.tag(headers)
+        if 'Content-Length' in headers:
+            del headers['Content-Length']
+            self.pending = status, headers, []
+            return self.pending[2].append
+        write = self._start_response(status, headers.to_wsgi_list(), exc_info)
+        return lambda data: write(self.stream.compress(data, flush=True))
+
+    def tag(self, headers):
+        etag = headers.get('ETag')
+        if etag and etag.endswith('"'):
+            headers['ETag'] = f'{etag[:-1]}-{self.encoding}"'
+
+    def body(self, chunks):
+        if self.started and self.stream is None:
+            return chunks  # as it is, file_wrapper and all
+        return self.compressed(chunks)
+
+    def compressed(self, chunks):
+        try:
+            for chunk in chunks:
+                if self.stream is None:
+                    yield chunk
+                elif self.pending is None:
+                    data = self.stream.compress(chunk, flush=True)
+                    if data:
+                        yield data
+                else:
+                    self.pending[2].append(chunk)
+            if self.pending is not None:
+                status, headers, written = self.pending
+                data = b''.join(self.stream.compress(chunk) for chunk in written) + self.stream.finish()
+                headers['Content-Length'] = str(len(data))
+                self._start_response(status, headers.to_wsgi_list())
+                yield data
+            elif self.stream is not None:
+                yield self.stream.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
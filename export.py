@@ -0,0 +1,54 @@
+"""Streaming CSV and NDJSON serializers for the /export endpoints.
+
+Both take an iterable of rows (e.g. a query read through a server-side
+cursor) and yield the body in chunks of roughly `CHUNK_SIZE` bytes, so a
+response starts as soon as the first rows arrive and never holds more than
+one chunk. The output uses the same columns and value formats that
+``flask fyyur import`` reads back.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat(' ', timespec='seconds')
+    return value
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(value)
+    if isinstance(value, bool):
+        return 'y' if value else ''
+    return _plain(value)
+
+
+def ndjson_chunks(rows, columns):
+    chunk, size = [], 0
+    for row in rows:
+        line = json.dumps({column: _plain(value) for column, value in zip(columns, row)}) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def csv_chunks(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,56 @@
+"""Genre filters and genre facet counts for venues and artists.
+
+``genres`` is a varchar[] column on both tables. A ``?genre=`` filter
+(repeatable) keeps the rows having every listed genre, the containment
+``genres @> ARRAY[...]``; with ``?genre_match=any`` one of them is enough,
+the overlap ``genres && ARRAY[...]``. The GIN indexes ix_venue_genres and
+ix_artist_genres answer both operators, so a filtered listing or search only
+reads the rows it returns.
+
+The facet counts shown next to a listing ("Jazz (412), Rock (388)...") are
+one query: the genres of the rows matching the current filter, unnested and
+grouped. It reads every matching row, and its answer is the same for every
+visitor, so `GenreFacets` keeps it for a short TTL.
+"""
+from sqlalchemy import ARRAY, String, cast, func
+
+from cache import LRUBackend
+
+MATCHES = ('all', 'any')
+
+
+def genre_filter(column, genres, match='all'):
+    """The @> (all of the genres) or && (any of them) condition on column."""
+    # the columns are the generic ARRAY type, which lacks contains()/overlap();
+    # the cast because a bare list binds as text[], which varchar[] can't compare with
+    wanted = cast(list(genres), ARRAY(String))
+    return column.op('&&' if match == 'any' else '@>')(wanted)
+
+
+def filter_genres(query, column, genres, match='all'):
+    """query limited to the rows matching the genres, unchanged without any."""
+    return query.filter(genre_filter(column, genres, match)) if genres else query
+
+
+class GenreFacets(object):
+
+    def __init__(self, session, ttl=60, max_entries=256):
+        self.session = session
+        self.cache = LRUBackend(max_entries, ttl)
+
+    def counts(self, model, genres=(), match='all'):
+        """[(genre, count)] over the rows of model matching the filter, most common first."""
+        key = f"{model.__tablename__}:{match}:{','.join(sorted(genres))}"
+        counts = self.cache.get(key)
+        if counts is None:
+            counts = [(row.genre, row.count) for row in self.query(model, genres, match)]
+            self.cache.set(key, counts, model.__tablename__)
+        return counts
+
+    def query(self, model, genres=(), match='all'):
+        # unnest in a subquery: a set-returning function can't be grouped on directly
+        unnested = filter_genres(self.session.query(func.unnest(model.genres).label('genre')),
+                                 model.genres, genres, match).subquery()
+        count = func.count().label('count')
+        return (self.session.query(unnested.c.genre, count)
+                .group_by(unnested.c.genre).order_by(count.desc(), unnested.c.genre))
@@ -0,0 +1,43 @@
+"""Date/time formatting for the templates' ``datetime`` filter.
+
+``babel.dates.format_datetime`` resolves the locale and re-reads the pattern
+on every call, and the filter used to re-parse a string the view had just
+made with ``strftime``. `DateTimeFormatter` instead takes `datetime` objects
+directly, compiles each named pattern once for its locale, and memoizes the
+formatted strings in a bounded LRU cache, since the same show times come
+up on every render of a page.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+class DateTimeFormatter(object):
+
+    def __init__(self, locale='en_US', cache_size=4096):
+        self.locale = Locale.parse(locale)
+        # any other format is taken as a babel pattern itself
+        self.patterns = {name: parse_pattern(pattern) for name, pattern in PATTERNS.items()}
+        self.format = lru_cache(maxsize=cache_size)(self._format)
+
+    def __call__(self, value, format='medium'):
+        return self.format(value, format)
+
+    def _format(self, value, format):
+        if not isinstance(value, datetime):
+            value = dateutil.parser.parse(value)
+        pattern = self.patterns.get(format)
+        if pattern is None:
+            pattern = self.patterns[format] = parse_pattern(format)
+        return pattern.apply(value, self.locale)
+
+    def cache_info(self):
+        return self.format.cache_info()
@@ -1,9 +1,9 @@
 from datetime import datetime
-from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField,BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL ,Regexp , ValidationError
+from flask_wtf import FlaskForm
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField,BooleanField, FloatField
+from wtforms.validators import DataRequired, AnyOf, URL ,Regexp , ValidationError, Optional, NumberRange
 
-class ShowForm(Form):
+class ShowForm(FlaskForm):
     artist_id = StringField(
         'artist_id'
     )
@@ -15,8 +15,17 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    end_time = DateTimeField(
+        # empty: the show runs SHOW_DEFAULT_DURATION minutes
+        'end_time',
+        validators=[Optional()]
+    )
+
+    def validate_end_time(self, field):
+        if self.start_time.data and field.data and field.data <= self.start_time.data:
+            raise ValidationError('End time must be after the start time.')
 
-class VenueForm(Form):
+class VenueForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -82,14 +91,21 @@ class VenueForm(Form):
     address = StringField(
         'address', validators=[DataRequired()]
     )
+    latitude = FloatField(
+        # empty: the centre of the city, from the geocodes table
+        'latitude', validators=[Optional(), NumberRange(-90, 90)]
+    )
+    longitude = FloatField(
+        'longitude', validators=[Optional(), NumberRange(-180, 180)]
+    )
     phone = StringField(
         'phone' , validators=[DataRequired()]
     )
     image_link = StringField(
-        'image_link' , validators=[URL(), Regexp("^[0-9]*$", message="Image link  should only contain links")]
+        'image_link' , validators=[Optional(), URL()]
     )
     website= StringField(
-        'website', validators=[URL(), Regexp("^[0-9]*$", message="website  should only contain links")]
+        'website', validators=[Optional(), URL()]
     )
    
     genres = SelectMultipleField(
@@ -119,7 +135,7 @@ class VenueForm(Form):
     )
     facebook_link = StringField(
         # TODO implement enum restriction
-        'facebook_link', validators=[URL(), Regexp("^[0-9]*$", message="Facebook link  should only contain links")]
+        'facebook_link', validators=[Optional(), URL()]
     )
     seeking_talent = BooleanField(
         'seeking_talent'
@@ -129,7 +145,7 @@ class VenueForm(Form):
 
     )
 
-class ArtistForm(Form):
+class ArtistForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -197,7 +213,7 @@ class ArtistForm(Form):
         'phone' , validators=[DataRequired(), Regexp("^[0-9]*$", message="Phone number should only contain digits")]
     )
     image_link = StringField(
-        'image_link' , validators=[URL(), Regexp("^[0-9]*$", message="Image link  should only contain links")]
+        'image_link' , validators=[Optional(), URL()]
     )
     genres = SelectMultipleField(
         # TODO implement enum restriction
@@ -226,10 +242,10 @@ class ArtistForm(Form):
     )
     facebook_link = StringField(
         # TODO implement enum restriction
-        'facebook_link', validators=[URL(), Regexp("^[0-9]*$", message="Facebook link  should only contain links")]
+        'facebook_link', validators=[Optional(), URL()]
     )
     website= StringField(
-        'website', validators=[URL(), Regexp("^[0-9]*$", message="website  should only contain links")]
+        'website', validators=[Optional(), URL()]
     )
     seeking_venue = BooleanField(
         'seeking_talent'
@@ -0,0 +1,106 @@
+"""Venue locations: geohashes, the cells covering a search circle, distances.
+
+Each venue stores its latitude/longitude and the geohash of that point
+(``GEOHASH_PRECISION`` characters, a cell of a few metres). A geohash cell
+contains every longer geohash that starts with it, so the venues in a cell
+are a range of the ``geohash`` B-tree index (``BETWEEN '9q8y' AND '9q8y~'``;
+the column sorts in the C collation). ``covering_cells`` picks the cell size
+from the search radius and returns the cell of the centre plus its eight
+neighbours, which between them hold every point within the radius: app.py
+turns them into one OR of range conditions, then computes the exact
+great-circle distance (``distance_sql``) of the few venues left.
+
+Coordinates for venues created without them come from the ``geocodes``
+table, the centre of each city, loaded from a local CSV file by ``flask
+fyyur load-geocodes`` (``GEOCODES_FILE`` by default); there is no online
+geocoding.
+"""
+import csv
+import math
+import os
+
+from sqlalchemy import func
+
+GEOHASH_PRECISION = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+GEOCODES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'geocodes.csv')
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """The geohash of a point, `precision` characters long."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        # bits alternate between longitude and latitude, longitude first
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of `precision` characters."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """The geohash cells that together hold every point within radius_km.
+
+    They are the smallest cells at least as large as the radius in both
+    directions, so the circle reaches no further than the neighbours of
+    the centre's cell.
+    """
+    radius_lat = radius_km / KM_PER_DEGREE
+    radius_lng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    precision = 1
+    while precision < GEOHASH_PRECISION:
+        height, width = cell_size(precision + 1)
+        if height < radius_lat or width < radius_lng:
+            break
+        precision += 1
+    height, width = cell_size(precision)
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        for lng_step in (-1, 0, 1):
+            lat = min(max(latitude + lat_step * height, -90.0), 90.0)
+            lng = (longitude + lng_step * width + 180.0) % 360.0 - 180.0
+            cells.add(geohash(lat, lng, precision))
+    return sorted(cells)
+
+
+def in_cells(column, cells):
+    """An OR of index ranges matching the geohashes inside `cells`."""
+    # '~' sorts after every base32 character in the C collation
+    return [column.between(cell, cell + '~') for cell in cells]
+
+
+def distance_sql(lat_column, lng_column, latitude, longitude):
+    """Great-circle distance in km from the point to each row (haversine)."""
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    row_lat, row_lng = func.radians(lat_column), func.radians(lng_column)
+    half_chord = (func.power(func.sin((row_lat - lat) / 2), 2)
+                  + math.cos(lat) * func.cos(row_lat) * func.power(func.sin((row_lng - lng) / 2), 2))
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(half_chord, 1.0)))
+
+
+def read_geocodes(path=GEOCODES_FILE):
+    """Yields the rows of a geocodes CSV file: city, state, latitude, longitude."""
+    with open(path, newline='', encoding='utf-8') as source:
+        for row in csv.DictReader(source):
+            yield {'city': row['city'].strip(), 'state': row['state'].strip().upper(),
+                   'latitude': float(row['latitude']), 'longitude': float(row['longitude'])}
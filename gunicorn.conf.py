@@ -0,0 +1,30 @@
+# gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+#
+# Workers share their Prometheus samples through prometheus_multiproc_dir
+# (see metrics.py), which is emptied on start and told about dead workers.
+# They share the page cache through redis (CACHE_REDIS_URL), so a write
+# invalidates the page in every worker, not just its own (see cache.py).
+import os
+import secrets
+import shutil
+
+from prometheus_client import multiprocess
+
+os.environ.setdefault('prometheus_multiproc_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.metrics'))
+os.environ.setdefault('CACHE_BACKEND', 'redis')
+# one session key for every worker, or a cookie set by one is refused by the
+# others; set SECRET_KEY to keep sessions across restarts and machines
+os.environ.setdefault('SECRET_KEY', secrets.token_hex(32))
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+bind = '0.0.0.0:' + os.environ.get('PORT', '5000')
+
+
+def on_starting(server):
+    directory = os.environ['prometheus_multiproc_dir']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,251 @@
+"""Bulk import of venues, artists and shows (``flask fyyur import``).
+
+Files are CSV (with a header row) or NDJSON (one object per line), picked by
+extension. Columns are the form fields: for venues and artists ``genres`` is
+a list in NDJSON and ``;``-separated in CSV; shows reference their venue and
+artist either by id (``venue_id`` / ``artist_id``) or by exact name
+(``venue`` / ``artist``), and may leave ``end_time`` out
+(SHOW_DEFAULT_DURATION applies). Venues without ``latitude`` /
+``longitude`` are placed at the centre of their city (the geocodes table).
+
+Every row is validated by the same WTForms form the web pages use, then
+rows are loaded in batches with PostgreSQL ``COPY`` (``executemany`` on
+other drivers), one transaction per batch. Files are streamed, so memory
+stays flat however long they are; only the id/name lookups of venues and
+artists are held in memory while shows load. A batch holding a double
+booked show is loaded again one show at a time, and the shows overlapping
+another at their venue or with their artist are rejected.
+"""
+import csv
+import io
+import json
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from werkzeug.datastructures import MultiDict
+
+from app import (app, db, Venue, Artist, Show, search_engine, search_document, page_cache, city_centres,
+                 EXCLUSION_VIOLATION)
+from geo import geohash
+from forms import VenueForm, ArtistForm, ShowForm
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+
+VENUE_COLUMNS = ('name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'website',
+                 'facebook_link', 'seeking_talent', 'seeking_description', 'latitude', 'longitude', 'geohash')
+ARTIST_COLUMNS = ('name', 'city', 'state', 'phone', 'genres', 'image_link', 'website',
+                  'facebook_link', 'seeking_venue', 'seeking_description')
+SHOW_COLUMNS = ('venue_id', 'artist_id', 'start_time', 'end_time', 'counted_as_upcoming')
+
+
+def read_rows(path):
+    """Yields ``(line_number, row)`` from a CSV or NDJSON file."""
+    with open(path, newline='', encoding='utf-8') as source:
+        if path.endswith('.csv'):
+            reader = csv.DictReader(source)
+            for row in reader:
+                if row.get('genres'):
+                    row['genres'] = [genre.strip() for genre in row['genres'].split(';') if genre.strip()]
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(source, 1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+
+
+def form_data(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            data.setlist(key, [str(item) for item in value])
+        elif value is True:
+            data[key] = 'y'
+        elif value not in (None, False):
+            data[key] = str(value)
+    return data
+
+
+def validate(form_class, row):
+    """Returns ``(data, None)`` for a valid row, ``(None, errors)`` otherwise."""
+    form = form_class(formdata=form_data(row), meta={'csrf': False})
+    if form.validate():
+        return form.data, None
+    return None, '; '.join(f'{field}: {" ".join(messages)}' for field, messages in form.errors.items())
+
+
+class References(object):
+    """Resolves a show's venue or artist, by id or by exact name."""
+
+    def __init__(self, model):
+        self.ids = set()
+        self.names = {}
+        for entity_id, name in db.session.query(model.id, model.name).yield_per(10000):
+            self.ids.add(entity_id)
+            # a name shared by several rows can't be resolved
+            self.names[name] = None if name in self.names else entity_id
+
+    def resolve(self, row, key):
+        if row.get(f'{key}_id') not in (None, ''):
+            try:
+                entity_id = int(row[f'{key}_id'])
+            except (TypeError, ValueError):
+                return None, f'{key}_id: not a number'
+            return (entity_id, None) if entity_id in self.ids else (None, f'{key}_id: no {key} {entity_id}')
+        name = row.get(key)
+        if name not in self.names:
+            return None, f'{key}: no {key} named {name!r}'
+        if self.names[name] is None:
+            return None, f'{key}: several {key}s are named {name!r}, use {key}_id'
+        return self.names[name], None
+
+
+def copy_value(value):
+    # a CSV field for COPY; every value is quoted, because only an unquoted
+    # field can match the NULL marker: a text that is exactly \N stays text
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, list):
+        items = ('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value)
+        value = '{' + ','.join(items) + '}'
+    elif isinstance(value, datetime):
+        value = value.isoformat(' ')
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def insert_rows(table, columns, rows):
+    """Inserts a batch with COPY when the driver supports it."""
+    connection = db.session.connection()
+    cursor = connection.connection.cursor()
+    if hasattr(cursor, 'copy_expert'):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(copy_value(row[column]) for column in columns) + '\n')
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+    else:
+        connection.execute(table.insert(), [{column: row[column] for column in columns} for row in rows])
+
+
+def double_booked(error):
+    # COPY raises the driver's own exception, executemany SQLAlchemy's wrapper of it
+    return getattr(getattr(error, 'orig', error), 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+def insert_bookable(table, columns, rows):
+    """Inserts shows one at a time, each in a savepoint; returns the double booked ones, which are left out."""
+    refused = []
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                insert_rows(table, columns, [row])
+        except Exception as error:
+            if not double_booked(error):
+                raise
+            refused.append(row)
+    return refused
+
+
+def add_show_counts(rows):
+    # the batch's contribution to the denormalized venue/artist show counters
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        counts = defaultdict(lambda: [0, 0])
+        for row in rows:
+            counts[row[key]][0 if row['counted_as_upcoming'] else 1] += 1
+        table = model.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('entity_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('upcoming'),
+                past_shows_count=table.c.past_shows_count + db.bindparam('past')),
+            [{'entity_id': entity_id, 'upcoming': upcoming, 'past': past}
+             for entity_id, (upcoming, past) in counts.items()]
+        )
+
+
+def import_file(kind, path, batch_size=BATCH_SIZE, out=sys.stdout):
+    """Loads one file of venues, artists or shows; returns (loaded, rejected)."""
+    if kind == 'show':
+        venues, artists = References(Venue), References(Artist)
+        table, columns, form_class = Show.__table__, SHOW_COLUMNS, ShowForm
+    elif kind == 'venue':
+        centres = city_centres()
+        table, columns, form_class = Venue.__table__, VENUE_COLUMNS, VenueForm
+    else:
+        table, columns, form_class = Artist.__table__, ARTIST_COLUMNS, ArtistForm
+
+    started = time.monotonic()
+    now = datetime.now()
+    default_duration = timedelta(minutes=app.config['SHOW_DEFAULT_DURATION'])
+    loaded = rejected = 0
+    touched_venues, touched_artists = set(), set()
+    batch = []
+
+    def flush():
+        nonlocal loaded, rejected
+        try:
+            insert_rows(table, columns, batch)
+        except Exception as error:
+            if kind != 'show' or not double_booked(error):
+                raise
+            db.session.rollback()
+            refused = insert_bookable(table, columns, batch)
+            for row in refused:
+                batch.remove(row)
+                rejected += 1
+                if rejected <= MAX_REPORTED_ERRORS:
+                    print(f"{path}: show of artist {row['artist_id']} at venue {row['venue_id']} from "
+                          f"{row['start_time']} to {row['end_time']}: double booked", file=sys.stderr)
+            loaded -= len(refused)
+        if kind == 'show':
+            add_show_counts(batch)
+        db.session.commit()
+        batch.clear()
+
+    for line_number, row in read_rows(path):
+        errors = None
+        if kind == 'show':
+            row = dict(row)
+            row['venue_id'], venue_error = venues.resolve(row, 'venue')
+            row['artist_id'], artist_error = artists.resolve(row, 'artist')
+            errors = venue_error or artist_error
+        if not errors:
+            data, errors = validate(form_class, row)
+        if errors:
+            rejected += 1
+            if rejected <= MAX_REPORTED_ERRORS:
+                print(f'{path}:{line_number}: {errors}', file=sys.stderr)
+            continue
+
+        if kind == 'show':
+            data = {'venue_id': row['venue_id'], 'artist_id': row['artist_id'], 'start_time': data['start_time'],
+                    'end_time': data['end_time'] or data['start_time'] + default_duration,
+                    'counted_as_upcoming': data['start_time'] > now}
+            touched_venues.add(data['venue_id'])
+            touched_artists.add(data['artist_id'])
+        elif kind == 'venue':
+            if data['latitude'] is None or data['longitude'] is None:
+                data['latitude'], data['longitude'] = centres.get((data['city'].strip().lower(), data['state']), (None, None))
+            data['geohash'] = geohash(data['latitude'], data['longitude']) if data['latitude'] is not None else None
+        batch.append(data)
+        loaded += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if kind != 'show':
+        model = Venue if kind == 'venue' else Artist
+        search_engine.rebuild(kind, (search_document(entity) for entity in model.query.yield_per(1000)))
+    page_cache.invalidate(('venues', {}), ('artists', {}), ('shows', {}))
+    page_cache.invalidate(*[('show_venue', {'venue_id': venue_id}) for venue_id in touched_venues])
+    page_cache.invalidate(*[('show_artist', {'artist_id': artist_id}) for artist_id in touched_artists])
+
+    elapsed = time.monotonic() - started
+    print(f'{kind}s: {loaded} loaded, {rejected} rejected in {elapsed:.1f}s '
+          f'({loaded / elapsed if elapsed else 0:,.0f} rows/s)', file=out)
+    return loaded, rejected
@@ -0,0 +1,116 @@
+"""Per-request SQL statistics and N+1 detection.
+
+`RequestStats` listens to every engine's cursor events and, for each
+request, counts the statements it ran, their total time and the slowest
+ones. It reports them in a ``Server-Timing`` header (visible in the
+browser's network panel) and keeps the last few requests for
+``/_debug/requests``.
+
+Statements are grouped after normalizing away their literal and parameter
+values, so ``SELECT .. WHERE id = 1`` and ``.. WHERE id = 2`` count as
+one. A request running the same statement more than ``repeat_threshold``
+times, the usual shape of an N+1 loop, is logged as a warning on the
+app logger's ``sql`` child (``app.sql``), or raised as
+`RepeatedStatementError` when ``raise_on_repeat`` is set, so a test run
+fails on it.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOWEST = 3
+
+
+class RepeatedStatementError(Exception):
+    pass
+
+
+def normalize(statement):
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', statement)  # IN lists of any length
+    return ' '.join(statement.split())
+
+
+class RequestStats(object):
+
+    def __init__(self, app=None, max_requests=100, repeat_threshold=10, raise_on_repeat=False):
+        self.repeat_threshold = repeat_threshold
+        self.raise_on_repeat = raise_on_repeat
+        self.recent = deque(maxlen=max_requests)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.logger = app.logger.getChild('sql')
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        event.listen(Engine, 'handle_error', self._on_error)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def requests(self):
+        with self._lock:
+            return list(self.recent)
+
+    def _start(self):
+        g.sql_stats = {'started': time.perf_counter(), 'duration': 0.0, 'statements': Counter(), 'slowest': []}
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - connection.info['query_started'].pop()
+        stats = g.get('sql_stats') if has_app_context() else None
+        if stats is None:
+            return
+        stats['duration'] += duration
+        stats['statements'][normalize(statement)] += 1
+        slowest = stats['slowest']
+        slowest.append((duration, statement))
+        slowest.sort(reverse=True)
+        del slowest[SLOWEST:]
+
+    @staticmethod
+    def _on_error(context):
+        # a failed statement never gets to _after_execute; its start time goes here
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    def _finish(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        queries = sum(stats['statements'].values())
+        db_ms = stats['duration'] * 1000
+        total_ms = (time.perf_counter() - stats['started']) * 1000
+        repeated = [(statement, count) for statement, count in stats['statements'].most_common()
+                    if count > self.repeat_threshold]
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.2f};desc="{queries} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.2f}')
+        with self._lock:
+            self.recent.append({
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'status': response.status_code,
+                'queries': queries,
+                'db_ms': round(db_ms, 2),
+                'total_ms': round(total_ms, 2),
+                'slowest': [{'statement': statement, 'ms': round(duration * 1000, 2)}
+                            for duration, statement in stats['slowest']],
+                'repeated': [{'statement': statement, 'count': count} for statement, count in repeated],
+            })
+        if repeated:
+            message = '{} {} ran {} statement(s) more than {} times, e.g. {}x: {}'.format(
+                request.method, request.path, len(repeated), self.repeat_threshold, repeated[0][1], repeated[0][0])
+            if self.raise_on_repeat:
+                raise RepeatedStatementError(message)
+            self.logger.warning(message)
+        return response
@@ -0,0 +1,313 @@
+"""Background jobs: work a write handler leaves for later, run by ``flask fyyur worker``.
+
+A handler commits its change, then `JobQueue.enqueue` stores a job: a kind,
+naming a function registered with `JobQueue.handler`, and the JSON keyword
+arguments to call it with. Workers claim due jobs one at a time and run
+them, each in an application context.
+
+A claim is a lease: the job stays ``running`` for ``lease`` seconds, and
+once that has passed any worker may claim it again. A worker that dies
+mid-job therefore delays the job rather than losing it. A job that raises
+is retried after an exponential backoff; after ``max_attempts`` attempts
+it is dead-lettered, kept with its last error until `requeue_dead`. Jobs
+can run more than once, so handlers must be idempotent: they reload what
+they work on by id.
+
+Storage:
+
+* `PostgresQueue`, the ``jobs`` table of the app's database. Workers claim
+  with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of them, in
+  any number of processes, never wait on each other or take the same job.
+  ix_jobs_due holds only the queued and running jobs; finished jobs are
+  deleted.
+* `SQLiteQueue`, a file, for running without Postgres (tests, local runs).
+  A claim takes SQLite's write lock, so claims are serialized.
+* `ImmediateQueue` runs each job as it is enqueued, in the request, with
+  no retries: the behaviour from before the queue, for setups without a
+  worker.
+
+`run_workers` runs the worker threads, in one or more processes.
+"""
+import json
+import multiprocessing
+import random
+import signal
+import sqlite3
+import threading
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, select
+
+# a claimed job; attempts counts this one
+Claim = namedtuple('Claim', 'id kind payload attempts')
+
+STATUSES = ('queued', 'running', 'dead')
+
+
+class JobQueue(object):
+    """What jobs run and how they are retried; subclasses store them."""
+
+    def __init__(self, max_attempts=5, backoff=10, max_backoff=3600, lease=300):
+        self.handlers = {}
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+
+    def handler(self, kind):
+        """Registers the decorated function as the handler of kind's jobs."""
+        def decorator(function):
+            self.handlers[kind] = function
+            return function
+        return decorator
+
+    def enqueue(self, kind, delay=0, **payload):
+        if kind not in self.handlers:
+            raise ValueError(f'no handler for {kind!r} jobs')
+        return self._insert(kind, payload, datetime.utcnow() + timedelta(seconds=delay))
+
+    def work(self, context):
+        """Runs one due job inside context(); False when none was due."""
+        claim = self._claim(datetime.utcnow() + timedelta(seconds=self.lease))
+        if claim is None:
+            return False
+        handler = self.handlers.get(claim.kind)
+        if handler is None:
+            self._bury(claim, f'no handler for {claim.kind!r} jobs')
+        elif claim.attempts > self.max_attempts:
+            # its worker died on it every time
+            self._bury(claim, 'lease expired on every attempt')
+        else:
+            try:
+                with context():
+                    handler(**claim.payload)
+            except Exception:
+                error = traceback.format_exc()
+                if claim.attempts >= self.max_attempts:
+                    self._bury(claim, error)
+                else:
+                    self._retry(claim, datetime.utcnow() + timedelta(seconds=self.retry_delay(claim.attempts)), error)
+            else:
+                self._delete(claim)
+        return True
+
+    def retry_delay(self, attempts):
+        # doubling from backoff, capped, with jitter so failed jobs don't retry in step
+        return min(self.backoff * 2 ** (attempts - 1), self.max_backoff) * random.uniform(0.8, 1.2)
+
+    def run(self, context, stop, poll_interval=1.0, burst=False):
+        """Works jobs until stop is set, or until none is due with burst."""
+        while not stop.is_set():
+            if not self.work(context):
+                if burst:
+                    return
+                stop.wait(poll_interval)
+
+    def reconnect(self):
+        """Drops the connections inherited from a parent process."""
+
+
+class ImmediateQueue(JobQueue):
+
+    def _insert(self, kind, payload, run_at):
+        self.handlers[kind](**payload)
+
+    def work(self, context):
+        return False
+
+    def dead(self, limit=100):
+        return []
+
+    def requeue_dead(self):
+        return 0
+
+    def counts(self):
+        return {status: 0 for status in STATUSES}
+
+
+class PostgresQueue(JobQueue):
+
+    def __init__(self, engine, table, **kwargs):
+        super(PostgresQueue, self).__init__(**kwargs)
+        self.engine = engine
+        self.table = table
+
+    def _insert(self, kind, payload, run_at):
+        with self.engine.begin() as connection:
+            return connection.execute(self.table.insert().values(
+                kind=kind, payload=payload, status='queued', attempts=0, run_at=run_at,
+                created_at=datetime.utcnow()).returning(self.table.c.id)).scalar()
+
+    def _claim(self, lease_until):
+        jobs = self.table
+        due = (select([jobs.c.id])
+               .where(and_(jobs.c.status.in_(('queued', 'running')), jobs.c.run_at <= datetime.utcnow()))
+               .order_by(jobs.c.run_at, jobs.c.id)
+               .limit(1)
+               .with_for_update(skip_locked=True))
+        with self.engine.begin() as connection:
+            row = connection.execute(jobs.update().where(jobs.c.id == due.as_scalar()).values(
+                status='running', attempts=jobs.c.attempts + 1, run_at=lease_until
+            ).returning(jobs.c.id, jobs.c.kind, jobs.c.payload, jobs.c.attempts)).first()
+        return Claim(*row) if row is not None else None
+
+    def _delete(self, claim):
+        with self.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.id == claim.id))
+
+    def _retry(self, claim, run_at, error):
+        self._update(claim, status='queued', run_at=run_at, last_error=error)
+
+    def _bury(self, claim, error):
+        self._update(claim, status='dead', last_error=error)
+
+    def _update(self, claim, **values):
+        with self.engine.begin() as connection:
+            connection.execute(self.table.update().where(self.table.c.id == claim.id).values(**values))
+
+    def dead(self, limit=100):
+        """The newest dead-lettered jobs, as dicts."""
+        jobs = self.table
+        with self.engine.connect() as connection:
+            rows = connection.execute(select([jobs]).where(jobs.c.status == 'dead')
+                                      .order_by(jobs.c.id.desc()).limit(limit))
+            return [dict(row) for row in rows]
+
+    def requeue_dead(self):
+        """Queues every dead job again, with its attempts reset; returns how many."""
+        with self.engine.begin() as connection:
+            return connection.execute(self.table.update().where(self.table.c.status == 'dead').values(
+                status='queued', attempts=0, run_at=datetime.utcnow())).rowcount
+
+    def counts(self):
+        jobs = self.table
+        with self.engine.connect() as connection:
+            rows = connection.execute(select([jobs.c.status, func.count()]).group_by(jobs.c.status))
+            counts = {status: count for status, count in rows}
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def reconnect(self):
+        self.engine.dispose()
+
+
+class SQLiteQueue(JobQueue):
+
+    def __init__(self, path=':memory:', **kwargs):
+        super(SQLiteQueue, self).__init__(**kwargs)
+        self.path = path
+        self.reconnect()
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, run_at TEXT NOT NULL, "
+                "created_at TEXT NOT NULL, last_error TEXT)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_jobs_due ON jobs (run_at, id) WHERE status IN ('queued', 'running')"
+            )
+
+    def _insert(self, kind, payload, run_at):
+        with self.lock:
+            return self.connection.execute(
+                "INSERT INTO jobs (kind, payload, status, attempts, run_at, created_at) VALUES (?, ?, 'queued', 0, ?, ?)",
+                (kind, json.dumps(payload), run_at.isoformat(), datetime.utcnow().isoformat())
+            ).lastrowid
+
+    def _claim(self, lease_until):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute(
+                    "SELECT id, kind, payload, attempts + 1 FROM jobs "
+                    "WHERE status IN ('queued', 'running') AND run_at <= ? ORDER BY run_at, id LIMIT 1",
+                    (datetime.utcnow().isoformat(),)
+                ).fetchone()
+                if row is not None:
+                    self.connection.execute(
+                        "UPDATE jobs SET status = 'running', attempts = ?, run_at = ? WHERE id = ?",
+                        (row[3], lease_until.isoformat(), row[0])
+                    )
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        return Claim(row[0], row[1], json.loads(row[2]), row[3]) if row is not None else None
+
+    def _delete(self, claim):
+        with self.lock:
+            self.connection.execute('DELETE FROM jobs WHERE id = ?', (claim.id,))
+
+    def _retry(self, claim, run_at, error):
+        with self.lock:
+            self.connection.execute("UPDATE jobs SET status = 'queued', run_at = ?, last_error = ? WHERE id = ?",
+                                    (run_at.isoformat(), error, claim.id))
+
+    def _bury(self, claim, error):
+        with self.lock:
+            self.connection.execute("UPDATE jobs SET status = 'dead', last_error = ? WHERE id = ?", (error, claim.id))
+
+    def dead(self, limit=100):
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT * FROM jobs WHERE status = 'dead' ORDER BY id DESC LIMIT ?", (limit,))
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row), payload=json.loads(row[2])) for row in cursor]
+
+    def requeue_dead(self):
+        with self.lock:
+            return self.connection.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ? WHERE status = 'dead'",
+                (datetime.utcnow().isoformat(),)
+            ).rowcount
+
+    def counts(self):
+        with self.lock:
+            counts = dict(self.connection.execute('SELECT status, count(*) FROM jobs GROUP BY status'))
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def reconnect(self):
+        self.lock = threading.Lock()
+        # autocommit mode, so _claim's BEGIN IMMEDIATE is the transaction
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+
+
+def run_workers(queue, context, threads=1, processes=1, poll_interval=1.0, burst=False):
+    """Works queue's jobs on threads in each of processes until SIGINT / SIGTERM (or, with burst, none is due).
+
+    A signal lets the jobs being run finish. Processes are forked from this
+    one, so they share its handlers and configuration.
+    """
+    if processes <= 1:
+        return _serve(queue, context, threads, poll_interval, burst)
+    fork = multiprocessing.get_context('fork')
+    children = [fork.Process(target=_serve, args=(queue, context, threads, poll_interval, burst, True),
+                             name=f'jobs-{number}') for number in range(processes)]
+    for child in children:
+        child.start()
+    # a SIGTERM here is passed on; a terminal's SIGINT reaches the children by itself
+    signal.signal(signal.SIGTERM, lambda signum, frame: [child.terminate() for child in children])
+    for child in children:
+        while child.is_alive():
+            try:
+                child.join()
+            except KeyboardInterrupt:
+                pass
+
+
+def _serve(queue, context, threads, poll_interval, burst, forked=False):
+    if forked:
+        queue.reconnect()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    workers = [threading.Thread(target=queue.run, args=(context, stop, poll_interval, burst), name=f'jobs-{number}')
+               for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        while worker.is_alive():
+            try:
+                worker.join(poll_interval)
+            except KeyboardInterrupt:
+                stop.set()
@@ -0,0 +1,107 @@
+"""Prometheus metrics, served at ``/metrics``.
+
+* ``fyyur_http_requests_total`` and ``fyyur_http_request_duration_seconds``
+  per endpoint, plus ``fyyur_http_requests_in_flight``.
+* ``fyyur_db_pool_checked_out`` / ``fyyur_db_pool_overflow`` per database
+  (the primary and each replica), against ``fyyur_db_pool_capacity``
+  (pool_size + max_overflow), to alert on pool exhaustion.
+* ``fyyur_template_render_seconds`` per template.
+* ``fyyur_page_cache_requests_total`` by result (hit / miss), for the
+  page cache hit ratio.
+
+Under a multi-process server every worker writes its samples to the
+directory named by the ``prometheus_multiproc_dir`` environment variable,
+and ``/metrics`` aggregates them, whichever worker answers. The directory
+must exist and be emptied before the server starts, and dead workers must
+be marked as such; gunicorn.conf.py does both.
+"""
+import os
+import time
+
+from flask import Response, g, request
+from jinja2 import Template
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+REQUESTS = Counter('fyyur_http_requests_total', 'HTTP requests handled.', ['endpoint', 'method', 'status'])
+LATENCY = Histogram('fyyur_http_request_duration_seconds', 'Time to handle a request.', ['endpoint'])
+IN_FLIGHT = Gauge('fyyur_http_requests_in_flight', 'Requests being handled.', multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge('fyyur_db_pool_checked_out', 'Pooled connections in use.', ['database'],
+                         multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('fyyur_db_pool_overflow', 'Connections open beyond pool_size.', ['database'],
+                      multiprocess_mode='livesum')
+POOL_CAPACITY = Gauge('fyyur_db_pool_capacity', 'pool_size + max_overflow.', ['database'],
+                      multiprocess_mode='livesum')
+RENDER = Histogram('fyyur_template_render_seconds', 'Time to render a template.', ['template'])
+PAGE_CACHE = Counter('fyyur_page_cache_requests_total', 'Page cache lookups.', ['result'])
+
+
+class TimedTemplate(Template):
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return Template.render(self, *args, **kwargs)
+        finally:
+            RENDER.labels(self.name or '<string>').observe(time.perf_counter() - started)
+
+
+def watch_pool(name, engine):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+    POOL_CAPACITY.labels(name).set(pool.size() + pool._max_overflow)
+
+    def update(returning):
+        # checkin fires before the pool takes the connection back, and an
+        # overflow connection is closed then if the pool is already full
+        POOL_CHECKED_OUT.labels(name).set(pool.checkedout() - returning)
+        discarded = returning and pool.checkedin() >= pool.size()
+        POOL_OVERFLOW.labels(name).set(max(0, pool.overflow() - discarded))
+
+    event.listen(engine, 'checkout', lambda *args: update(False))
+    event.listen(engine, 'checkin', lambda *args: update(True))
+
+
+class Metrics(object):
+
+    def __init__(self, app=None, engines=None):
+        if app is not None:
+            self.init_app(app, engines)
+
+    def init_app(self, app, engines=None):
+        for name, engine in (engines or {}).items():
+            watch_pool(name, engine)
+        app.jinja_env.template_class = TimedTemplate
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    def response(self):
+        if 'prometheus_multiproc_dir' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    def _finish(self, response):
+        started = g.get('metrics_started')
+        if started is not None:
+            endpoint = request.endpoint or '<unmatched>'
+            LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        if 'X-Cache' in response.headers:
+            PAGE_CACHE.labels(response.headers['X-Cache'].lower()).inc()
+        return response
+
+    def _teardown(self, exception=None):
+        # after_request is skipped when a request fails outright; teardown is not
+        if g.pop('metrics_started', None) is not None:
+            IN_FLIGHT.dec()
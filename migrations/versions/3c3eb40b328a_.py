@@ -0,0 +1,47 @@
+"""denormalized show counters on venue and artist
+
+Revision ID: 3c3eb40b328a
+Revises: 97bf378ddc2c
+Create Date: 2026-10-18 09:12:31.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c3eb40b328a'
+down_revision = '97bf378ddc2c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('counted_as_upcoming', sa.Boolean(), server_default=sa.true(), nullable=False))
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill from the existing shows
+    op.execute('UPDATE shows SET counted_as_upcoming = start_time > LOCALTIMESTAMP')
+    for table, foreign_key in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.execute(f'''
+            UPDATE {table} SET
+                upcoming_shows_count = counts.upcoming,
+                past_shows_count = counts.past
+            FROM (
+                SELECT {foreign_key} AS entity_id,
+                       COUNT(*) FILTER (WHERE counted_as_upcoming) AS upcoming,
+                       COUNT(*) FILTER (WHERE NOT counted_as_upcoming) AS past
+                FROM shows
+                GROUP BY {foreign_key}
+            ) AS counts
+            WHERE {table}.id = counts.entity_id
+        ''')
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_column('shows', 'counted_as_upcoming')
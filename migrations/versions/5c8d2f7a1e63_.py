@@ -0,0 +1,39 @@
+"""jobs table: the background job queue
+
+Revision ID: 5c8d2f7a1e63
+Revises: a4d7e2c9f153
+Create Date: 2026-10-18 17:02:44.219305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8d2f7a1e63'
+down_revision = 'a4d7e2c9f153'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.String(length=64), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # only the jobs still to run, so claiming stays cheap however many are dead
+    op.create_index('ix_jobs_due', 'jobs', ['run_at', 'id'], unique=False,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade():
+    op.drop_index('ix_jobs_due', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,108 @@
+"""shows range-partitioned by month on start_time, and the shows_archive table
+
+Revision ID: 8a3e6d1f4b27
+Revises: c51f8a3d6e02
+Create Date: 2026-10-18 13:05:12.640918
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a3e6d1f4b27'
+down_revision = 'c51f8a3d6e02'
+branch_labels = None
+depends_on = None
+
+# months of partitions created past the current one; `flask fyyur create-partitions` keeps it up
+MONTHS_AHEAD = 12
+COLUMNS = 'id, venue_id, artist_id, start_time, counted_as_upcoming, updated_at'
+
+
+def show_table(name, **kwargs):
+    # the primary key of a partitioned table has to include the partition key
+    op.create_table(name,
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('shows_id_seq')"), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('counted_as_upcoming', sa.Boolean(), server_default=sa.true(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text("(now() AT TIME ZONE 'utc')"), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+    sa.PrimaryKeyConstraint('id', 'start_time'),
+    **kwargs
+    )
+
+
+def show_indexes(table):
+    op.create_index(f'ix_{table}_venue_id_start_time', table, ['venue_id', 'start_time'], unique=False)
+    op.create_index(f'ix_{table}_artist_id_start_time', table, ['artist_id', 'start_time'], unique=False)
+    op.create_index(f'ix_{table}_start_time_id', table, ['start_time', 'id'], unique=False)
+
+
+def add_months(month, count):
+    months = month.year * 12 + month.month - 1 + count
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def upgrade():
+    for name in ('ix_shows_upcoming_start_time', 'ix_shows_start_time_id',
+                 'ix_shows_artist_id_start_time', 'ix_shows_venue_id_start_time'):
+        op.drop_index(name, table_name='shows')
+    op.rename_table('shows', 'shows_unpartitioned')
+    op.execute('ALTER TABLE shows_unpartitioned RENAME CONSTRAINT shows_pkey TO shows_unpartitioned_pkey')
+
+    show_table('shows', postgresql_partition_by='RANGE (start_time)')
+    show_table('shows_archive', postgresql_partition_by='RANGE (start_time)')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    op.execute('CREATE TABLE shows_default PARTITION OF shows DEFAULT')
+
+    # a partition for every month from the oldest show to MONTHS_AHEAD from now
+    oldest = op.get_bind().execute('SELECT min(start_time) FROM shows_unpartitioned').scalar()
+    now = datetime.now()
+    month = datetime((oldest or now).year, (oldest or now).month, 1)
+    last = add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        op.execute(f"CREATE TABLE shows_p{month:%Y_%m} PARTITION OF shows "
+                   f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')")
+        month = add_months(month, 1)
+
+    op.execute(f'INSERT INTO shows ({COLUMNS}) SELECT {COLUMNS} FROM shows_unpartitioned')
+    op.drop_table('shows_unpartitioned')
+
+    show_indexes('shows')
+    show_indexes('shows_archive')
+    op.create_index('ix_shows_upcoming_start_time', 'shows', ['start_time'], unique=False,
+                    postgresql_where=sa.text('counted_as_upcoming'))
+
+
+def downgrade():
+    op.create_table('shows_unpartitioned',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('shows_id_seq')"), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('counted_as_upcoming', sa.Boolean(), server_default=sa.true(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text("(now() AT TIME ZONE 'utc')"), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+    sa.PrimaryKeyConstraint('id', name='shows_unpartitioned_pkey')
+    )
+    op.execute(f'INSERT INTO shows_unpartitioned ({COLUMNS}) '
+               f'SELECT {COLUMNS} FROM shows UNION ALL SELECT {COLUMNS} FROM shows_archive')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows_unpartitioned.id')
+    # dropping a partitioned table drops its partitions
+    op.drop_table('shows_archive')
+    op.drop_table('shows')
+    op.rename_table('shows_unpartitioned', 'shows')
+    op.execute('ALTER TABLE shows RENAME CONSTRAINT shows_unpartitioned_pkey TO shows_pkey')
+
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'], unique=False)
+    op.create_index('ix_shows_upcoming_start_time', 'shows', ['start_time'], unique=False,
+                    postgresql_where=sa.text('counted_as_upcoming'))
@@ -0,0 +1,35 @@
+"""GIN indexes on the genres arrays of venues and artists
+
+Revision ID: a4d7e2c9f153
+Revises: f6a2c8e4b19d
+Create Date: 2026-10-18 15:31:26.804417
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2c9f153'
+down_revision = 'f6a2c8e4b19d'
+branch_labels = None
+depends_on = None
+
+# the ?genre= filters, genres @> / && ARRAY[...] (see facets.py)
+INDEXES = (
+    ('ix_venue_genres', 'venue'),
+    ('ix_artist_genres', 'artist'),
+)
+
+
+def upgrade():
+    # CONCURRENTLY keeps the tables writable while the indexes build, outside a transaction
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(name, table, ['genres'], unique=False, postgresql_using='gin',
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
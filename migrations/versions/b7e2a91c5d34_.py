@@ -0,0 +1,28 @@
+"""updated_at timestamps on venue, artist and shows
+
+Revision ID: b7e2a91c5d34
+Revises: 4f1c2d7e9a60
+Create Date: 2026-10-18 11:02:47.215336
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2a91c5d34'
+down_revision = '4f1c2d7e9a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows start out as modified now, in UTC like the application writes
+    for table in ('venue', 'artist', 'shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("(now() AT TIME ZONE 'utc')")))
+
+
+def downgrade():
+    for table in ('shows', 'artist', 'venue'):
+        op.drop_column(table, 'updated_at')
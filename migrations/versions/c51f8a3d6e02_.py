@@ -0,0 +1,43 @@
+"""btree indexes for the show lookups and the listings' sort keys
+
+Revision ID: c51f8a3d6e02
+Revises: b7e2a91c5d34
+Create Date: 2026-10-18 12:20:41.508193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c51f8a3d6e02'
+down_revision = 'b7e2a91c5d34'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial index predicate)
+INDEXES = (
+    # a venue's or artist's shows, in start_time order (the detail pages, version queries)
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], None),
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], None),
+    # the keyset sort keys of /shows, /venues and /artists
+    ('ix_shows_start_time_id', 'shows', ['start_time', 'id'], None),
+    ('ix_venue_state_city_name_id', 'venue', ['state', 'city', 'name', 'id'], None),
+    ('ix_artist_name_id', 'artist', ['name', 'id'], None),
+    # the shows still counted as upcoming, which roll-shows scans for those that started
+    ('ix_shows_upcoming_start_time', 'shows', ['start_time'], sa.text('counted_as_upcoming')),
+)
+
+
+def upgrade():
+    # CONCURRENTLY keeps shows writable while its indexes build, outside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_where=where,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,104 @@
+"""show end times, and the bookings table whose exclusion constraints prevent double bookings
+
+Revision ID: e3b9d5c7a14f
+Revises: 8a3e6d1f4b27
+Create Date: 2026-10-18 14:02:37.215804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b9d5c7a14f'
+down_revision = '8a3e6d1f4b27'
+branch_labels = None
+depends_on = None
+
+# what existing shows, which had no end time, are taken to last
+DEFAULT_DURATION = '2 hours'
+SHOW_TABLES = ('shows', 'shows_archive')
+MAX_REPORTED_CONFLICTS = 20
+
+
+def upgrade():
+    # the integer = operator in a GiST index
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for table in SHOW_TABLES:
+        op.add_column(table, sa.Column('end_time', sa.DateTime(), nullable=True))
+        op.execute(f"UPDATE {table} SET end_time = start_time + interval '{DEFAULT_DURATION}'")
+        op.alter_column(table, 'end_time', nullable=False)
+        # one name on both tables, so a partition can move from one to the other
+        op.create_check_constraint('ck_show_end_after_start', table, 'end_time > start_time')
+
+    # an exclusion constraint can't be put on a partitioned table unless it
+    # includes the partition key with =, so the time slots live in this table
+    op.create_table('bookings',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('during', postgresql.TSRANGE(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+    sa.PrimaryKeyConstraint('show_id')
+    )
+    for table in SHOW_TABLES:
+        op.execute('INSERT INTO bookings (show_id, venue_id, artist_id, during) '
+                   f'SELECT id, venue_id, artist_id, tsrange(start_time, end_time) FROM {table}')
+
+    # the constraints would stop at the first double booking, so list them all first:
+    # a show overlaps an earlier one when it starts before the latest end so far
+    conflicts = []
+    for key in ('venue_id', 'artist_id'):
+        conflicts += op.get_bind().execute(f'''
+            SELECT show_id, '{key[:-3]}', {key}, during FROM (
+                SELECT show_id, {key}, during, max(upper(during)) OVER (
+                    PARTITION BY {key} ORDER BY lower(during), show_id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS busy_until
+                FROM bookings) booked
+            WHERE lower(during) < busy_until
+            ORDER BY show_id
+        ''').fetchall()
+    if conflicts:
+        listed = '\n'.join(f'  show {show_id} ({during}) overlaps another show of {kind} {entity_id}'
+                           for show_id, kind, entity_id, during in conflicts[:MAX_REPORTED_CONFLICTS])
+        raise RuntimeError(f'{len(conflicts)} shows are double booked; move or delete them and upgrade again '
+                           f'(shows had no end time so far, they are taken to last {DEFAULT_DURATION}):\n{listed}')
+    op.create_exclude_constraint('bookings_venue_overlap', 'bookings', ('venue_id', '='), ('during', '&&'),
+                                 using='gist')
+    op.create_exclude_constraint('bookings_artist_overlap', 'bookings', ('artist_id', '='), ('during', '&&'),
+                                 using='gist')
+
+    # keeps bookings in step with every write to the shows; a show moving to
+    # another partition arrives as a DELETE and an INSERT
+    op.execute('''
+        CREATE FUNCTION fyyur_booking_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM bookings WHERE show_id = OLD.id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO bookings (show_id, venue_id, artist_id, during)
+                VALUES (NEW.id, NEW.venue_id, NEW.artist_id, tsrange(NEW.start_time, NEW.end_time));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    for table in SHOW_TABLES:
+        op.execute(f'''
+            CREATE TRIGGER {table}_booking_sync
+            AFTER INSERT OR DELETE OR UPDATE OF id, venue_id, artist_id, start_time, end_time ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE fyyur_booking_sync()
+        ''')
+
+
+def downgrade():
+    for table in reversed(SHOW_TABLES):
+        op.execute(f'DROP TRIGGER {table}_booking_sync ON {table}')
+    op.execute('DROP FUNCTION fyyur_booking_sync()')
+    op.drop_table('bookings')
+    for table in reversed(SHOW_TABLES):
+        op.drop_constraint('ck_show_end_after_start', table, type_='check')
+        op.drop_column(table, 'end_time')
@@ -0,0 +1,40 @@
+"""venue coordinates with a geohash index, and the geocodes table of city centres
+
+Revision ID: f6a2c8e4b19d
+Revises: e3b9d5c7a14f
+Create Date: 2026-10-18 14:48:09.530172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a2c8e4b19d'
+down_revision = 'e3b9d5c7a14f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('geocodes',
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('state', 'city')
+    )
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    # C collation: byte order, so a geohash cell is one range of the index (see geo.py)
+    op.add_column('venue', sa.Column('geohash', sa.String(length=12, collation='C'), nullable=True))
+    op.create_index('ix_venue_geohash', 'venue', ['geohash'], unique=False)
+    # existing venues get their coordinates from `flask fyyur load-geocodes`
+
+
+def downgrade():
+    op.drop_index('ix_venue_geohash', table_name='venue')
+    op.drop_column('venue', 'geohash')
+    op.drop_column('venue', 'longitude')
+    op.drop_column('venue', 'latitude')
+    op.drop_table('geocodes')
@@ -0,0 +1,121 @@
+"""Keyset (cursor) pagination for SQLAlchemy queries.
+
+A page is selected with a row-value comparison on its sort key, e.g.
+``WHERE (name, id) > (:name, :id) ORDER BY name, id LIMIT :n``, so the
+database seeks straight to the page through an index however deep the user
+has paged, instead of walking and discarding OFFSET rows.
+
+Cursors are opaque, URL-safe strings that carry the direction and the sort
+key of the row the page starts after (or ends before).
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer, String, tuple_
+
+
+class Page(object):
+    """One page of rows plus the cursors of its neighbours (None at an end)."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(direction, values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    payload = json.dumps([direction, values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Returns ``(direction, values)``, or None for a malformed cursor."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(payload)
+        if direction not in ('next', 'prev') or len(values) != len(columns):
+            return None
+        return direction, [decode_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        return None
+
+
+def decode_value(column, value):
+    # a cursor comes from the client: a value that isn't of its column's type
+    # would reach the database and fail there, so it is refused here
+    if isinstance(value, bool) or value is None or isinstance(value, (list, dict)):
+        raise ValueError(f'{value!r} in a cursor')
+    if isinstance(column.type, DateTime):
+        if not isinstance(value, str):
+            raise ValueError(f'{value!r} is not a datetime')
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Integer) and not isinstance(value, int):
+        raise ValueError(f'{value!r} is not an integer')
+    if isinstance(column.type, Float):
+        if not isinstance(value, (int, float)):
+            raise ValueError(f'{value!r} is not a number')
+        return float(value)
+    if isinstance(column.type, String) and (not isinstance(value, str) or '\x00' in value):
+        raise ValueError(f'{value!r} is not a string')
+    return value
+
+
+def keyset(query, columns, cursor=None, limit=30):
+    """Narrows `query` to the page that `cursor` points at, plus one row.
+
+    Returns ``(query, position)``; `page_of` turns the rows it yields and
+    ``position`` into the `Page`. Split from `paginate` so the query can be
+    run by other means, e.g. the async read path.
+    """
+    decoded = decode_cursor(cursor, columns) if cursor else None
+    direction, values = decoded or ('next', None)
+
+    key = tuple_(*columns)
+    if direction == 'next':
+        if values is not None:
+            query = query.filter(key > tuple_(*values))
+        query = query.order_by(*[column.asc() for column in columns])
+    else:
+        query = query.filter(key < tuple_(*values))
+        query = query.order_by(*[column.desc() for column in columns])
+    return query.limit(limit + 1), (direction, values is not None, limit)
+
+
+def page_of(rows, columns, position):
+    direction, after_cursor, limit = position
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == 'prev':
+        rows.reverse()
+    if not rows:
+        return Page(rows)
+
+    def cursor_at(row, towards):
+        return encode_cursor(towards, [getattr(row, column.key) for column in columns])
+
+    if direction == 'next':
+        next_cursor = cursor_at(rows[-1], 'next') if has_more else None
+        prev_cursor = cursor_at(rows[0], 'prev') if after_cursor else None
+    else:
+        next_cursor = cursor_at(rows[-1], 'next')
+        prev_cursor = cursor_at(rows[0], 'prev') if has_more else None
+    return Page(rows, next_cursor, prev_cursor)
+
+
+def paginate(query, columns, cursor=None, limit=30):
+    """Returns the `Page` of `query` that `cursor` points at.
+
+    `columns` is the unique sort key, e.g. ``(Show.start_time, Show.id)``; the
+    rows must expose each column under its key. `query` must not be ordered.
+    A missing or malformed cursor yields the first page.
+    """
+    query, position = keyset(query, columns, cursor, limit)
+    return page_of(query.all(), columns, position)
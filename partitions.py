@@ -0,0 +1,116 @@
+"""Monthly range partitions of the shows table, and their archive.
+
+``shows`` is partitioned by range on ``start_time``, one partition per
+calendar month (``shows_p2026_10`` holds October 2026), plus
+``shows_default`` for any show outside the months created so far. Nearly
+all traffic is about the coming weeks, so its queries touch one or two
+small partitions and their indexes.
+
+``flask fyyur create-partitions`` creates the months ahead; run it
+regularly (e.g. daily from cron). A partition created for a month that
+already has shows in ``shows_default`` takes those rows over.
+
+``flask fyyur archive-shows`` detaches the partitions of long past months
+from ``shows`` and attaches them, unchanged, to ``shows_archive``, which is
+partitioned the same way. Moving a partition moves no rows. app.py reads the
+past shows of the venue and artist pages from both tables (``all_shows``),
+so archiving is invisible there; the listings, exports and counters work on
+``shows`` alone.
+
+Needs PostgreSQL 12 or later.
+"""
+import re
+from datetime import datetime
+
+PARENT = 'shows'
+ARCHIVE = 'shows_archive'
+DEFAULT = 'shows_default'
+BOOKINGS = 'bookings'
+
+BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month, count):
+    months = month.year * 12 + month.month - 1 + count
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARENT}_p{month:%Y_%m}'
+
+
+def bounds_sql(lower, upper):
+    # DDL takes no bind parameters; the bounds are always datetimes made here
+    return f"FOR VALUES FROM ('{lower:%Y-%m-%d %H:%M:%S}') TO ('{upper:%Y-%m-%d %H:%M:%S}')"
+
+
+def partitions(session, parent=PARENT):
+    """(name, lower, upper) of the range partitions of `parent`, oldest first."""
+    rows = session.execute(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)", {'parent': parent})
+    found = []
+    for name, bound in rows:
+        match = BOUNDS.search(bound)
+        if match:
+            found.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return sorted(found, key=lambda partition: partition[1])
+
+
+def create_partition(session, month):
+    lower, upper = month, add_months(month, 1)
+    name = partition_name(month)
+    in_month = 'start_time >= :lower AND start_time < :upper'
+    session.execute(f'CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    # attaching checks that shows_default holds nothing of the month, so move that over first
+    session.execute(f'WITH moved AS (DELETE FROM {DEFAULT} WHERE {in_month} RETURNING *) '
+                    f'INSERT INTO {name} SELECT * FROM moved', {'lower': lower, 'upper': upper})
+    session.execute(f'ALTER TABLE {PARENT} ATTACH PARTITION {name} {bounds_sql(lower, upper)}')
+    # the DELETE took the moved shows' bookings with it (the trigger on shows), the INSERT didn't bring them back
+    session.execute(f'INSERT INTO {BOOKINGS} (show_id, venue_id, artist_id, during) '
+                    f'SELECT id, venue_id, artist_id, tsrange(start_time, end_time) FROM {name}')
+    return name
+
+
+def create_partitions(session, through, since=None):
+    """Creates the missing monthly partitions of shows up to `through`'s month.
+
+    Starts at `since`'s month, or the month after the newest partition
+    (this month if there is none). Returns the names created.
+    """
+    existing = partitions(session)
+    if since is not None:
+        month = month_start(since)
+    elif existing:
+        month = existing[-1][2]
+    else:
+        month = month_start(datetime.now())
+    taken = {lower for name, lower, upper in existing + partitions(session, ARCHIVE)}
+    created = []
+    while month <= month_start(through):
+        if month not in taken:
+            created.append(create_partition(session, month))
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partitions(session, before):
+    """Moves the partitions of shows that end by `before` to shows_archive.
+
+    Only whole months that are over are moved: `before` is capped at the
+    start of the current month. Returns the names moved.
+    """
+    before = min(before, month_start(datetime.now()))
+    moved = []
+    for name, lower, upper in partitions(session):
+        if upper > before:
+            break
+        session.execute(f'ALTER TABLE {PARENT} DETACH PARTITION {name}')
+        session.execute(f'ALTER TABLE {ARCHIVE} ATTACH PARTITION {name} {bounds_sql(lower, upper)}')
+        moved.append(name)
+    return moved
@@ -0,0 +1,135 @@
+"""Read-replica routing for the Flask-SQLAlchemy session.
+
+`RoutingSQLAlchemy` is a drop-in ``SQLAlchemy`` whose session sends its
+statements to ``g.read_engine`` when a request has set one, and to the
+primary (``SQLALCHEMY_DATABASE_URI``) otherwise. `ReadRouting` sets it for
+reads only, so writes, the CLI and anything outside a request always use
+the primary, and a session that has started flushing changes goes to the
+primary as well.
+
+After a request that committed a transaction, `ReadRouting` pins the client
+to the primary for ``window`` seconds, so it sees its own change despite
+replica lag; a POST that only reads (a search) leaves it alone. The pin is
+kept in the session cookie, which every worker process has to be able to
+read: the app needs a SECRET_KEY shared by all of them. Pages stored in a
+cache shared by every client are rendered from the primary instead (see
+`ReadRouting.read_primary`), as a lagging replica would store a page older
+than the write that just invalidated it.
+
+`ReplicaPool` hands out the replica engines round-robin, health-checking
+each with ``SELECT 1`` before its first use and then every
+``check_interval`` seconds. A replica that fails a check, or fails a
+statement with an operational error, stays out of rotation until its next
+check passes. When every replica is down, reads fall back to the primary.
+"""
+import itertools
+import threading
+import time
+
+from flask import g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, exc, orm
+
+# the session key of the read-your-writes pin: when it ends, as a timestamp
+PRIMARY_UNTIL = '_primary_until'
+# set in the WSGI environ of a request the app makes itself that must read
+# from the primary; a client can't set it (its headers become HTTP_* keys)
+READ_PRIMARY = 'fyyur.read_primary'
+# set on g once the request's session has committed a transaction
+COMMITTED = '_committed'
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        engine = g.get('read_engine') if has_app_context() else None
+        if engine is not None and not self._flushing:
+            return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(session):
+    if has_request_context():
+        setattr(g, COMMITTED, True)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaPool(object):
+
+    def __init__(self, engines, check_interval=30):
+        self.engines = list(engines)
+        self.check_interval = check_interval
+        self._health = {}  # engine -> (healthy, when it was last checked)
+        self._cycle = itertools.cycle(self.engines)
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._on_error)
+
+    @classmethod
+    def from_uris(cls, uris, check_interval=30):
+        return cls([create_engine(uri, pool_pre_ping=True) for uri in uris], check_interval)
+
+    def choose(self):
+        """The next healthy replica, or None to read from the primary."""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self.healthy(engine):
+                return engine
+        return None
+
+    def healthy(self, engine):
+        healthy, checked_at = self._health.get(engine, (None, None))
+        if healthy is None or time.monotonic() - checked_at >= self.check_interval:
+            try:
+                with engine.connect() as connection:
+                    connection.execute('SELECT 1')
+                healthy = True
+            except exc.SQLAlchemyError:
+                healthy = False
+            self._health[engine] = (healthy, time.monotonic())
+        return healthy
+
+    def _on_error(self, context):
+        # a replica failing mid-request is out of rotation until its next check
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+            self._health[context.engine] = (False, time.monotonic())
+
+
+class ReadRouting(object):
+
+    def __init__(self, app=None, replicas=None, window=5):
+        self.replicas = replicas
+        self.window = window
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.replicas.engines and not app.secret_key:
+            raise RuntimeError('read replicas need a SECRET_KEY shared by every worker process, '
+                               'for the read-your-writes pin in the session cookie')
+        app.before_request(self._route)
+        app.after_request(self._pin)
+
+    def _route(self):
+        # GETs read from a replica, unless this client wrote in the last window seconds
+        if (request.method in ('GET', 'HEAD') and not request.environ.get(READ_PRIMARY)
+                and session.get(PRIMARY_UNTIL, 0) < time.time()):
+            g.read_engine = self.replicas.choose()
+
+    def read_primary(self):
+        """Sends the rest of this request's reads to the primary."""
+        g.read_engine = None
+
+    def _pin(self, response):
+        # after a write (the *_submission and delete handlers) this client reads
+        # from the primary for a while, so its own change shows despite replica lag
+        if g.get(COMMITTED) and self.replicas.engines:
+            session[PRIMARY_UNTIL] = time.time() + self.window
+        return response
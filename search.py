@@ -0,0 +1,175 @@
+"""Ranked full-text and fuzzy search over venues and artists.
+
+Both backends answer ``search(kind, term, cursor, limit, genres, genre_match)``
+with a `pagination.Page` of hits (rows exposing ``id``), best match first,
+plus the total number of matches. ``kind`` is ``'venue'`` or ``'artist'``; a
+search covers the name, city, state and genres, in that order of weight.
+``genres`` narrows the hits to the entities having all of them, or any
+with ``genre_match='any'`` (see facets.py).
+
+* `PostgresSearch` matches the ``search_vector`` tsvector column, which a
+  trigger keeps in step with the row, and the pg_trgm index on ``name`` for
+  substring and misspelled matches. Both are GIN-indexed (migration
+  4f1c2d7e9a60), so it never sequentially scans.
+* `SQLiteSearch` keeps its own FTS5 index, so search runs and can be
+  benchmarked without a Postgres server. It is fed through `index` and
+  `remove` by the write handlers and `rebuild` by ``flask fyyur reindex``.
+
+Pages are cursor based like the listings: the sort key is the rank followed
+by the id.
+"""
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+from sqlalchemy import Float, Integer, cast, column, func, literal_column, or_, true
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from sqlalchemy.sql import operators
+
+from facets import filter_genres
+from pagination import Page, decode_cursor, encode_cursor, paginate
+
+KINDS = ('venue', 'artist')
+
+Hit = namedtuple('Hit', 'id sort_rank')
+
+
+def search_words(term):
+    # lowercased word characters only, so user input can't inject query syntax
+    return re.findall(r'\w+', (term or '').lower())
+
+
+def search_document(entity):
+    """The searchable fields of a Venue or Artist."""
+    return {
+        'id': entity.id,
+        'name': entity.name or '',
+        'city': entity.city or '',
+        'state': entity.state or '',
+        'genres': ' '.join(entity.genres or []),
+    }
+
+
+class PostgresSearch(object):
+
+    def __init__(self, session, models):
+        self.session = session
+        self.models = models
+
+    def search(self, kind, term, cursor=None, limit=30, genres=(), genre_match='all'):
+        hits, sort_key = self.hits_query(kind, term, genres, genre_match)
+        return paginate(hits, sort_key, cursor, limit), hits.count()
+
+    def hits_query(self, kind, term, genres=(), genre_match='all'):
+        """The unordered ``(id, sort_rank)`` query of the matches, and its sort key."""
+        model = self.models[kind]
+        words = search_words(term)
+        if words:
+            query = func.to_tsquery('simple', ' & '.join(word + ':*' for word in words))
+            phrase = ' '.join(words)
+            match = or_(
+                model.search_vector.op('@@')(query),
+                # pg_trgm similarity; mod() so the driver's paramstyle escapes the %
+                operators.mod(model.name, phrase),
+                model.name.ilike('%{}%'.format(phrase)),
+            )
+            rank = func.ts_rank(model.search_vector, query) + func.similarity(model.name, phrase)
+        else:
+            # a constant, not a parameter: asyncpg can't type the parameter of -$1
+            match, rank = true(), literal_column('0')
+        # float8 so the rank survives the round trip through the cursor exactly
+        sort_rank = cast(-rank, DOUBLE_PRECISION).label('sort_rank')
+
+        hits = filter_genres(self.session.query(model.id, sort_rank).filter(match), model.genres, genres, genre_match)
+        return hits, (sort_rank, model.id)
+
+    def index(self, kind, document):
+        pass  # the search_vector trigger indexes rows as they are written
+
+    def remove(self, kind, entity_id):
+        pass
+
+    def rebuild(self, kind, documents):
+        pass
+
+
+class SQLiteSearch(object):
+    # FTS5 matches every word as a prefix; bm25 scores are negative, best first
+
+    # bm25 column weights: name, city/state, genres
+    WEIGHTS = (10.0, 5.0, 2.0)
+    SORT_KEY = (column('sort_rank', Float), column('id', Integer))
+
+    def __init__(self, path=':memory:'):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            for kind in KINDS:
+                self.connection.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {kind}_search "
+                    f"USING fts5(name, place, genres, prefix='2 3')"
+                )
+
+    def search(self, kind, term, cursor=None, limit=30, genres=(), genre_match='all'):
+        table = f'{kind}_search'
+        words = search_words(term)
+        conditions = [' AND '.join(f'"{word}"*' for word in words)] if words else []
+        # a genre is a phrase of the genres column, the whole genre rather than a prefix
+        phrases = [f'''genres : "{' '.join(search_words(genre))}"''' for genre in genres if search_words(genre)]
+        if phrases:
+            conditions.append('(' + (' OR ' if genre_match == 'any' else ' AND ').join(phrases) + ')')
+        if conditions:
+            weights = ', '.join(str(weight) for weight in self.WEIGHTS)
+            score = f'bm25({table}, {weights})' if words else '0.0'
+            ranked = f'SELECT rowid AS id, {score} AS sort_rank FROM {table} WHERE {table} MATCH ?'
+            match = [' AND '.join(conditions)]
+        else:
+            ranked = f'SELECT rowid AS id, 0.0 AS sort_rank FROM {table}'
+            match = []
+
+        decoded = decode_cursor(cursor, self.SORT_KEY) if cursor else None
+        direction, values = decoded or ('next', None)
+        sql, params = f'SELECT id, sort_rank FROM ({ranked})', list(match)
+        if values is not None:
+            sql += ' WHERE (sort_rank, id) > (?, ?)' if direction == 'next' else ' WHERE (sort_rank, id) < (?, ?)'
+            params += values
+        sql += ' ORDER BY sort_rank, id' if direction == 'next' else ' ORDER BY sort_rank DESC, id DESC'
+
+        with self.lock:
+            rows = [Hit(*row) for row in self.connection.execute(sql + ' LIMIT ?', params + [limit + 1])]
+            total = self.connection.execute(f'SELECT count(*) FROM ({ranked})', match).fetchone()[0]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == 'prev':
+            rows.reverse()
+        if not rows:
+            return Page(rows), total
+        first = encode_cursor('prev', [rows[0].sort_rank, rows[0].id])
+        last = encode_cursor('next', [rows[-1].sort_rank, rows[-1].id])
+        if direction == 'next':
+            return Page(rows, last if has_more else None, first if values is not None else None), total
+        return Page(rows, last, first if has_more else None), total
+
+    def index(self, kind, document):
+        with self.lock, self.connection:
+            self._write(kind, document)
+
+    def remove(self, kind, entity_id):
+        with self.lock, self.connection:
+            self.connection.execute(f'DELETE FROM {kind}_search WHERE rowid = ?', (entity_id,))
+
+    def rebuild(self, kind, documents):
+        with self.lock, self.connection:
+            self.connection.execute(f'DELETE FROM {kind}_search')
+            for document in documents:
+                self._write(kind, document)
+
+    def _write(self, kind, document):
+        self.connection.execute(f'DELETE FROM {kind}_search WHERE rowid = ?', (document['id'],))
+        self.connection.execute(
+            f'INSERT INTO {kind}_search (rowid, name, place, genres) VALUES (?, ?, ?, ?)',
+            (document['id'], document['name'], f"{document['city']} {document['state']}", document['genres'])
+        )
+
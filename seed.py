@@ -0,0 +1,182 @@
+"""Synthetic venues, artists and shows (``flask fyyur seed``).
+
+The data is skewed the way real listings are: a few venues and artists
+host most of the shows (Pareto-distributed popularity), venues cluster in
+big cities (scattered around the city centres of data/geocodes.csv),
+artists play one to four genres with a few genres far more common than
+the rest, and shows spread over the last two years and the next six
+months, mostly in the evening, an hour to two long and never double
+booked. With ``random_seed`` the same dataset comes out every time, which
+the route benchmarks rely on.
+
+Rows go in through the importer's COPY path, with the show counters kept
+in step, so seeding a few hundred thousand shows takes seconds.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+from app import db, Venue, Artist, Show, search_engine, search_document, page_cache
+from forms import VenueForm
+from importer import VENUE_COLUMNS, ARTIST_COLUMNS, SHOW_COLUMNS, BATCH_SIZE, insert_rows, add_show_counts
+from partitions import create_partitions
+from geo import geohash, read_geocodes
+
+GENRES = [genre for genre, label in VenueForm.genres.kwargs['choices']]
+CITIES = (
+    ('New York', 'NY', 30), ('Los Angeles', 'CA', 20), ('San Francisco', 'CA', 12), ('Chicago', 'IL', 10),
+    ('Austin', 'TX', 8), ('Nashville', 'TN', 8), ('Seattle', 'WA', 6), ('New Orleans', 'LA', 6),
+    ('Boston', 'MA', 5), ('Denver', 'CO', 4), ('Atlanta', 'GA', 4),
+)
+ADJECTIVES = ('Blue', 'Golden', 'Velvet', 'Electric', 'Rusty', 'Silver', 'Hidden', 'Crooked', 'Midnight', 'Neon',
+              'Wild', 'Little', 'Grand', 'Broken', 'Lucky', 'Red', 'Quiet', 'Paper', 'Iron', 'Copper')
+VENUE_NOUNS = ('Room', 'Hall', 'Lounge', 'Tavern', 'Ballroom', 'Theatre', 'Cellar', 'Garden', 'Warehouse', 'Club')
+ARTIST_NOUNS = ('Foxes', 'Tides', 'Engines', 'Sparrows', 'Lanterns', 'Rivers', 'Ghosts', 'Wolves', 'Echoes', 'Kings')
+FIRST_NAMES = ('Ada', 'Miles', 'Nina', 'Otis', 'June', 'Ray', 'Etta', 'Hank', 'Billie', 'Louis', 'Patsy', 'Sam')
+LAST_NAMES = ('Monroe', 'Hayes', 'Porter', 'Wells', 'Brooks', 'Carter', 'Flynn', 'Reyes', 'Lowe', 'Shaw')
+
+
+def popularity(rng, count, alpha):
+    # cumulative Pareto weights: a handful of entities get most of the picks
+    return list(accumulate(rng.paretovariate(alpha) for _ in range(count)))
+
+
+def unique_name(rng, seen, *parts):
+    name = ' '.join(rng.choice(part) for part in parts)
+    seen[name] = seen.get(name, 0) + 1
+    return name if seen[name] == 1 else f'{name} {seen[name]}'
+
+
+def pick_genres(rng, weights, most):
+    count = min(most, 1 + int(rng.expovariate(1.2)))
+    return sorted(set(rng.choices(GENRES, cum_weights=weights, k=count)))
+
+
+def venue_rows(rng, count, genre_weights):
+    city_weights = list(accumulate(weight for city, state, weight in CITIES))
+    centres = {(row['city'], row['state']): (row['latitude'], row['longitude']) for row in read_geocodes()}
+    seen = {}
+    for i in range(count):
+        city, state, _ = rng.choices(CITIES, cum_weights=city_weights)[0]
+        name = unique_name(rng, seen, ('The',), ADJECTIVES, VENUE_NOUNS)
+        # within ten kilometres or so of the centre
+        latitude = round(centres[city, state][0] + rng.gauss(0, 0.05), 6)
+        longitude = round(centres[city, state][1] + rng.gauss(0, 0.06), 6)
+        yield {
+            'name': name, 'city': city, 'state': state,
+            'address': f'{rng.randint(1, 2000)} {rng.choice(LAST_NAMES)} St',
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'genres': pick_genres(rng, genre_weights, 3),
+            'image_link': f'https://picsum.photos/seed/venue{i}/600/400',
+            'website': f'https://venue{i}.example.com', 'facebook_link': f'https://www.facebook.com/venue{i}',
+            'seeking_talent': rng.random() < 0.3,
+            'seeking_description': None,
+            'latitude': latitude, 'longitude': longitude, 'geohash': geohash(latitude, longitude),
+        }
+
+
+def artist_rows(rng, count, genre_weights):
+    seen = {}
+    for i in range(count):
+        if rng.random() < 0.4:
+            name = unique_name(rng, seen, FIRST_NAMES, LAST_NAMES)
+        else:
+            name = unique_name(rng, seen, ('The',), ADJECTIVES, ARTIST_NOUNS)
+        city, state, _ = rng.choice(CITIES)
+        yield {
+            'name': name, 'city': city, 'state': state,
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'genres': pick_genres(rng, genre_weights, 4),
+            'image_link': f'https://picsum.photos/seed/artist{i}/400/400',
+            'website': None, 'facebook_link': f'https://www.facebook.com/artist{i}',
+            'seeking_venue': rng.random() < 0.2,
+            'seeking_description': None,
+        }
+
+
+def show_rows(rng, count, venue_ids, artist_ids, now, attempts=20, give_up=1000):
+    venue_weights = popularity(rng, len(venue_ids), 1.2)
+    artist_weights = popularity(rng, len(artist_ids), 1.5)
+    first_day = (now - timedelta(days=730)).replace(hour=0, minute=0, second=0, microsecond=0)
+    # the half hours each venue and artist is booked for, as the exclusion constraints want no overlap
+    booked = set()
+    made = misses = 0
+    # once give_up pairs in a row found no free evening the calendars are about
+    # full, and fewer than count shows come out
+    while made < count and misses < give_up:
+        venue_id = rng.choices(venue_ids, cum_weights=venue_weights)[0]
+        artist_id = rng.choices(artist_ids, cum_weights=artist_weights)[0]
+        # a busy pair gets a few tries at a free evening, then another pair is drawn
+        for _ in range(attempts):
+            day = first_day + timedelta(days=rng.randint(0, 730 + 182))
+            start_time = day.replace(hour=rng.choice((18, 19, 20, 20, 21, 21, 22, 23)),
+                                     minute=rng.choice((0, 0, 30)), second=0, microsecond=0)
+            length = rng.choice((2, 3, 3, 4))
+            first = (start_time - first_day) // timedelta(minutes=30)
+            slots = [(kind, entity_id, half_hour) for half_hour in range(first, first + length)
+                     for kind, entity_id in (('venue', venue_id), ('artist', artist_id))]
+            if booked.isdisjoint(slots):
+                break
+        else:
+            misses += 1
+            continue
+        misses = 0
+        booked.update(slots)
+        made += 1
+        yield {
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': start_time + timedelta(minutes=30 * length),
+            'counted_as_upcoming': start_time > now,
+        }
+
+
+def load(table, columns, rows, batch_size, counted=False):
+    """Inserts the rows a batch at a time; returns how many there were."""
+    rows = iter(rows)
+    loaded = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return loaded
+        loaded += len(batch)
+        insert_rows(table, columns, batch)
+        if counted:
+            add_show_counts(batch)
+        db.session.commit()
+
+
+def seed(venues, artists, shows, random_seed=None, reset=False, batch_size=BATCH_SIZE, out=sys.stdout):
+    """Adds synthetic venues, artists and shows, the shows spread over every venue and artist."""
+    rng = random.Random(random_seed)
+    started = time.monotonic()
+    if reset:
+        db.session.execute('TRUNCATE shows, venue, artist RESTART IDENTITY CASCADE')
+        db.session.commit()
+
+    genre_weights = popularity(rng, len(GENRES), 1.0)
+    load(Venue.__table__, VENUE_COLUMNS, venue_rows(rng, venues, genre_weights), batch_size)
+    load(Artist.__table__, ARTIST_COLUMNS, artist_rows(rng, artists, genre_weights), batch_size)
+    venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id).order_by(Venue.id)]
+    artist_ids = [artist_id for (artist_id,) in db.session.query(Artist.id).order_by(Artist.id)]
+    made = 0
+    if shows and venue_ids and artist_ids:
+        now = datetime.now()
+        # a partition for every month the shows fall in, rather than shows_default
+        create_partitions(db.session, now + timedelta(days=182), since=now - timedelta(days=730))
+        rows = show_rows(rng, shows, venue_ids, artist_ids, now)
+        made = load(Show.__table__, SHOW_COLUMNS, rows, batch_size, counted=True)
+        if made < shows:
+            print(f"warning: only {made} of {shows} shows fit, the venues' and artists' evenings are full", file=out)
+
+    for kind, model in (('venue', Venue), ('artist', Artist)):
+        search_engine.rebuild(kind, (search_document(entity) for entity in model.query.yield_per(1000)))
+    page_cache.invalidate(('venues', {}), ('artists', {}), ('shows', {}))
+    # every detail page may have gained shows, or (after a reset) belong to a new row
+    page_cache.invalidate(*[('show_venue', {'venue_id': venue_id}) for venue_id in venue_ids])
+    page_cache.invalidate(*[('show_artist', {'artist_id': artist_id}) for artist_id in artist_ids])
+    print(f'{venues} venues, {artists} artists and {made} shows seeded in {time.monotonic() - started:.1f}s',
+          file=out)
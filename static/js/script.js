@@ -2,3 +2,32 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// name pickers of the new show form: <input data-suggest="artist|venue"
+// data-target="<id field>" list="<datalist>"> offers the names from
+// /api/v1/suggest and copies the id of the one picked into the id field
+Array.prototype.forEach.call(document.querySelectorAll('input[data-suggest]'), function(input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var target = document.getElementById(input.getAttribute('data-target'));
+  var pending;
+  input.addEventListener('input', function() {
+    var picked = /#(\d+)$/.exec(input.value);
+    if (picked) {
+      target.value = picked[1];
+      return;
+    }
+    clearTimeout(pending);
+    pending = setTimeout(function() {
+      fetch('/api/v1/suggest?type=' + input.getAttribute('data-suggest') + '&q=' + encodeURIComponent(input.value))
+        .then(function(response) { return response.json(); })
+        .then(function(body) {
+          list.innerHTML = '';
+          body.data.forEach(function(match) {
+            var option = document.createElement('option');
+            option.value = match.name + ' #' + match.id;
+            list.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
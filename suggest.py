@@ -0,0 +1,172 @@
+"""Typeahead suggestions: venue and artist names by prefix, from memory.
+
+`SuggestIndex` keeps, for each kind (``'venue'``, ``'artist'``), the names
+by id and an array of entries sorted by key. Each name has one entry per
+word, whose key is the name from that word on, casefolded. So "Blue" finds
+"The Blue Hall" as well as "Blue Note". An entry is a single integer (the
+id and the offset of the word) and keys are sliced from the names when
+compared, so the index costs little more than the names themselves. A
+lookup bisects to the first key at or after the prefix and walks forward
+while keys start with it. It takes microseconds and never touches the
+database. Adding or removing a name shifts the array, which takes
+milliseconds at a million names.
+
+The index is filled by `start`, on a thread, from ``load(kind)``, which
+yields ``(id, name)``. Until then `suggest` waits for it. The write handlers
+keep it current with `add` and `remove` once their change is committed. A
+write in another worker process only shows after the next rebuild here,
+which happens once the index is ``refresh_interval`` seconds old. Writes
+made while a rebuild reads the table are replayed on the new index.
+
+Memory and build time at a million names: benchmarks/suggest.py.
+"""
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+KINDS = ('venue', 'artist')
+
+
+OFFSET_BITS = 16  # an entry is the entity id shifted left, plus where its word starts in the name
+OFFSET_MASK = (1 << OFFSET_BITS) - 1
+
+
+def tidy(name):
+    # names are kept with their whitespace collapsed, so a key is just the casefolded name
+    return ' '.join((name or '').split())
+
+
+def normalize(text):
+    return tidy(text).casefold()
+
+
+def name_entries(entity_id, name):
+    """The entries of a tidied name: one per word, each the offset of the word in the casefolded name."""
+    return [entity_id << OFFSET_BITS | word.start()
+            for word in re.finditer(r'\w+', name.casefold()) if word.start() <= OFFSET_MASK]
+
+
+class SortedKeys(object):
+    """The entries of one kind seen as their (key, entry) pairs, which bisect can search.
+
+    The key of an entry is the normalized name from its word on; it isn't
+    stored, a million names would take hundreds of MiB of strings.
+    """
+
+    def __init__(self, entries, names):
+        self.entries = entries
+        self.names = names
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, position):
+        return self.key(self.entries[position])
+
+    def key(self, entry):
+        return self.names[entry >> OFFSET_BITS].casefold()[entry & OFFSET_MASK:], entry
+
+
+class SuggestIndex(object):
+
+    def __init__(self, load, refresh_interval=300):
+        self.load = load
+        self.refresh_interval = refresh_interval
+        self.built_at = None
+        self._entries = {kind: array('q') for kind in KINDS}
+        self._names = {kind: {} for kind in KINDS}  # id -> name
+        self._journal = None  # (method, args) of the writes made during a rebuild
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._building = False
+
+    def start(self):
+        """Builds the index on a thread, unless it is being built."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            self._journal = []
+        threading.Thread(target=self._rebuild, name='suggest-index', daemon=True).start()
+
+    def suggest(self, kind, prefix, limit=10):
+        """[(id, name)] of up to limit names with a word starting with prefix, in key order."""
+        if not self._ready.is_set():
+            self.start()
+            self._ready.wait()
+        elif self.built_at is None or (self.refresh_interval
+                                       and time.monotonic() - self.built_at > self.refresh_interval):
+            self.start()  # stale, or the last build failed; this lookup still reads the current index
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = {}
+        with self._lock:
+            keys, names = SortedKeys(self._entries[kind], self._names[kind]), self._names[kind]
+            position = bisect_left(keys, (prefix,))
+            while len(found) < limit and position < len(keys):
+                key, entry = keys[position]
+                if not key.startswith(prefix):
+                    break
+                found.setdefault(entry >> OFFSET_BITS, names[entry >> OFFSET_BITS])
+                position += 1
+        return list(found.items())
+
+    def add(self, kind, entity_id, name):
+        """Indexes a new name, or the new name of entity_id."""
+        with self._lock:
+            self._add(kind, entity_id, name)
+            if self._journal is not None:
+                self._journal.append((self._add, (kind, entity_id, name)))
+
+    def remove(self, kind, entity_id):
+        with self._lock:
+            self._remove(kind, entity_id)
+            if self._journal is not None:
+                self._journal.append((self._remove, (kind, entity_id)))
+
+    def stats(self):
+        return {kind: {'names': len(self._names[kind]), 'entries': len(self._entries[kind])} for kind in KINDS}
+
+    def _rebuild(self):
+        try:
+            built = {kind: self._build(self.load(kind)) for kind in KINDS}
+            with self._lock:
+                self._entries = {kind: entries for kind, (entries, names) in built.items()}
+                self._names = {kind: names for kind, (entries, names) in built.items()}
+                for method, args in self._journal:
+                    method(*args)
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._journal = None
+                self._building = False
+            self._ready.set()
+
+    @staticmethod
+    def _build(rows):
+        names = {entity_id: tidy(name) for entity_id, name in rows}
+        entries = array('q')
+        for entity_id, name in names.items():
+            entries.extend(name_entries(entity_id, name))
+        return array('q', sorted(entries, key=SortedKeys(entries, names).key)), names
+
+    def _add(self, kind, entity_id, name):
+        self._remove(kind, entity_id)
+        name = self._names[kind][entity_id] = tidy(name)
+        entries = self._entries[kind]
+        keys = SortedKeys(entries, self._names[kind])
+        for entry in name_entries(entity_id, name):
+            entries.insert(bisect_left(keys, keys.key(entry)), entry)
+
+    def _remove(self, kind, entity_id):
+        name = self._names[kind].get(entity_id)
+        if name is None:
+            return
+        entries = self._entries[kind]
+        keys = SortedKeys(entries, self._names[kind])
+        for entry in name_entries(entity_id, name):
+            del entries[bisect_left(keys, keys.key(entry))]
+        del self._names[kind][entity_id]
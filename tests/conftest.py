@@ -0,0 +1,29 @@
+"""Shared fixtures.
+
+Tests marked with the ``database`` fixture run the app against a scratch
+Postgres database named by FYYUR_TEST_DATABASE_URL, migrated to the latest
+revision; they empty its tables. Without it they are skipped, and the
+tests that need no Postgres still run.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+DATABASE_URL = os.environ.get('FYYUR_TEST_DATABASE_URL')
+if DATABASE_URL:
+    config.SQLALCHEMY_DATABASE_URI = DATABASE_URL
+
+
+@pytest.fixture(scope='session')
+def database():
+    if not DATABASE_URL:
+        pytest.skip('FYYUR_TEST_DATABASE_URL is not set')
+    import flask_migrate
+    from app import app
+    with app.app_context():
+        flask_migrate.upgrade()
+    return app
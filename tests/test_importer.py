@@ -0,0 +1,29 @@
+"""Values survive the COPY path of the bulk import as they were written."""
+import json
+import os
+
+from sqlalchemy import text
+
+ARTISTS = [
+    {'name': '\\N', 'city': 'San Francisco', 'state': 'CA', 'phone': '4155550100', 'genres': ['Jazz'],
+     'seeking_description': '\\N'},
+    {'name': 'Quoted "Name", with a comma', 'city': 'New York', 'state': 'NY', 'phone': '2125550100',
+     'genres': ['Jazz', 'Folk'], 'seeking_description': 'line one\nline two'},
+]
+
+
+def test_text_that_looks_like_null_is_kept(database, tmp_path):
+    from app import db, Artist
+    from importer import import_file
+    path = tmp_path / 'artists.ndjson'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in ARTISTS))
+    with database.app_context():
+        db.session.execute(text('TRUNCATE shows, venue, artist RESTART IDENTITY CASCADE'))
+        db.session.commit()
+        assert import_file('artist', str(path), out=open(os.devnull, 'w')) == (2, 0)
+        loaded = db.session.query(Artist.name, Artist.seeking_description, Artist.genres, Artist.website)\
+            .order_by(Artist.id).all()
+    assert [tuple(row) for row in loaded] == [
+        ('\\N', '\\N', ['Jazz'], ''),
+        ('Quoted "Name", with a comma', 'line one\nline two', ['Jazz', 'Folk'], ''),
+    ]
@@ -0,0 +1,114 @@
+"""The job queue's claims, retries, dead-lettering and leases, on SQLiteQueue."""
+from contextlib import nullcontext
+from datetime import datetime
+
+import pytest
+
+from jobs import SQLiteQueue
+
+
+class WorkerDied(BaseException):
+    # what a killed worker looks like to the queue: its job never finishes
+    pass
+
+
+def make_queue(tmp_path, **kwargs):
+    queue = SQLiteQueue(str(tmp_path / 'jobs.db'), **kwargs)
+    queue.ran = []
+
+    @queue.handler('record')
+    def record(value):
+        queue.ran.append(value)
+
+    @queue.handler('fail')
+    def fail():
+        raise RuntimeError('no luck')
+
+    @queue.handler('die')
+    def die():
+        raise WorkerDied()
+    return queue
+
+
+def run_at(queue, job_id):
+    (value,) = queue.connection.execute('SELECT run_at FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return datetime.fromisoformat(value)
+
+
+def test_due_jobs_are_claimed_in_order_and_deleted_once_done(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.enqueue('record', value='later', delay=60)
+    queue.enqueue('record', value='first')
+    queue.enqueue('record', value='second')
+    assert queue.work(nullcontext) and queue.work(nullcontext)
+    assert not queue.work(nullcontext)
+    assert queue.ran == ['first', 'second']
+    assert queue.counts() == {'queued': 1, 'running': 0, 'dead': 0}
+
+
+def test_unknown_kinds_are_refused(tmp_path):
+    with pytest.raises(ValueError):
+        make_queue(tmp_path).enqueue('nothing')
+
+
+def test_failed_jobs_are_retried_after_a_backoff(tmp_path):
+    queue = make_queue(tmp_path, backoff=10, max_backoff=3600)
+    job_id = queue.enqueue('fail')
+    before = datetime.utcnow()
+    assert queue.work(nullcontext)
+    delay = (run_at(queue, job_id) - before).total_seconds()
+    assert 8 <= delay <= 12.5
+    assert not queue.work(nullcontext)  # not due yet
+    assert queue.counts() == {'queued': 1, 'running': 0, 'dead': 0}
+    (attempts, error), = queue.connection.execute('SELECT attempts, last_error FROM jobs').fetchall()
+    assert attempts == 1 and 'RuntimeError: no luck' in error
+
+
+def test_backoff_doubles_up_to_its_cap(tmp_path):
+    queue = make_queue(tmp_path, backoff=10, max_backoff=60)
+    for attempts, base in ((1, 10), (2, 20), (3, 40), (4, 60), (10, 60)):
+        assert base * 0.8 <= queue.retry_delay(attempts) <= base * 1.2
+
+
+def test_jobs_failing_every_attempt_are_dead_lettered_and_can_be_requeued(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=3, backoff=0, max_backoff=0)
+    queue.enqueue('fail')
+    assert [queue.work(nullcontext) for _ in range(4)] == [True, True, True, False]
+    assert queue.counts() == {'queued': 0, 'running': 0, 'dead': 1}
+    dead, = queue.dead()
+    assert dead['kind'] == 'fail' and dead['attempts'] == 3 and 'no luck' in dead['last_error']
+
+    queue.handlers['fail'] = lambda: queue.ran.append('fixed')
+    assert queue.requeue_dead() == 1
+    assert queue.work(nullcontext) and queue.ran == ['fixed']
+    assert queue.counts() == {'queued': 0, 'running': 0, 'dead': 0}
+
+
+def test_a_job_whose_worker_died_waits_for_its_lease(tmp_path):
+    queue = make_queue(tmp_path, lease=300)
+    queue.enqueue('die')
+    with pytest.raises(WorkerDied):
+        queue.work(nullcontext)
+    assert queue.counts() == {'queued': 0, 'running': 1, 'dead': 0}
+    assert not queue.work(nullcontext)
+
+
+def test_an_expired_lease_is_claimed_again(tmp_path):
+    queue = make_queue(tmp_path, lease=0)
+    job_id = queue.enqueue('die')
+    with pytest.raises(WorkerDied):
+        queue.work(nullcontext)
+    queue.handlers['die'] = lambda: queue.ran.append('second worker')
+    assert queue.work(nullcontext) and queue.ran == ['second worker']
+    assert queue.connection.execute('SELECT count(*) FROM jobs WHERE id = ?', (job_id,)).fetchone() == (0,)
+
+
+def test_a_job_that_kills_every_worker_is_dead_lettered(tmp_path):
+    queue = make_queue(tmp_path, lease=0, max_attempts=2)
+    queue.enqueue('die')
+    for _ in range(2):
+        with pytest.raises(WorkerDied):
+            queue.work(nullcontext)
+    assert queue.work(nullcontext)
+    dead, = queue.dead()
+    assert dead['attempts'] == 3 and dead['last_error'] == 'lease expired on every attempt'
@@ -0,0 +1,35 @@
+"""Cursors are decoded into their columns' types, or refused."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Column, DateTime, Float, Integer, String
+
+from pagination import decode_cursor, encode_cursor
+
+COLUMNS = (Column('start_time', DateTime), Column('name', String), Column('rank', Float), Column('id', Integer))
+
+
+def test_round_trip():
+    values = [datetime(2026, 10, 18, 20, 30), 'The Musical Hop', -0.25, 7]
+    assert decode_cursor(encode_cursor('prev', values), COLUMNS) == ('prev', values)
+
+
+@pytest.mark.parametrize('values', [
+    ['x', 'name', 0.5, 1],                       # not a datetime
+    [17, 'name', 0.5, 1],
+    ['2026-10-18T20:30:00', {'a': 1}, 0.5, 1],   # not a string
+    ['2026-10-18T20:30:00', 'na\x00me', 0.5, 1],
+    ['2026-10-18T20:30:00', 'name', 'high', 1],  # not a number
+    ['2026-10-18T20:30:00', 'name', 0.5, 'x'],   # not an integer
+    ['2026-10-18T20:30:00', 'name', 0.5, 1.5],
+    ['2026-10-18T20:30:00', 'name', 0.5, True],
+    ['2026-10-18T20:30:00', 'name', 0.5, None],
+    ['2026-10-18T20:30:00', 'name', 0.5],        # too few
+])
+def test_tampered_values_are_refused(values):
+    assert decode_cursor(encode_cursor('next', values), COLUMNS) is None
+
+
+@pytest.mark.parametrize('cursor', ['', 'not base64!', encode_cursor('sideways', [1]), 'WyJuZXh0IiwxXQ'])
+def test_malformed_cursors_are_refused(cursor):
+    assert decode_cursor(cursor, COLUMNS[-1:]) is None
@@ -0,0 +1,38 @@
+"""The hot queries use indexes, and /shows leaves past months' partitions alone.
+
+The check of benchmarks/query_plans.py, at a scale where Postgres prefers an
+index wherever one fits.
+"""
+import os
+from datetime import datetime
+
+import pytest
+
+from cache import LRUBackend
+
+SIZE = (1000, 2000, 40000)  # venues, artists, shows
+
+
+@pytest.fixture
+def analyzed(database, monkeypatch):
+    import app
+    from seed import seed
+    with database.app_context():
+        seed(*SIZE, random_seed=1, reset=True, out=open(os.devnull, 'w'))
+    # plans() reads the genre facet counts, which must come from this data
+    monkeypatch.setattr(app.genre_facets, 'cache', LRUBackend())
+    return database
+
+
+def test_no_sequential_scans_or_past_partitions(analyzed):
+    from app import db
+    from benchmarks.query_plans import analyze, check, explain, plans, scans
+    with analyzed.app_context():
+        empty = analyze()
+        failures = {}
+        for name, query in plans():
+            sequential, past = check(name, list(scans(explain(query))), empty, datetime.now())
+            if sequential or past:
+                failures[name] = sequential + past
+        db.session.rollback()
+    assert failures == {}
@@ -0,0 +1,115 @@
+"""Read-replica routing, with two SQLite files standing in for the primary and a replica."""
+import sqlite3
+import time
+
+import pytest
+from flask import Flask, jsonify, request
+
+import routing
+from cache import LRUBackend, ResponseCache
+from routing import RoutingSQLAlchemy, ReplicaPool, ReadRouting, READ_PRIMARY
+
+WINDOW = 5
+
+
+def make_app(tmp_path, replica_path, secret_key='test'):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "primary.db"}',
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False, SECRET_KEY=secret_key)
+    db = RoutingSQLAlchemy(app)
+
+    class Item(db.Model):
+        __tablename__ = 'items'
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String, nullable=False)
+
+    read_routing = ReadRouting(app, ReplicaPool.from_uris([f'sqlite:///{replica_path}']), WINDOW)
+    page_cache = ResponseCache(LRUBackend(), read_routing.read_primary)
+
+    @app.route('/items', methods=['GET', 'POST'])
+    def items():
+        if request.method == 'POST':
+            db.session.add(Item(name=request.form['name']))
+            db.session.commit()
+            return '', 201
+        return jsonify([item.name for item in Item.query.order_by(Item.id)])
+
+    @app.route('/items/search', methods=['POST'])
+    def search_items():
+        return jsonify([item.name for item in Item.query.filter(Item.name.contains(request.form['term']))])
+
+    @app.route('/items/cached')
+    @page_cache.cached()
+    def cached_items():
+        return jsonify([item.name for item in Item.query.order_by(Item.id)])
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def replica_path(tmp_path):
+    # the replica has the table with a row the primary lacks, so a response tells where it was read
+    path = tmp_path / 'replica.db'
+    with sqlite3.connect(str(path)) as connection:
+        connection.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)')
+        connection.execute("INSERT INTO items (name) VALUES ('replicated')")
+    return path
+
+
+def test_reads_go_to_the_replica(tmp_path, replica_path):
+    client = make_app(tmp_path, replica_path).test_client()
+    assert client.get('/items').get_json() == ['replicated']
+
+
+def test_writer_reads_its_writes_from_the_primary(tmp_path, replica_path, monkeypatch):
+    app = make_app(tmp_path, replica_path)
+    writer, other = app.test_client(), app.test_client()
+    assert writer.post('/items', data={'name': 'added'}).status_code == 201
+    assert writer.get('/items').get_json() == ['added']
+    assert other.get('/items').get_json() == ['replicated']
+
+    later = time.time() + WINDOW + 1
+    monkeypatch.setattr(routing.time, 'time', lambda: later)
+    assert writer.get('/items').get_json() == ['replicated']
+
+
+def test_requests_flagged_by_the_app_read_from_the_primary(tmp_path, replica_path):
+    # e.g. the page warming jobs, which follow a write
+    app = make_app(tmp_path, replica_path)
+    app.test_client().post('/items', data={'name': 'added'})
+    assert app.test_client().get('/items', environ_base={READ_PRIMARY: True}).get_json() == ['added']
+
+
+def test_a_post_that_only_reads_does_not_pin(tmp_path, replica_path):
+    client = make_app(tmp_path, replica_path).test_client()
+    assert client.post('/items/search', data={'term': 'x'}).status_code == 200
+    assert client.get('/items').get_json() == ['replicated']
+
+
+def test_cached_pages_are_stored_from_the_primary(tmp_path, replica_path):
+    # the stored page is served to every client, none of which may see it older than a write
+    app = make_app(tmp_path, replica_path)
+    app.test_client().post('/items', data={'name': 'added'})
+    for client in (app.test_client(), app.test_client()):
+        assert client.get('/items/cached').get_json() == ['added']
+
+
+def test_pin_survives_another_process_with_the_same_key(tmp_path, replica_path):
+    # each gunicorn worker builds its own app; the cookie set by one must pin the client in the others
+    writer = make_app(tmp_path, replica_path).test_client()
+    writer.post('/items', data={'name': 'added'})
+    other_worker = make_app(tmp_path, replica_path).test_client()
+    other_worker.cookie_jar = writer.cookie_jar
+    assert other_worker.get('/items').get_json() == ['added']
+
+
+def test_reads_fall_back_to_the_primary_when_the_replica_is_down(tmp_path):
+    client = make_app(tmp_path, tmp_path / 'missing' / 'replica.db').test_client()
+    assert client.get('/items').get_json() == []
+
+
+def test_replicas_need_a_shared_secret_key(tmp_path, replica_path):
+    with pytest.raises(RuntimeError):
+        make_app(tmp_path, replica_path, secret_key=None)
@@ -0,0 +1,58 @@
+"""/venues runs the same statements however many venues and shows there are."""
+import os
+import re
+
+import pytest
+from sqlalchemy import event
+
+from cache import LRUBackend
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+SIZES = (50, 500)  # venues; twice as many artists and ten times as many shows
+
+
+@pytest.fixture
+def seeded(database, monkeypatch):
+    import app
+    from seed import seed
+    monkeypatch.setattr(app.page_cache, 'backend', None)
+
+    def seed_venues(venues):
+        with database.app_context():
+            seed(venues, venues * 2, venues * 10, random_seed=1, reset=True, out=open(os.devnull, 'w'))
+        # the genre facet counts are cached across requests; each size starts cold
+        monkeypatch.setattr(app.genre_facets, 'cache', LRUBackend())
+    return seed_venues
+
+
+def count_statements(app, function):
+    from app import db
+    statements = []
+    with app.test_request_context('/venues'):
+        engine = db.engine
+        listener = lambda connection, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            function()
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+    return len(statements)
+
+
+def test_venue_areas_runs_one_query(database, seeded):
+    from app import venue_areas
+    counts = []
+    for venues in SIZES:
+        seeded(venues)
+        counts.append(count_statements(database, venue_areas))
+    assert counts == [1, 1]
+
+
+def test_venues_page_query_count_is_constant(database, seeded):
+    counts = []
+    for venues in SIZES:
+        seeded(venues)
+        response = database.test_client().get('/venues')
+        assert response.status_code == 200
+        counts.append(int(QUERIES.search(', '.join(response.headers.getlist('Server-Timing'))).group(1)))
+    assert counts[0] == counts[1]
@@ -0,0 +1,29 @@
+"""A write that committed is reported as made, whatever happens after the commit."""
+from uuid import uuid4
+
+import pytest
+
+
+@pytest.fixture
+def broken_suggestions(monkeypatch):
+    import app
+
+    def add(*args):
+        raise RuntimeError('suggestion index unavailable')
+    monkeypatch.setattr(app.suggestions, 'add', add)
+    # the migrations' logging.config.fileConfig disables the loggers that exist by then
+    monkeypatch.setattr(app.app.logger, 'disabled', False)
+
+
+def test_failed_follow_up_still_reports_the_venue_listed(database, broken_suggestions, caplog):
+    from app import Venue, db
+    name = f'Follow-up Hall {uuid4().hex[:8]}'
+    response = database.test_client().post('/venues/create', data={
+        'name': name, 'city': 'San Francisco', 'state': 'CA', 'address': '1 Main St',
+        'phone': '415-000-0000', 'genres': ['Jazz']})
+    assert f'{name} was successfully listed!'.encode() in response.data
+    assert 'a follow-up of a committed write failed' in caplog.text
+    with database.app_context():
+        venue = Venue.query.filter_by(name=name).one()
+        db.session.delete(venue)
+        db.session.commit()